@@ -1,15 +1,36 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 import logging
 import time
 import requests
 import json
 import traceback
-from bs4 import BeautifulSoup
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from modules.web_extractor.extractor import WebExtractor
 from modules.llm_processor.processor import LLMProcessor
+from modules.llm_processor.stream_parser import StreamingGraphParser, parse_graph, validate_graph
+from modules.llm_processor.chunker import TextChunker
+from modules.graph_generator.store import GraphStore
+from modules.web_extractor.crawler import Crawler
+from llm_client import OllamaClient
+from modules.cache.llm_cache import LLMCache, get_default_cache
+from modules.jobs.manager import JobManager
+from modules.ollama.transport import get_transport
+from modules.ollama.pool import OllamaPool
+import config
 from modules.graph_generator.generator import GraphGenerator
+from modules.graph_generator.compact import CompactGraph
+from modules.graph_generator.persistence import get_graph_repository
+from modules.llm_processor.parse_stats import OK, PARSE_FAILURE, VALIDATION_FAILURE, get_parse_stats
+from modules.web_extractor.page_cache import content_hash
+from modules.web_extractor.sections import pack_sections, split_section_result
+from modules.web_extractor.budget import token_budget
+from modules.metrics.registry import get_metrics, start_trace, finish_trace, server_timing
+from modules.chat.service import ChatService
+from modules.embeddings.client import EmbeddingClient
+from modules.embeddings.service import SemanticSearch
 
 # 配置日志
 logging.basicConfig(
@@ -19,17 +40,26 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__, static_folder='../frontend', static_url_path='')
-CORS(app)
+# 前端导出时从 Content-Disposition 读取文件名，跨域请求需要显式暴露该响应头
+CORS(app, expose_headers=['Content-Disposition'])
 
 # 初始化模块
+ollama_transport = get_transport()
 web_extractor = WebExtractor()
-llm_processor = LLMProcessor()
+llm_processor = LLMProcessor(transport=ollama_transport)
 graph_generator = GraphGenerator()
+graph_repository = get_graph_repository()
+parse_stats = get_parse_stats()
+chat_service = ChatService(graph_repository, graph_generator.store, ollama_transport, web_extractor.page_cache)
+embedding_client = EmbeddingClient(ollama_transport)
+semantic_search = SemanticSearch(embedding_client, chat_service)
 
 class LogHandler(logging.Handler):
-    def __init__(self):
+    """只保留最近的日志记录（环形缓冲区），内存占用固定"""
+
+    def __init__(self, capacity: int = 1000):
         super().__init__()
-        self.logs = []
+        self.logs = deque(maxlen=capacity)
 
     def emit(self, record):
         log_entry = {
@@ -39,16 +69,89 @@ class LogHandler(logging.Handler):
         }
         self.logs.append(log_entry)
 
-    def get_logs(self):
-        return self.logs
+    def get_logs(self, limit=None, level=None):
+        logs = list(self.logs)
+        if level:
+            logs = [log for log in logs if log['level'] == level.upper()]
+        return logs[-limit:] if limit else logs
 
     def clear(self):
-        self.logs = []
+        self.logs.clear()
 
 # 创建全局日志处理器
-log_handler = LogHandler()
+log_handler = LogHandler(config.LOG_BUFFER_SIZE)
 logger.addHandler(log_handler)
 
+metrics = get_metrics()
+http_duration = metrics.histogram('http_request_duration_seconds', 'HTTP request duration by endpoint')
+
+def collect_metrics():
+    """输出时读取缓存、解析和后台任务的已有统计"""
+    llm_cache = get_default_cache().stats()
+    pages = web_extractor.page_cache.stats()
+    embeddings = embedding_client.stats()
+    yield ('cache_lookups_total', 'counter', 'Cache lookups by result', [
+        ({'cache': 'llm', 'result': 'hit'}, llm_cache['hits']),
+        ({'cache': 'llm', 'result': 'miss'}, llm_cache['misses']),
+        ({'cache': 'page', 'result': 'not_modified'}, pages['not_modified']),
+        ({'cache': 'page', 'result': 'downloaded'}, pages['downloaded']),
+        ({'cache': 'embedding', 'result': 'hit'}, embeddings['hits']),
+        ({'cache': 'embedding', 'result': 'miss'}, embeddings['misses'])
+    ])
+    yield ('cache_hit_ratio', 'gauge', 'Cache hit ratio', [
+        ({'cache': 'llm'}, llm_cache['hit_rate']),
+        ({'cache': 'page'}, pages['not_modified_rate'])
+    ])
+    yield ('cache_entries', 'gauge', 'Entries in the LLM response cache', [({'cache': 'llm'}, llm_cache['entries'])])
+    models = parse_stats.snapshot()
+    yield ('llm_outputs_total', 'counter', 'LLM outputs by parse outcome', [
+        ({'model': model, 'outcome': outcome}, stats[outcome])
+        for model, stats in models.items() for outcome in (OK, PARSE_FAILURE, VALIDATION_FAILURE)
+    ])
+    yield ('llm_output_retries_total', 'counter', 'Regenerations after failed validation', [
+        ({'model': model}, stats['retries']) for model, stats in models.items()
+    ])
+    if isinstance(ollama_transport, OllamaPool):
+        backends = ollama_transport.stats()
+        yield ('ollama_backend_up', 'gauge', 'Whether the Ollama backend circuit is closed', [
+            ({'host': b['host']}, 0 if b['state'] == 'open' else 1) for b in backends
+        ])
+        yield ('ollama_backend_outstanding', 'gauge', 'In-flight requests per Ollama backend', [
+            ({'host': b['host']}, b['outstanding']) for b in backends
+        ])
+        yield ('ollama_backend_requests_total', 'counter', 'Requests routed to each Ollama backend', [
+            ({'host': b['host'], 'result': result}, value) for b in backends
+            for result, value in (('ok', b['requests'] - b['errors'] - b['outstanding']), ('error', b['errors']))
+        ])
+
+metrics.add_collector(collect_metrics)
+
+@app.before_request
+def begin_request_trace():
+    request.environ['graphrager.start'] = time.perf_counter()
+    request.environ['graphrager.trace'] = start_trace()
+
+@app.after_request
+def finish_request_trace(response):
+    """记录请求耗时，并通过 Server-Timing 响应头返回本次请求各阶段的耗时"""
+    start = request.environ.get('graphrager.start')
+    token = request.environ.pop('graphrager.trace', None)
+    if start is None or token is None:
+        return response
+    trace = finish_trace(token)
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.observe(http_duration, time.perf_counter() - start,
+                    endpoint=endpoint, method=request.method, status=response.status_code)
+    if trace:
+        response.headers['Server-Timing'] = server_timing(trace)
+    return response
+
+# Ollama不可用时返回的默认模型列表
+DEFAULT_MODELS = [
+    {'name': 'llama2'},
+    {'name': 'mistral'}
+]
+
 def error_response(message, status_code=400):
     return jsonify({"error": str(message)}), status_code
 
@@ -60,68 +163,73 @@ def index():
 def get_models():
     """获取可用的Ollama模型列表"""
     try:
-        # 首先尝试从Ollama API获取模型列表
-        response = requests.get('http://localhost:11434/api/tags')
-        if response.status_code == 200:
-            models_data = response.json()
-            # 确保返回的数据格式正确
-            if 'models' in models_data:
-                return jsonify(models_data)
-            else:
-                # 如果返回的数据格式不正确，构造正确的格式
-                models = [{'name': model['name']} for model in models_data.get('models', [])]
-                return jsonify({'models': models})
-        else:
-            logger.warning(f"Failed to fetch models from Ollama API: {response.status_code}")
-            # 如果无法从API获取，返回默认模型列表
-            default_models = [
-                {'name': 'llama2'},
-                {'name': 'mistral'}
-            ]
-            return jsonify({'models': default_models})
+        # 从共享传输层获取模型列表（短时缓存，不会每次都访问Ollama）
+        return jsonify({'models': ollama_transport.list_models()})
     except requests.exceptions.ConnectionError:
         logger.warning("Could not connect to Ollama API, using default models")
         # 连接失败时返回默认模型列表
-        default_models = [
-            {'name': 'llama2'},
-            {'name': 'mistral'}
-        ]
-        return jsonify({'models': default_models})
+        return jsonify({'models': DEFAULT_MODELS})
     except Exception as e:
         return error_response(f"获取模型列表失败: {str(e)}")
 
-def extract_content(url):
-    """从URL中提取文本内容"""
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    """获取LLM响应缓存、网页缓存和图谱库的统计"""
+    stats = get_default_cache().stats()
+    stats['pages'] = web_extractor.page_cache.stats()
+    stats['graphs'] = graph_repository.stats()
+    return jsonify(stats)
+
+@app.route('/api/backends', methods=['GET'])
+def backend_status():
+    """各Ollama服务的状态：熔断状态、提供和已加载的模型、进行中的请求数"""
+    if isinstance(ollama_transport, OllamaPool):
+        return jsonify({'backends': ollama_transport.stats()})
+    return jsonify({'backends': [{
+        'host': ollama_transport.host,
+        'state': 'closed' if ollama_transport.is_available() else 'open'
+    }]})
+
+@app.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus文本格式的指标：各阶段耗时直方图、请求耗时、token数、缓存命中率和解析失败数"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/logs', methods=['GET'])
+def recent_logs():
+    """最近的日志记录，可按级别过滤"""
+    limit = request.args.get('limit', type=int)
+    return jsonify({'logs': log_handler.get_logs(limit, request.args.get('level'))})
+
+@app.route('/api/stats/parse', methods=['GET'])
+def parse_stats_view():
+    """各模型输出的解析失败率和重试统计"""
+    return jsonify({'models': parse_stats.snapshot(request.args.get('model'))})
+
+def request_token_budget(data):
+    """请求中的 token_budget（0表示不裁剪），未指定时使用所选模型的内容预算"""
+    if data.get('token_budget') is not None:
+        return max(0, int(data['token_budget']))
+    return token_budget(data.get('model'))
+
+def page_content(page, budget=0):
+    """检查内容类型并提取页面全部文本，budget 大于0时只保留预算内价值最高的文本块"""
+    content_type = (page.get('content_type') or '').lower()
+    if 'text/html' not in content_type:
+        raise ValueError(f"不支持的内容类型: {content_type}")
+
+    result = web_extractor.budget_content(page, budget) if budget else None
+    # 全是链接、过短的页面没有可保留的文本块，保留原文
+    if not result or not result['content']:
+        result = web_extractor.page_text(page, mode='full')
+    result['not_modified'] = page['not_modified']
+    return result
+
+def extract_page_content(url, budget=0):
+    """从URL中提取文本内容，返回文本、文本哈希以及是否与上次提取结果不同"""
     try:
-        # 添加用户代理头，避免被拒绝访问
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()  # 检查HTTP响应状态
-        
-        # 检查内容类型
-        content_type = response.headers.get('content-type', '').lower()
-        if 'text/html' not in content_type:
-            raise ValueError(f"不支持的内容类型: {content_type}")
-        
-        # 使用Beautiful Soup解析HTML
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # 移除脚本和样式元素
-        for script in soup(['script', 'style']):
-            script.decompose()
-        
-        # 提取所有文本内容
-        text = soup.get_text()
-        
-        # 清理文本
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = ' '.join(chunk for chunk in chunks if chunk)
-        
-        return text
-        
+        # 通过网页缓存做条件请求，页面未变化时服务器返回304
+        return page_content(web_extractor.fetch_page(url), budget)
     except requests.exceptions.RequestException as e:
         logger.error(f"请求URL失败: {str(e)}")
         raise ValueError(f"无法访问URL: {str(e)}")
@@ -129,6 +237,10 @@ def extract_content(url):
         logger.error(f"提取内容时出错: {str(e)}")
         raise ValueError(f"提取内容失败: {str(e)}")
 
+def extract_content(url):
+    """从URL中提取文本内容"""
+    return extract_page_content(url)['content']
+
 @app.route('/api/extract', methods=['POST'])
 def extract():
     """提取网页内容"""
@@ -138,66 +250,713 @@ def extract():
             return error_response("Missing URL parameter")
 
         url = data['url']
-        # 调用提取器并获取结果
-        result = extract_content(url)
+        # 调用提取器并获取结果，按模型的token预算裁剪
+        result = extract_page_content(url, request_token_budget(data))
         
         # 检查提取状态
-        if not result:
+        if not result['content']:
             return error_response("No content extracted")
             
-        return jsonify({'content': result})
+        return jsonify(result)
     except ValueError as e:
         return error_response(str(e))
     except Exception as e:
         return error_response(f"内容提取失败: {str(e)}")
 
+def check_ollama_service():
+    """检查Ollama服务状态，异常时返回错误响应，正常时返回None"""
+    if not ollama_transport.is_available():
+        return error_response("Could not connect to Ollama service. Please ensure it is running.")
+    return None
+
+def structure_request_error(data):
+    """校验结构化请求参数，返回错误信息，参数有效时返回None"""
+    if not data:
+        return "Missing request data"
+
+    required_fields = ['model', 'prompt', 'content']
+    missing_fields = [field for field in required_fields if field not in data]
+    if missing_fields:
+        return f"Missing required fields: {', '.join(missing_fields)}"
+
+    if not data.get('content'):
+        return 'Content is required'
+    if not data.get('model'):
+        return 'Model is required'
+    output_format = data.get('format')
+    if output_format is not None and output_format != 'json' and not isinstance(output_format, dict):
+        return 'format must be "json" or a JSON schema object'
+    return None
+
+def validate_structure_request(data):
+    """校验结构化请求参数，返回 (model, prompt, content, error_response)"""
+    error = structure_request_error(data)
+    if error:
+        return None, None, None, error_response(error)
+    return data['model'], data['prompt'], data['content'], None
+
+def structure_content_hash(model, prompt, content, output_format=None):
+    if output_format:
+        prompt = f"{prompt}\n{json.dumps(output_format, sort_keys=True, ensure_ascii=False)}"
+    return content_hash(f"{model}\n{prompt}\n{content}")
+
+def record_structure_outcome(model, graph):
+    """按模型记录结构化输出能否解析出有效图谱"""
+    try:
+        outcome = VALIDATION_FAILURE if validate_graph(graph).get('dropped') else OK
+    except ValueError:
+        outcome = PARSE_FAILURE
+    if outcome == OK and not any(isinstance(v, list) and v for v in graph.values()):
+        outcome = PARSE_FAILURE
+    parse_stats.record(model, outcome)
+
+def find_stored_structure(data, model, prompt, content):
+    """查找相同模型、提示词和内容已保存的图谱，refresh 为真时跳过"""
+    if data.get('refresh'):
+        return None
+    meta = graph_repository.find(content_hash=structure_content_hash(model, prompt, content, data.get('format')),
+                                 model=model)
+    if meta is None:
+        return None
+    raw = graph_repository.load_raw(meta['graph_id'], meta['version'])
+    if raw is None:
+        return None
+    logger.info(f"Reusing stored graph {meta['graph_id']} v{meta['version']}")
+    return {'result': raw, 'raw_output': raw, 'graph': parse_graph(raw),
+            'graph_id': meta['graph_id'], 'version': meta['version'], 'cached': True}
+
+def save_structure_graph(data, model, prompt, content, result, graph=None, fresh=True):
+    """解析LLM输出并保存图谱，返回 graph_id 和版本号；没有解析出实体时不保存
+
+    fresh 为真表示结果是新生成的，同时计入解析统计。
+    """
+    try:
+        graph = graph if graph is not None else parse_graph(result)
+        if fresh:
+            record_structure_outcome(model, graph)
+        compact = CompactGraph.from_entities(graph)
+        if compact.node_count == 0:
+            return {}
+        meta = graph_repository.save(
+            compact,
+            url=data.get('url') or None,
+            content_hash=structure_content_hash(model, prompt, content, data.get('format')),
+            model=model,
+            raw=result
+        )
+        return {'graph_id': meta['graph_id'], 'version': meta['version']}
+    except Exception as e:
+        logger.error(f"Failed to save graph: {str(e)}")
+        return {}
+
+def ndjson(event):
+    return json.dumps(event, ensure_ascii=False) + '\n'
+
+class StructureStream:
+    """流式结构化输出的NDJSON事件：token、闭合的实体/关系、done 和 error
+
+    Flask 和 ASGI 入口共用，入口只负责同步或异步地读取模型输出并保存图谱。
+    """
+
+    def __init__(self):
+        self.parser = StreamingGraphParser()
+        self.parts = []
+        self.start_time = time.time()
+        self.first_entity_time = None
+        self.usage = None
+
+    def feed(self, chunk):
+        """处理一块模型输出，返回要推送的事件行"""
+        self.usage = chunk.get('usage', self.usage)
+        token = chunk.get('response', '')
+        if not token:
+            return []
+        self.parts.append(token)
+        lines = [ndjson({'type': 'token', 'content': token})]
+        for kind, obj in self.parser.feed(token):
+            if self.first_entity_time is None:
+                self.first_entity_time = time.time() - self.start_time
+            lines.append(ndjson({'type': kind, 'data': obj}))
+        return lines
+
+    @property
+    def result(self):
+        return ''.join(self.parts).strip()
+
+    def graph(self):
+        return self.parser.result()
+
+    def done(self, saved):
+        """saved 为已保存图谱的 graph_id 和版本号（或复用的已保存结果）"""
+        logger.info(f"Streamed content from LLM in {time.time() - self.start_time:.2f} seconds")
+        return ndjson({
+            'type': 'done',
+            'result': self.result,
+            'raw_output': self.result,
+            'graph': self.graph(),
+            **saved,
+            'stats': {
+                'total_time': time.time() - self.start_time,
+                'first_entity_time': self.first_entity_time,
+                'usage': self.usage
+            }
+        })
+
+    @staticmethod
+    def error(e):
+        logger.error(f"Structure streaming error: {str(e)}")
+        return ndjson({'type': 'error', 'error': f"结构化处理失败: {str(e)}"})
+
 @app.route('/api/structure', methods=['POST'])
 def structure():
     """生成结构化内容"""
     try:
         data = request.get_json()
-        if not data:
-            return error_response("Missing request data")
-            
-        required_fields = ['model', 'prompt', 'content']
-        missing_fields = [field for field in required_fields if field not in data]
-        if missing_fields:
-            return error_response(f"Missing required fields: {', '.join(missing_fields)}")
-
-        content = data.get('content')
-        prompt = data.get('prompt')
-        model = data.get('model')
-
-        if not content:
-            return error_response('Content is required')
-        if not model:
-            return error_response('Model is required')
+        model, prompt, content, validation_error = validate_structure_request(data)
+        if validation_error:
+            return validation_error
 
         logger.info(f"Processing content with model: {model}")
         logger.debug(f"Content length: {len(content)}")
         logger.debug(f"Prompt length: {len(prompt) if prompt else 0}")
         
         # 确保Ollama服务正在运行
-        try:
-            response = requests.get('http://localhost:11434/api/tags')
-            if response.status_code != 200:
-                return error_response("Ollama service is not responding properly")
-        except requests.exceptions.ConnectionError:
-            return error_response("Could not connect to Ollama service. Please ensure it is running.")
+        service_error = check_ollama_service()
+        if service_error:
+            return service_error
             
-        # 处理内容
-        result = llm_processor.process(model, prompt, content)
+        # 相同模型处理过相同内容时直接返回已保存的图谱
+        stored = find_stored_structure(data, model, prompt, content)
+        if stored:
+            return jsonify(stored)
+
+        # 处理内容，长文本可选择分片并发处理
+        if data.get('chunked'):
+            chunk_tokens = int(data.get('chunk_tokens', 1500))
+            chunker = TextChunker(max_tokens=chunk_tokens, overlap_tokens=chunk_tokens // 10)
+            result = llm_processor.process_chunked(
+                model, prompt, content,
+                chunker=chunker,
+                max_workers=int(data.get('max_workers', config.CHUNK_WORKERS)),
+                format=data.get('format')
+            )
+        else:
+            result = llm_processor.process(model, prompt, content, data.get('format'))
         
         # 记录生成结果
         logger.info(f"Generated content from LLM")
         
-        # 返回原始结果，不进行JSON解析
-        return jsonify({'result': result, 'raw_output': result})
+        # 返回原始结果和容错解析出的图谱，图谱同时保存，可通过 graph_id 再次获取
+        graph = parse_graph(result)
+        return jsonify({'result': result, 'raw_output': result, 'graph': graph,
+                        **save_structure_graph(data, model, prompt, content, result, graph)})
         
     except Exception as e:
         logger.error(f"Structure generation error: {str(e)}")
         traceback.print_exc()  # 打印详细错误信息到控制台
         return error_response(f"结构化处理失败: {str(e)}")
 
+@app.route('/api/structure/stream', methods=['POST'])
+def structure_stream():
+    """流式生成结构化内容（NDJSON），实体和关系在闭合时立即推送"""
+    data = request.get_json(silent=True)
+    model, prompt, content, validation_error = validate_structure_request(data)
+    if validation_error:
+        return validation_error
+
+    service_error = check_ollama_service()
+    if service_error:
+        return service_error
+
+    logger.info(f"Streaming content with model: {model}")
+
+    stored = find_stored_structure(data, model, prompt, content)
+
+    def generate():
+        stream = StructureStream()
+        try:
+            chunks = ([{'response': stored['result']}] if stored
+                      else llm_processor.process_stream(model, prompt, content, data.get('format')))
+            for chunk in chunks:
+                yield from stream.feed(chunk)
+            yield stream.done(stored or save_structure_graph(data, model, prompt, content, stream.result,
+                                                             stream.graph()))
+        except Exception as e:
+            yield stream.error(e)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def run_graph_job(job, progress):
+    """后台任务：提取网页内容并调用LLM生成结构化结果"""
+    progress('extracting', 0.1)
+    params = job.get('params') or {}
+    budget = params.get('token_budget')
+    page = extract_page_content(job['url'], token_budget(job['model']) if budget is None else budget)
+    content = page['content']
+
+    # 文本哈希相同且已有结果时跳过LLM处理
+    result_key = LLMCache.make_key(job['model'], job['prompt'], options=params)
+    result = web_extractor.page_cache.get_result(page['content_hash'], result_key)
+    if result is not None:
+        return {'content': content, 'result': result, 'raw_output': result, 'cached': True,
+                **save_structure_graph({'url': job['url']}, job['model'], job['prompt'], content, result,
+                                       fresh=False)}
+
+    progress('generating', 0.3)
+    if params.get('chunked'):
+        result = llm_processor.process_chunked(job['model'], job['prompt'], content,
+                                               max_workers=config.CHUNK_WORKERS)
+    else:
+        result = llm_processor.process(job['model'], job['prompt'], content)
+    web_extractor.page_cache.set_result(page['content_hash'], result_key, result)
+
+    return {'content': content, 'result': result, 'raw_output': result, 'cached': False,
+            **save_structure_graph({'url': job['url']}, job['model'], job['prompt'], content, result)}
+
+# 后台任务队列，同一模型同时只处理有限数量的请求
+job_manager = JobManager(run_graph_job, max_workers=config.JOB_WORKERS,
+                         default_model_limit=config.JOB_MODEL_CONCURRENCY)
+job_manager.start()
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """提交图谱生成任务，立即返回任务ID"""
+    data = request.get_json(silent=True)
+    if not data:
+        return error_response("Missing request data")
+
+    missing_fields = [field for field in ['url', 'model', 'prompt'] if not data.get(field)]
+    if missing_fields:
+        return error_response(f"Missing required fields: {', '.join(missing_fields)}")
+
+    try:
+        budget = request_token_budget(data)
+    except (TypeError, ValueError):
+        return error_response("token_budget must be an integer")
+    job_id = job_manager.submit(
+        data['url'], data['model'], data['prompt'],
+        chunked=bool(data.get('chunked')),
+        token_budget=budget
+    )
+    logger.info(f"Queued job {job_id} for {data['url']}")
+    return jsonify({'job_id': job_id, 'status': 'pending'}), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询任务状态、进度和结果"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return error_response("Job not found", 404)
+    return jsonify(job)
+
+def extract_document_graph(client, document):
+    """对抓取到的单个文档按段落分组抽取实体和关系，并记录实体来源URL
+
+    返回 (分组哈希 -> 抽取结果, URL, 本次重新抽取的分组数)。各分组的结果按分组文本的哈希缓存，
+    页面更新后只有新增或变化的分组需要重新抽取；相邻的待抽取分组按分片大小打包进同一次调用，
+    结果再拆回各分组。页面类型和实体在同一次调用中返回。
+    """
+    result_key = f"fused:{client.model}"
+    sections = document.get('sections') or [{'hash': document['content_hash'], 'text': document['content']}]
+    results = {}
+    texts = []
+    for section in sections:
+        text = None
+        if section['hash'] not in results:
+            results[section['hash']] = web_extractor.page_cache.get_result(section['hash'], result_key)
+            if results[section['hash']] is None:
+                text = section['text']
+        texts.append(text)
+
+    def extract_batch(batch):
+        batch_texts = [texts[index] for index in batch]
+        return split_section_result(client.analyze_and_extract(' '.join(batch_texts)), batch_texts)
+
+    batches = pack_sections(texts, client.chunker.max_tokens)
+    if batches:
+        with ThreadPoolExecutor(max_workers=min(config.CHUNK_WORKERS, len(batches))) as executor:
+            for batch, parts in zip(batches, executor.map(extract_batch, batches)):
+                for index, result in zip(batch, parts):
+                    section_hash = sections[index]['hash']
+                    if 'error' not in result:
+                        web_extractor.page_cache.set_result(section_hash, result_key, result)
+                    results[section_hash] = result
+
+    for result in results.values():
+        for entity in result.get('entities', []):
+            entity.setdefault('url', document['url'])
+    return results, document['url'], sum(len(batch) for batch in batches)
+
+def merge_document_sections(store, url, results):
+    """用文档最新的各分组结果替换图谱中该URL的内容；抽取失败的分组保留上次合并的结果"""
+    failed = {section for section, result in results.items() if 'error' in result}
+    sections = {section: result for section, result in results.items() if section not in failed}
+    return store.replace_source(url, sections, keep=failed)
+
+@app.route('/api/entities/batch', methods=['POST'])
+def entities_batch():
+    """批量抽取多篇短文档（如新闻列表中的条目），多篇文档合并到同一个LLM请求中"""
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('documents'), list) or not data['documents']:
+        return error_response("Missing documents parameter")
+
+    documents = [doc if isinstance(doc, dict) else {'content': doc} for doc in data['documents']]
+    if any(not isinstance(doc.get('content'), str) or not doc['content'] for doc in documents):
+        return error_response("Each document must have non-empty content")
+    try:
+        max_tokens = int(data['max_tokens']) if data.get('max_tokens') else None
+    except (TypeError, ValueError) as e:
+        return error_response(f"Invalid parameter: {str(e)}")
+
+    service_error = check_ollama_service()
+    if service_error:
+        return service_error
+
+    start_time = time.time()
+    client = OllamaClient(model=data.get('model', 'llama3:latest'), transport=ollama_transport)
+    try:
+        results = client.extract_batch([doc['content'] for doc in documents], max_tokens)
+    except Exception as e:
+        logger.error(f"Batch extraction error: {str(e)}")
+        return error_response(f"批量抽取失败: {str(e)}", 500)
+
+    for doc, result in zip(documents, results):
+        if doc.get('url'):
+            result['url'] = doc['url']
+            for entity in result.get('entities', []):
+                entity.setdefault('url', doc['url'])
+    return jsonify({
+        'results': results,
+        'usage': client.usage.snapshot(),
+        'processing_time': round(time.time() - start_time, 3)
+    })
+
+@app.route('/api/generate', methods=['POST'])
+def generate():
+    """从URL生成知识图谱，depth大于0时并发抓取站内链接，文档抓取完成即送入LLM处理"""
+    data = request.get_json(silent=True)
+    if not data or not data.get('url'):
+        return error_response("Missing URL parameter")
+
+    try:
+        seeds = data['url'] if isinstance(data['url'], list) else [data['url']]
+        depth = int(data.get('depth', 1))
+        max_nodes = int(data.get('max_nodes', 50))
+        max_pages = int(data.get('max_pages', config.CRAWL_MAX_PAGES))
+    except (TypeError, ValueError) as e:
+        return error_response(f"Invalid parameter: {str(e)}")
+
+    start_time = time.time()
+    crawler = Crawler(
+        web_extractor,
+        max_concurrency=config.CRAWL_CONCURRENCY,
+        per_host_interval=config.CRAWL_HOST_INTERVAL,
+        max_pages=max_pages
+    )
+    client = OllamaClient(model=data.get('model', 'llama3:latest'), transport=ollama_transport)
+
+    futures = []
+    page_hashes = []
+    failed_pages = 0
+    try:
+        with ThreadPoolExecutor(max_workers=config.CHUNK_WORKERS) as llm_executor:
+            # 抓取第一个页面的同时加载模型，页面到达时模型已就绪
+            llm_executor.submit(ollama_transport.preload, client.model)
+            for document in crawler.crawl(seeds, depth):
+                if document['status'] != 'success' or not document['content']:
+                    failed_pages += 1
+                    continue
+                page_hashes.append(f"{document['url']}:{document['content_hash']}")
+                futures.append(llm_executor.submit(extract_document_graph, client, document))
+            crawl_time = time.time() - start_time
+            graphs = [future.result() for future in futures]
+    except Exception as e:
+        logger.error(f"Graph generation error: {str(e)}")
+        return error_response(f"图谱生成失败: {str(e)}", 500)
+
+    # 按名称和别名合并各页面的实体，可选择同时累积到会话图谱；
+    # 会话图谱中已有该页面时只合并新增的分组，并撤回页面中已删除部分的实体和关系
+    store = GraphStore()
+    section_stats = {'section_count': 0, 'sections_extracted': 0, 'retracted_nodes': 0, 'retracted_edges': 0}
+    for results, url, extracted in graphs:
+        merge_document_sections(store, url, results)
+        section_stats['section_count'] += len(results)
+        section_stats['sections_extracted'] += extracted
+        if data.get('accumulate'):
+            replaced = merge_document_sections(graph_generator.store, url, results)
+            section_stats['retracted_nodes'] += replaced['retracted_nodes']
+            section_stats['retracted_edges'] += replaced['retracted_edges']
+    compact = graph_generator.build_graph(store.to_graph(), max_nodes)
+    graph_generator.layout_compact(compact)
+
+    # 保存为新版本；各页面内容均未变化时沿用已有版本
+    meta = {}
+    try:
+        meta = graph_repository.save(
+            compact,
+            url=' '.join(seeds),
+            content_hash=content_hash('\n'.join(sorted(page_hashes)) + f"\n{depth}:{max_nodes}"),
+            model=client.model
+        )
+    except Exception as e:
+        logger.error(f"Failed to save graph: {str(e)}")
+    graph = graph_generator.to_payload(compact)
+
+    return jsonify({
+        'nodes': graph['nodes'],
+        'edges': graph['edges'],
+        'layout': graph.get('layout'),
+        'graph_id': meta.get('graph_id'),
+        'version': meta.get('version'),
+        'stats': {
+            'node_count': len(graph['nodes']),
+            'edge_count': len(graph['edges']),
+            'page_count': len(futures),
+            'failed_pages': failed_pages,
+            **section_stats,
+            'crawl_time': crawl_time,
+            'total_time': time.time() - start_time,
+            'usage': client.usage.snapshot()
+        }
+    })
+
+def chat_request_error(data):
+    """校验对话请求参数，返回错误信息，参数有效时返回None"""
+    if not data or not isinstance(data.get('message'), str) or not data['message'].strip():
+        return "Missing message"
+    if data.get('context') is not None and not isinstance(data['context'], list):
+        return "context must be a list of {role, content} messages"
+    return None
+
+def chat_stats(payload, start_time, retrieval_time, usage):
+    return {'retrieval_time': retrieval_time, 'total_time': time.time() - start_time,
+            'prompt_chars': len(payload['system']) + len(payload['prompt']), 'usage': usage}
+
+class ChatStream:
+    """流式对话的NDJSON事件：references、token、done 和 error，Flask 和 ASGI 入口共用"""
+
+    def __init__(self, payload, references, start_time, retrieval_time):
+        self.payload = payload
+        self.references = references
+        self.start_time = start_time
+        self.retrieval_time = retrieval_time
+        self.parts = []
+        self.usage = None
+
+    def begin(self):
+        return ndjson({'type': 'references', 'data': self.references})
+
+    def feed(self, chunk):
+        self.usage = chunk.get('usage', self.usage)
+        token = chunk.get('response', '')
+        if not token:
+            return []
+        self.parts.append(token)
+        return [ndjson({'type': 'token', 'content': token})]
+
+    def done(self):
+        return ndjson({
+            'type': 'done',
+            'response': ''.join(self.parts).strip(),
+            'references': self.references,
+            'stats': chat_stats(self.payload, self.start_time, self.retrieval_time, self.usage)
+        })
+
+    @staticmethod
+    def error(e):
+        logger.error(f"Chat streaming error: {str(e)}")
+        return ndjson({'type': 'error', 'error': f"对话失败: {str(e)}"})
+
+@app.route('/api/chat', methods=['POST'])
+def chat():
+    """基于图谱的对话：检索相关实体、关系和原文片段作为资料回答问题，stream 为真时以NDJSON流式返回"""
+    data = request.get_json(silent=True)
+    error = chat_request_error(data)
+    if error:
+        return error_response(error)
+    service_error = check_ollama_service()
+    if service_error:
+        return service_error
+
+    model = data.get('model') or llm_processor.default_model
+    start_time = time.time()
+    try:
+        payload, references = chat_service.prepare(model, data['message'], data.get('graph_id'), data.get('context'))
+    except KeyError:
+        return error_response(f"Graph not found: {data.get('graph_id')}", 404)
+    retrieval_time = time.time() - start_time
+
+    if not data.get('stream'):
+        try:
+            answer, usage = chat_service.answer(payload)
+        except Exception as e:
+            return error_response(f"对话失败: {str(e)}")
+        return jsonify({'response': answer, 'references': references,
+                        'stats': chat_stats(payload, start_time, retrieval_time, usage)})
+
+    def generate():
+        stream = ChatStream(payload, references, start_time, retrieval_time)
+        try:
+            yield stream.begin()
+            for chunk in chat_service.answer_stream(payload):
+                yield from stream.feed(chunk)
+            yield stream.done()
+        except Exception as e:
+            yield stream.error(e)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/graph', methods=['GET'])
+def get_merged_graph():
+    """获取会话中累积的图谱"""
+    max_nodes = request.args.get('max_nodes', type=int)
+    graph = graph_generator.get_merged_graph(max_nodes)
+    return jsonify({**graph, 'stats': graph_generator.store.stats()})
+
+@app.route('/api/graph/merge', methods=['POST'])
+def merge_graph():
+    """将一个图谱（entities/relationships 或 nodes/edges）增量合并到会话图谱"""
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('graph'), dict):
+        return error_response("Missing graph parameter")
+
+    id_map = graph_generator.merge_graph(data['graph'], data.get('source'))
+    return jsonify({'id_map': id_map, 'stats': graph_generator.store.stats()})
+
+@app.route('/api/graph/dedupe', methods=['POST'])
+def dedupe_graph():
+    """用实体名称的向量合并会话图谱中的近似重复实体（同类型、相似度不低于阈值）"""
+    data = request.get_json(silent=True) or {}
+    if not embedding_client.available():
+        return error_response("numpy is required for embeddings", 501)
+    threshold = data.get('threshold')
+    if threshold is not None and not isinstance(threshold, (int, float)):
+        return error_response("threshold must be a number")
+    try:
+        merges = semantic_search.dedupe(graph_generator.store, threshold, data.get('model'), bool(data.get('dry_run')))
+    except Exception as e:
+        logger.error(f"Entity dedup error: {str(e)}")
+        return error_response(f"实体去重失败: {str(e)}")
+    return jsonify({'merges': merges, 'stats': graph_generator.store.stats()})
+
+@app.route('/api/graph/related', methods=['POST'])
+def related_entities():
+    """按问题文本（query）或已有节点（node_id）查找语义相近的实体，graph_id 缺省时使用会话图谱"""
+    data = request.get_json(silent=True) or {}
+    if not embedding_client.available():
+        return error_response("numpy is required for embeddings", 501)
+    query, node_id = data.get('query'), data.get('node_id')
+    if not (isinstance(query, str) and query.strip()) and node_id is None:
+        return error_response("Missing query or node_id")
+    try:
+        results = semantic_search.related(data.get('graph_id'), query, node_id,
+                                          int(data.get('k', 10)), data.get('model'))
+    except KeyError as e:
+        return error_response(f"Not found: {e.args[0]}", 404)
+    except Exception as e:
+        logger.error(f"Semantic search error: {str(e)}")
+        return error_response(f"语义检索失败: {str(e)}")
+    return jsonify({'results': results})
+
+@app.route('/api/graph', methods=['DELETE'])
+def clear_merged_graph():
+    """清空会话图谱"""
+    graph_generator.store.clear()
+    graph_generator.clear_positions()
+    return jsonify({'status': 'success'})
+
+@app.route('/api/graphs', methods=['GET'])
+def find_stored_graph():
+    """按来源URL或内容哈希查找已保存图谱的最新版本"""
+    meta = graph_repository.find(
+        url=request.args.get('url'),
+        content_hash=request.args.get('content_hash'),
+        model=request.args.get('model')
+    )
+    if meta is None:
+        return error_response("Graph not found", 404)
+    return jsonify(meta)
+
+@app.route('/api/graphs/<graph_id>', methods=['GET'])
+def get_stored_graph(graph_id):
+    """获取已保存的图谱（前端格式），version 缺省时为最新版本"""
+    version = request.args.get('version', type=int)
+    meta = graph_repository.get_meta(graph_id, version)
+    if meta is None:
+        return error_response("Graph not found", 404)
+    graph = graph_repository.load(graph_id, meta['version'])
+    return jsonify({**graph_generator.to_payload(graph), **meta})
+
+@app.route('/api/graphs/<graph_id>/versions', methods=['GET'])
+def list_graph_versions(graph_id):
+    """列出图谱的所有版本"""
+    versions = graph_repository.versions(graph_id)
+    if not versions:
+        return error_response("Graph not found", 404)
+    return jsonify({'graph_id': graph_id, 'versions': versions})
+
+@app.route('/api/analysis/<graph_id>', methods=['GET'])
+def analyze_stored_graph(graph_id):
+    """获取已保存图谱的分析结果"""
+    version = request.args.get('version', type=int)
+    meta = graph_repository.get_meta(graph_id, version)
+    if meta is None:
+        return error_response("Graph not found", 404)
+    graph = graph_repository.load(graph_id, meta['version'])
+    return jsonify({**graph_generator.analyze_graph(graph), 'graph_id': graph_id, 'version': meta['version']})
+
+@app.route('/api/export', methods=['GET', 'POST'])
+def export_graph():
+    """流式导出图谱，未提供 data 时导出会话图谱"""
+    params = request.args.to_dict()
+    if request.method == 'POST':
+        params.update(request.get_json(silent=True) or {})
+    export_format = params.get('format', 'json')
+    graph_data = params.get('data')
+    if graph_data is not None and not isinstance(graph_data, dict):
+        return error_response("Invalid data parameter")
+
+    try:
+        if params.get('graph_id'):
+            graph_data = graph_repository.load(params['graph_id'])
+            if graph_data is None:
+                return error_response("Graph not found", 404)
+        graph = graph_data if graph_data is not None else graph_generator.get_merged_compact()
+        chunks, mimetype, extension = graph_generator.stream_export(
+            graph, export_format, table=params.get('table', 'nodes')
+        )
+    except (ValueError, TypeError) as e:
+        return error_response(str(e))
+
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="knowledge-graph.{extension}"'
+    })
+
+@app.route('/api/layout', methods=['POST'])
+def layout_graph():
+    """为前端传入的 nodes/edges 计算布局坐标，positions 中已有坐标的节点作为热启动"""
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('nodes'), list):
+        return error_response("Missing nodes parameter")
+
+    edges = [{
+        'from': edge.get('from', edge.get('source')),
+        'to': edge.get('to', edge.get('target'))
+    } for edge in data.get('edges', []) if isinstance(edge, dict)]
+    nodes = [node for node in data['nodes'] if isinstance(node, dict) and node.get('id') is not None]
+    warm_start = {
+        node['id']: (node['x'], node['y']) for node in nodes
+        if isinstance(node.get('x'), (int, float)) and isinstance(node.get('y'), (int, float))
+    }
+
+    graph = graph_generator.apply_layout({'nodes': nodes, 'edges': edges}, warm_start)
+    if 'layout' not in graph:
+        return error_response("Server-side layout is unavailable", 503)
+    return jsonify({
+        'positions': {node['id']: {'x': node['x'], 'y': node['y']} for node in graph['nodes']},
+        'layout': graph['layout']
+    })
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    # 开发服务器；生产环境使用 python asgi.py
+    app.run(debug=config.FLASK_DEBUG, host=config.SERVER_HOST, port=config.SERVER_PORT)
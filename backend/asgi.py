@@ -0,0 +1,389 @@
+"""生产环境的ASGI入口
+
+用法（在 backend 目录下）：
+    python asgi.py
+    uvicorn asgi:app --workers 4 --timeout-graceful-shutdown 30
+
+访问Ollama和网页的接口（/api/models、/api/extract、/api/structure、/api/structure/stream、/api/chat）
+由异步处理函数直接处理，等待Ollama时不占用线程；其余接口通过 WsgiToAsgi 交给 Flask 应用。
+客户端断开连接时取消对应的处理任务，进行中的Ollama请求随之中断。
+"""
+import json
+import time
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+try:
+    import httpx
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError as e:
+    raise ImportError(f"The ASGI server requires httpx and asgiref: pip install httpx asgiref uvicorn ({e})")
+
+import config
+import app as wsgi
+from modules.llm_processor.chunker import TextChunker
+from modules.llm_processor.stream_parser import parse_graph
+from modules.metrics.registry import current_trace, finish_trace, server_timing, start_trace
+from modules.ollama.async_transport import AsyncOllamaTransport, create_async_transport
+from modules.web_extractor.extractor import detect_encoding
+
+logger = logging.getLogger(__name__)
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+class JSONResponse:
+    def __init__(self, data: Any, status: int = 200):
+        self.status = status
+        self.body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+class StreamResponse:
+    """NDJSON流式响应，lines 为逐行产出的异步迭代器"""
+
+    def __init__(self, lines: AsyncIterator[str], mimetype: str = 'application/x-ndjson'):
+        self.status = 200
+        self.lines = lines
+        self.mimetype = mimetype
+
+
+def error_response(message: str, status: int = 400) -> JSONResponse:
+    return JSONResponse({'error': str(message)}, status)
+
+
+class Request:
+    def __init__(self, scope: Dict[str, Any], body: bytes):
+        self.scope = scope
+        self.method = scope['method']
+        self.path = scope['path']
+        self.body = body
+
+    def json(self) -> Optional[Dict[str, Any]]:
+        """解析请求体，格式错误时返回None"""
+        try:
+            data = json.loads(self.body or b'null')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+
+class GraphragerASGI:
+    """异步处理I/O密集的接口，其余请求交给Flask
+
+    httpx客户端与事件循环绑定，在 lifespan 启动时创建、停止时关闭。
+    """
+
+    def __init__(self, flask_app, graceful_timeout: float = None):
+        self.fallback = WsgiToAsgi(flask_app)
+        self.graceful_timeout = graceful_timeout if graceful_timeout is not None else config.GRACEFUL_TIMEOUT
+        self.routes: Dict[Tuple[str, str], Callable[[Request], Awaitable[Any]]] = {
+            ('GET', '/api/models'): self.models,
+            ('POST', '/api/extract'): self.extract,
+            ('POST', '/api/structure'): self.structure,
+            ('POST', '/api/structure/stream'): self.structure_stream,
+            ('POST', '/api/chat'): self.chat
+        }
+        self.ollama: Optional[AsyncOllamaTransport] = None
+        self.http: Optional['httpx.AsyncClient'] = None
+        self.inflight: set = set()
+        self.cancelled = wsgi.metrics.counter('http_requests_cancelled_total',
+                                              'Requests cancelled because the client disconnected')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        handler = self.routes.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+        if handler is None:
+            await self.fallback(scope, receive, send)
+            return
+        task = asyncio.current_task()
+        self.inflight.add(task)
+        try:
+            await self.handle(handler, scope, receive, send)
+        finally:
+            self.inflight.discard(task)
+
+    async def startup(self) -> None:
+        if self.ollama is None:
+            self.ollama = create_async_transport()
+        if self.http is None:
+            # 与 WebExtractor 的 requests.Session 一致：跟随重定向，未声明编码时按内容推断
+            self.http = httpx.AsyncClient(follow_redirects=True, default_encoding=detect_encoding)
+        logger.info(f"ASGI worker started, Ollama at {self.ollama.host}")
+
+    async def shutdown(self) -> None:
+        """等待进行中的请求完成（最多 graceful_timeout 秒），然后取消剩余请求并关闭连接"""
+        if self.inflight:
+            logger.info(f"Waiting for {len(self.inflight)} in-flight requests")
+            _, pending = await asyncio.wait(set(self.inflight), timeout=self.graceful_timeout)
+            for task in pending:
+                task.cancel()
+        if self.ollama:
+            await self.ollama.aclose()
+            self.ollama = None
+        if self.http:
+            await self.http.aclose()
+            self.http = None
+        await asyncio.to_thread(wsgi.job_manager.shutdown, False)
+        logger.info("ASGI worker stopped")
+
+    async def lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def handle(self, handler, scope, receive, send) -> None:
+        """执行处理函数并发送响应，期间客户端断开连接则取消处理任务"""
+        if self.ollama is None:
+            # 服务器未发送 lifespan 事件时在第一个请求时创建客户端
+            await self.startup()
+        body = await read_body(receive)
+        if body is None:
+            return
+        request = Request(scope, body)
+        start = time.perf_counter()
+        token = start_trace()
+        status = 499
+        disconnected = asyncio.create_task(wait_disconnect(receive))
+        try:
+            response = await self.run_until_disconnect(self.respond(handler, request), disconnected)
+            if response is not None:
+                status = response.status
+                completed = await self.run_until_disconnect(self.send_response(response, send), disconnected)
+                if completed is None:
+                    status = 499
+        finally:
+            disconnected.cancel()
+            trace = finish_trace(token)
+            wsgi.metrics.observe(wsgi.http_duration, time.perf_counter() - start,
+                                 endpoint=request.path, method=request.method, status=status)
+            if status == 499:
+                wsgi.metrics.inc(self.cancelled, endpoint=request.path)
+                logger.info(f"Client disconnected, cancelled {request.method} {request.path}")
+            elif trace:
+                logger.debug(f"{request.method} {request.path} {server_timing(trace)}")
+
+    async def run_until_disconnect(self, coro, disconnected: asyncio.Task):
+        """运行协程直到完成或客户端断开；断开时取消协程并返回None"""
+        task = asyncio.create_task(coro)
+        await asyncio.wait({task, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            return task.result()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return None
+
+    async def respond(self, handler, request: Request):
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.error(f"Unhandled error in {request.path}: {str(e)}")
+            return error_response(str(e), 500)
+
+    async def send_response(self, response, send) -> bool:
+        headers: Headers = [(b'access-control-allow-origin', b'*')]
+        if isinstance(response, StreamResponse):
+            headers.append((b'content-type', response.mimetype.encode()))
+            await send({'type': 'http.response.start', 'status': response.status, 'headers': headers})
+            async for line in response.lines:
+                await send({'type': 'http.response.body', 'body': line.encode('utf-8'), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+            return True
+
+        headers.append((b'content-type', b'application/json'))
+        headers.append((b'content-length', str(len(response.body)).encode()))
+        trace = current_trace()
+        if trace:
+            headers.append((b'server-timing', server_timing(trace).encode()))
+        await send({'type': 'http.response.start', 'status': response.status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': response.body})
+        return True
+
+    async def models(self, request: Request):
+        """获取可用的Ollama模型列表"""
+        try:
+            return JSONResponse({'models': await self.ollama.list_models()})
+        except ConnectionError:
+            logger.warning("Could not connect to Ollama API, using default models")
+            return JSONResponse({'models': wsgi.DEFAULT_MODELS})
+        except Exception as e:
+            return error_response(f"获取模型列表失败: {str(e)}")
+
+    async def extract(self, request: Request):
+        """提取网页内容；下载异步等待，HTML解析在线程池中执行"""
+        data = request.json()
+        if not data or 'url' not in data:
+            return error_response("Missing URL parameter")
+        try:
+            page = await wsgi.web_extractor.afetch_page(self.http, data['url'])
+            result = await asyncio.to_thread(wsgi.page_content, page, wsgi.request_token_budget(data))
+        except httpx.HTTPError as e:
+            logger.error(f"请求URL失败: {str(e)}")
+            return error_response(f"无法访问URL: {str(e)}")
+        except Exception as e:
+            logger.error(f"提取内容时出错: {str(e)}")
+            return error_response(f"提取内容失败: {str(e)}")
+        if not result['content']:
+            return error_response("No content extracted")
+        return JSONResponse(result)
+
+    async def check_ollama_service(self) -> Optional[JSONResponse]:
+        if not await self.ollama.is_available():
+            return error_response("Could not connect to Ollama service. Please ensure it is running.")
+        return None
+
+    async def structure(self, request: Request):
+        """生成结构化内容"""
+        data = request.json()
+        error = wsgi.structure_request_error(data)
+        if error:
+            return error_response(error)
+        model, prompt, content = data['model'], data['prompt'], data['content']
+        service_error = await self.check_ollama_service()
+        if service_error:
+            return service_error
+
+        try:
+            stored = await asyncio.to_thread(wsgi.find_stored_structure, data, model, prompt, content)
+            if stored:
+                return JSONResponse(stored)
+
+            processor = wsgi.llm_processor
+            if data.get('chunked'):
+                chunk_tokens = int(data.get('chunk_tokens', 1500))
+                chunker = TextChunker(max_tokens=chunk_tokens, overlap_tokens=chunk_tokens // 10)
+                result = await processor.aprocess_chunked(
+                    self.ollama, model, prompt, content,
+                    chunker=chunker,
+                    max_workers=int(data.get('max_workers', config.CHUNK_WORKERS)),
+                    format=data.get('format')
+                )
+            else:
+                result = await processor.aprocess(self.ollama, model, prompt, content, data.get('format'))
+
+            graph = parse_graph(result)
+            saved = await asyncio.to_thread(wsgi.save_structure_graph, data, model, prompt, content, result, graph)
+            return JSONResponse({'result': result, 'raw_output': result, 'graph': graph, **saved})
+        except Exception as e:
+            logger.error(f"Structure generation error: {str(e)}")
+            return error_response(f"结构化处理失败: {str(e)}")
+
+    async def structure_stream(self, request: Request):
+        """流式生成结构化内容（NDJSON），实体和关系在闭合时立即推送"""
+        data = request.json()
+        error = wsgi.structure_request_error(data)
+        if error:
+            return error_response(error)
+        model, prompt, content = data['model'], data['prompt'], data['content']
+        service_error = await self.check_ollama_service()
+        if service_error:
+            return service_error
+
+        stored = await asyncio.to_thread(wsgi.find_stored_structure, data, model, prompt, content)
+
+        async def cached_chunks():
+            yield {'response': stored['result']}
+
+        async def generate():
+            stream = wsgi.StructureStream()
+            try:
+                chunks = (cached_chunks() if stored
+                          else wsgi.llm_processor.aprocess_stream(self.ollama, model, prompt, content, data.get('format')))
+                async for chunk in chunks:
+                    for line in stream.feed(chunk):
+                        yield line
+                saved = stored or await asyncio.to_thread(
+                    wsgi.save_structure_graph, data, model, prompt, content, stream.result, stream.graph())
+                yield stream.done(saved)
+            except Exception as e:
+                yield stream.error(e)
+
+        return StreamResponse(generate())
+
+    async def chat(self, request: Request):
+        """基于图谱的对话，检索在线程中执行，等待模型回答时不占用线程"""
+        data = request.json()
+        error = wsgi.chat_request_error(data)
+        if error:
+            return error_response(error)
+        service_error = await self.check_ollama_service()
+        if service_error:
+            return service_error
+
+        chat_service = wsgi.chat_service
+        model = data.get('model') or wsgi.llm_processor.default_model
+        start_time = time.time()
+        try:
+            payload, references = await asyncio.to_thread(
+                chat_service.prepare, model, data['message'], data.get('graph_id'), data.get('context'))
+        except KeyError:
+            return error_response(f"Graph not found: {data.get('graph_id')}", 404)
+        retrieval_time = time.time() - start_time
+
+        if not data.get('stream'):
+            try:
+                answer, usage = await chat_service.aanswer(self.ollama, payload)
+            except Exception as e:
+                return error_response(f"对话失败: {str(e)}")
+            return JSONResponse({'response': answer, 'references': references,
+                                 'stats': wsgi.chat_stats(payload, start_time, retrieval_time, usage)})
+
+        async def generate():
+            stream = wsgi.ChatStream(payload, references, start_time, retrieval_time)
+            try:
+                yield stream.begin()
+                async for chunk in chat_service.aanswer_stream(self.ollama, payload):
+                    for line in stream.feed(chunk):
+                        yield line
+                yield stream.done()
+            except Exception as e:
+                yield stream.error(e)
+
+        return StreamResponse(generate())
+
+
+async def read_body(receive) -> Optional[bytes]:
+    """读取完整的请求体，读取过程中客户端断开时返回None"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def wait_disconnect(receive) -> None:
+    """请求体读取完毕后，receive 只会在客户端断开时返回 http.disconnect"""
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+app = GraphragerASGI(wsgi.app)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    if config.SERVER_WORKERS > 1:
+        logger.warning(f"SERVER_WORKERS={config.SERVER_WORKERS}: jobs and the session graph are kept in "
+                       f"process memory, /api/jobs/<id> and /api/graph may hit a worker without them")
+    uvicorn.run('asgi:app', host=config.SERVER_HOST, port=config.SERVER_PORT,
+                workers=config.SERVER_WORKERS, timeout_graceful_shutdown=int(config.GRACEFUL_TIMEOUT),
+                lifespan='on')
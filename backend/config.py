@@ -0,0 +1,128 @@
+import os
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+
+def _normalize_host(host: str) -> str:
+    """OLLAMA_HOST 兼容 "127.0.0.1:11434" 这种不带协议的写法"""
+    host = host.strip().rstrip('/')
+    if not host.startswith(('http://', 'https://')):
+        host = f"http://{host}"
+    return host
+
+
+def _parse_hosts(value: str):
+    """解析 OLLAMA_HOSTS："地址[=模型1,模型2];地址..."，返回 [(地址, 模型列表或None)]"""
+    hosts = []
+    for entry in value.replace('\n', ';').split(';'):
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, _, models = entry.partition('=')
+        models = [m.strip() for m in models.split(',') if m.strip()]
+        hosts.append((_normalize_host(host), models or None))
+    return hosts
+
+
+def _parse_budgets(value: str):
+    """解析 "模型=token数,模型=token数"，返回 {模型: token数}"""
+    budgets = {}
+    for entry in value.split(','):
+        model, _, tokens = entry.strip().rpartition('=')
+        if model and tokens.strip().isdigit():
+            budgets[model.strip()] = int(tokens)
+    return budgets
+
+
+# Ollama 服务配置
+OLLAMA_HOST = _normalize_host(os.environ.get('OLLAMA_HOST', 'http://localhost:11434'))
+# 多个Ollama服务，设置后忽略 OLLAMA_HOST；每个地址后可用 = 列出该服务提供的模型
+OLLAMA_HOSTS = _parse_hosts(os.environ.get('OLLAMA_HOSTS', ''))
+# 多个服务时的熔断：连续失败次数、熔断后的冷却时间（秒）；
+# 模型已加载的服务比最空闲的服务多出不超过 OLLAMA_AFFINITY_SLACK 个进行中请求时仍优先选择它
+OLLAMA_BREAKER_FAILURES = int(os.environ.get('OLLAMA_BREAKER_FAILURES', 3))
+OLLAMA_BREAKER_COOLDOWN = float(os.environ.get('OLLAMA_BREAKER_COOLDOWN', 30))
+OLLAMA_AFFINITY_SLACK = int(os.environ.get('OLLAMA_AFFINITY_SLACK', 2))
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get('OLLAMA_CONNECT_TIMEOUT', 5))
+OLLAMA_READ_TIMEOUT = float(os.environ.get('OLLAMA_READ_TIMEOUT', 300))
+OLLAMA_MAX_RETRIES = int(os.environ.get('OLLAMA_MAX_RETRIES', 3))
+OLLAMA_HEALTH_TTL = float(os.environ.get('OLLAMA_HEALTH_TTL', 10))
+# 模型在最后一次请求后保持加载的时间，避免重复加载模型和丢失已缓存的提示词前缀
+OLLAMA_KEEP_ALIVE = os.environ.get('OLLAMA_KEEP_ALIVE', '30m')
+# 抽取输出的格式约束：schema（发送JSON Schema，需要Ollama 0.5+）、json 或 none
+OLLAMA_FORMAT = os.environ.get('OLLAMA_FORMAT', 'schema')
+# 输出未通过校验时的最多重试次数
+LLM_PARSE_RETRIES = int(os.environ.get('LLM_PARSE_RETRIES', 1))
+
+# 后台任务配置
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+JOB_MODEL_CONCURRENCY = int(os.environ.get('JOB_MODEL_CONCURRENCY', 1))
+CHUNK_WORKERS = int(os.environ.get('CHUNK_WORKERS', 4))
+
+# 网页正文提取引擎：auto（安装了lxml时使用lxml）、lxml 或 bs4
+EXTRACTION_ENGINE = os.environ.get('EXTRACTION_ENGINE', 'auto')
+
+# 多URL抓取配置
+CRAWL_CONCURRENCY = int(os.environ.get('CRAWL_CONCURRENCY', 8))
+CRAWL_HOST_INTERVAL = float(os.environ.get('CRAWL_HOST_INTERVAL', 0.5))
+CRAWL_MAX_PAGES = int(os.environ.get('CRAWL_MAX_PAGES', 50))
+
+# 正文按段落分组的长度范围（字符），页面更新后只有变化的分组需要重新抽取
+SECTION_MIN_CHARS = int(os.environ.get('SECTION_MIN_CHARS', 300))
+SECTION_MAX_CHARS = int(os.environ.get('SECTION_MAX_CHARS', 1500))
+
+# 提示词中网页内容的token预算：按价值保留文本块，0表示不裁剪；
+# CONTENT_MODEL_BUDGETS 按模型单独设置，如 "llama3:latest=6000,qwen2:7b=24000"
+CONTENT_TOKEN_BUDGET = int(os.environ.get('CONTENT_TOKEN_BUDGET', 4000))
+CONTENT_MODEL_BUDGETS = _parse_budgets(os.environ.get('CONTENT_MODEL_BUDGETS', ''))
+# 同一主机下至少在这么多个其他页面中出现的文本块视为模板内容（导航、页脚、版权声明等）
+BOILERPLATE_MIN_PAGES = int(os.environ.get('BOILERPLATE_MIN_PAGES', 3))
+
+# 服务端图谱布局（需要numpy），超过节点上限时交给前端布局
+LAYOUT_ITERATIONS = int(os.environ.get('LAYOUT_ITERATIONS', 60))
+LAYOUT_SEED = int(os.environ.get('LAYOUT_SEED', 42))
+LAYOUT_MAX_NODES = int(os.environ.get('LAYOUT_MAX_NODES', 20000))
+
+# 连接池大小需覆盖所有可能同时访问Ollama的线程
+OLLAMA_POOL_SIZE = int(os.environ.get('OLLAMA_POOL_SIZE', max(10, JOB_WORKERS * CHUNK_WORKERS)))
+
+# 日志与指标：内存中保留的最近日志条数，完整提示词的日志采样比例和最大长度
+LOG_BUFFER_SIZE = int(os.environ.get('LOG_BUFFER_SIZE', 1000))
+PROMPT_LOG_SAMPLE_RATE = float(os.environ.get('PROMPT_LOG_SAMPLE_RATE', 0.01))
+PROMPT_LOG_MAX_CHARS = int(os.environ.get('PROMPT_LOG_MAX_CHARS', 2000))
+
+# 服务配置：开发服务器（python app.py）和生产环境的ASGI服务器（python asgi.py）
+SERVER_HOST = os.environ.get('SERVER_HOST', '127.0.0.1')
+SERVER_PORT = int(os.environ.get('SERVER_PORT', 5000))
+FLASK_DEBUG = os.environ.get('FLASK_DEBUG', 'true').lower() in ('1', 'true', 'yes')
+# ASGI工作进程数；后台任务和会话图谱保存在进程内存中，多个进程之间不共享，需保持为1
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', 1))
+# 收到停止信号后等待进行中请求完成的最长时间（秒）
+GRACEFUL_TIMEOUT = float(os.environ.get('GRACEFUL_TIMEOUT', 30))
+# 每个ASGI进程访问Ollama的最大并发连接数
+ASYNC_MAX_CONNECTIONS = int(os.environ.get('ASYNC_MAX_CONNECTIONS', 512))
+
+# 图谱对话：检索的实体和关系数量、原文片段，以及提示词中资料、问题和历史的长度上限
+CHAT_SEED_NODES = int(os.environ.get('CHAT_SEED_NODES', 8))
+CHAT_MAX_NODES = int(os.environ.get('CHAT_MAX_NODES', 40))
+CHAT_MAX_EDGES = int(os.environ.get('CHAT_MAX_EDGES', 80))
+CHAT_SNIPPETS = int(os.environ.get('CHAT_SNIPPETS', 4))
+CHAT_SNIPPET_CHARS = int(os.environ.get('CHAT_SNIPPET_CHARS', 240))
+CHAT_CONTEXT_CHARS = int(os.environ.get('CHAT_CONTEXT_CHARS', 4000))
+CHAT_QUESTION_CHARS = int(os.environ.get('CHAT_QUESTION_CHARS', 1000))
+CHAT_HISTORY_MESSAGES = int(os.environ.get('CHAT_HISTORY_MESSAGES', 6))
+# 缓存检索索引的图谱数
+CHAT_INDEX_CACHE = int(os.environ.get('CHAT_INDEX_CACHE', 8))
+
+# 实体向量：Ollama的向量模型、每次请求的文本数，以及近似重复实体的相似度阈值
+EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL', 'nomic-embed-text')
+EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE', 64))
+EMBEDDING_DEDUP_THRESHOLD = float(os.environ.get('EMBEDDING_DEDUP_THRESHOLD', 0.92))
+# 向量数达到该值时使用IVF聚类索引（近似查询），nprobe 为每次查询比较的簇数；量化后向量按int8保存
+VECTOR_IVF_MIN_SIZE = int(os.environ.get('VECTOR_IVF_MIN_SIZE', 50000))
+VECTOR_NPROBE = int(os.environ.get('VECTOR_NPROBE', 8))
+VECTOR_QUANTIZE = os.environ.get('VECTOR_QUANTIZE', 'false').lower() in ('1', 'true', 'yes')
@@ -1,107 +1,56 @@
 import requests
-from typing import Dict, Any, Optional
-import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import logging
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-import hashlib
-from functools import lru_cache
 import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.llm_processor.chunker import TextChunker, estimate_tokens
+from modules.llm_processor.merger import merge_chunk_graphs
+from modules.llm_processor.prompts import PromptTemplate
+from modules.llm_processor.stream_parser import loads_tolerant, validate_graph
+from modules.llm_processor.parse_stats import OK, PARSE_FAILURE, VALIDATION_FAILURE, get_parse_stats
+from modules.cache.llm_cache import LLMCache, get_default_cache
+from modules.ollama.transport import OllamaTransport, get_transport
+from modules.ollama.usage import TokenUsage
+from modules.metrics.registry import sampled
+import config
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class OllamaClient:
-    def __init__(self, model: str = "llama3:latest", host: str = "localhost", port: int = 11434):
-        self.model = model
-        self.base_url = f"http://{host}:{port}/api"
-        logger.info(f"Initialized OllamaClient with model: {model}")
-        
-        # 配置重试策略
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        self.session = requests.Session()
-        self.session.mount("http://", adapter)
-        self.session.mount("https://", adapter)
-    
-    def _get_cache_key(self, prompt: str, system: str = None) -> str:
-        """生成缓存键"""
-        content = f"{prompt}:{system if system else ''}"
-        return hashlib.md5(content.encode()).hexdigest()
-
-    @lru_cache(maxsize=1000)
-    def _cached_generate(self, cache_key: str, prompt: str, system: str = None) -> Dict[str, Any]:
-        """带缓存的生成函数"""
-        url = f"{self.base_url}/generate"
-        payload = {
-            "model": self.model,
-            "prompt": prompt,
-            "stream": False
-        }
-        
-        if system:
-            payload["system"] = system
-        
-        try:
-            logger.info(f"Cache miss for key: {cache_key[:8]}...")
-            start_time = time.time()
-            
-            response = self.session.post(url, json=payload, timeout=60)
-            response.raise_for_status()
-            
-            processing_time = time.time() - start_time
-            logger.info(f"Generation completed in {processing_time:.2f} seconds")
-            
-            return response.json()
-        except requests.exceptions.Timeout:
-            logger.error("Request to Ollama API timed out")
-            return {"error": "Request timed out"}
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error calling Ollama API: {str(e)}")
-            return {"error": str(e)}
-        except Exception as e:
-            logger.error(f"Unexpected error: {str(e)}")
-            return {"error": f"Unexpected error: {str(e)}"}
-
-    def generate(self, prompt: str, system: str = "") -> Dict[str, Any]:
-        """生成响应"""
-        try:
-            cache_key = self._get_cache_key(prompt, system)
-            
-            # 记录提示词
-            logger.info("Prompt sent to LLM:\n" + "-"*50 + "\n" + prompt + "\n" + "-"*50)
-            if system:
-                logger.info("System prompt:\n" + "-"*50 + "\n" + system + "\n" + "-"*50)
-            
-            return self._cached_generate(cache_key, prompt, system)
-        except Exception as e:
-            logger.error(f"Error in generate: {str(e)}")
-            return {"response": "", "error": str(e)}
-
-    def _get_page_type_prompt(self, content):
-        return f"""分析以下网页内容的类型。内容类型包括:
-- news: 新闻文章，包含具体新闻事件、时间、人物等信息
-- news_list: 新闻列表页面，包含多个新闻标题和链接
-- unknown: 无法确定类型的页面
+# 抽取实体和关系时的注意事项、类型定义和示例，单独抽取、融合和批量模式共用
+ENTITY_NOTES = """1. 必须严格按照JSON格式返回
+2. 确保提取所有关键实体（人物、组织、地点、事件、时间等）
+3. 确保建立实体之间有意义的关系
+4. ID必须唯一，使用p1、o1、l1、e1、t1等前缀区分不同类型
+5. 实体有其他常用名称（英文名、全名、简称）时，放入aliases数组，便于跨页面合并同一实体"""
 
-请仅返回以上类型之一，不要包含其他内容。
+ENTITY_TYPE_RULES = """实体类型定义：
+1. person (p前缀): 人物，如政治人物、企业家、专家等
+2. org (o前缀): 组织机构，如政府、公司、组织等
+3. location (l前缀): 地点，如国家、城市、地区等
+4. event (e前缀): 事件，如会议、事故、战争等
+5. time (t前缀): 时间点或时间段，使用ISO格式(YYYY-MM-DD)
+6. topic (tp前缀): 主题或议题，如政策、倡议等
 
-网页内容:
-{content}
-"""
+关系类型定义：
+1. participates_in: 参与关系（人物/组织参与事件）
+2. located_in: 位置关系（事件/组织发生或位于某地）
+3. happens_at: 时间关系（事件发生于某时间）
+4. affiliated_with: 隶属关系（人物属于某组织）
+5. supports: 支持关系（人物/组织支持某议题/立场）
+6. opposes: 反对关系（人物/组织反对某议题/立场）
+7. relates_to: 相关关系（实体之间的其他关系）"""
 
-    def _get_entities_prompt(self, content, page_type):
-        example_json = '''{
+ENTITY_EXAMPLE_JSON = '''{
     "entities": [
         {
             "id": "p1",
             "type": "person",
             "name": "拜登",
+            "aliases": ["Joe Biden", "Biden"],
             "description": "美国总统"
         },
         {
@@ -152,41 +101,289 @@ class OllamaClient:
         }
     ]
 }'''
-        
-        return f"""你是一个专业的新闻分析AI。请仔细分析以下新闻内容，提取所有重要实体和它们之间的关系。注意：
-1. 必须严格按照JSON格式返回
-2. 确保提取所有关键实体（人物、组织、地点、事件、时间等）
-3. 确保建立实体之间有意义的关系
-4. ID必须唯一，使用p1、o1、l1、e1、t1等前缀区分不同类型
 
-实体类型定义：
-1. person (p前缀): 人物，如政治人物、企业家、专家等
-2. org (o前缀): 组织机构，如政府、公司、组织等
-3. location (l前缀): 地点，如国家、城市、地区等
-4. event (e前缀): 事件，如会议、事故、战争等
-5. time (t前缀): 时间点或时间段，使用ISO格式(YYYY-MM-DD)
-6. topic (tp前缀): 主题或议题，如政策、倡议等
+PAGE_TYPES = ('news', 'news_list', 'unknown')
 
-关系类型定义：
-1. participates_in: 参与关系（人物/组织参与事件）
-2. located_in: 位置关系（事件/组织发生或位于某地）
-3. happens_at: 时间关系（事件发生于某时间）
-4. affiliated_with: 隶属关系（人物属于某组织）
-5. supports: 支持关系（人物/组织支持某议题/立场）
-6. opposes: 反对关系（人物/组织反对某议题/立场）
-7. relates_to: 相关关系（实体之间的其他关系）
+PAGE_TYPE_RULES = """- news: 新闻文章，包含具体新闻事件、时间、人物等信息
+- news_list: 新闻列表页面，包含多个新闻标题和链接
+- unknown: 无法确定类型的页面"""
+
+# 融合模式的示例在实体示例前加上 page_type 字段
+FUSED_EXAMPLE_JSON = '{\n    "page_type": "news",' + ENTITY_EXAMPLE_JSON[1:]
+
+# 批量模式示例保持简短，减少每个请求重复评估的提示词
+BATCH_EXAMPLE_JSON = """{
+    "documents": [
+        {
+            "index": 1,
+            "page_type": "news",
+            "entities": [
+                {"id": "p1", "type": "person", "name": "拜登", "aliases": ["Joe Biden"], "description": "美国总统"},
+                {"id": "o1", "type": "org", "name": "白宫", "description": "美国政府行政机构"}
+            ],
+            "relationships": [
+                {"source": "p1", "target": "o1", "type": "affiliated_with"}
+            ]
+        }
+    ]
+}"""
+
+ENTITY_TYPES = ['person', 'org', 'location', 'event', 'time', 'topic']
+RELATIONSHIP_TYPES = ['participates_in', 'located_in', 'happens_at', 'affiliated_with', 'supports', 'opposes', 'relates_to']
+
+# 输出的JSON Schema（Ollama的 format 字段），约束字段和类型取值；
+# ID唯一、关系端点存在这类约束无法用Schema表达，仍由 validate_graph 校验
+GRAPH_PROPERTIES = {
+    "entities": {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "id": {"type": "string"},
+                "type": {"type": "string", "enum": ENTITY_TYPES},
+                "name": {"type": "string"},
+                "aliases": {"type": "array", "items": {"type": "string"}},
+                "description": {"type": "string"}
+            },
+            "required": ["id", "type", "name"]
+        }
+    },
+    "relationships": {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "source": {"type": "string"},
+                "target": {"type": "string"},
+                "type": {"type": "string", "enum": RELATIONSHIP_TYPES}
+            },
+            "required": ["source", "target", "type"]
+        }
+    }
+}
+
+GRAPH_SCHEMA = {
+    "type": "object",
+    "properties": GRAPH_PROPERTIES,
+    "required": ["entities", "relationships"]
+}
+
+FUSED_SCHEMA = {
+    "type": "object",
+    "properties": {"page_type": {"type": "string", "enum": list(PAGE_TYPES)}, **GRAPH_PROPERTIES},
+    "required": ["page_type", "entities", "relationships"]
+}
+
+BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "documents": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"index": {"type": "integer"}, **FUSED_SCHEMA["properties"]},
+                "required": ["index", "page_type", "entities", "relationships"]
+            }
+        }
+    },
+    "required": ["documents"]
+}
+
+# 提示词模板：说明、类型定义和示例作为静态前缀放在 system 中，每次请求逐字节相同，
+# Ollama可以复用该前缀的KV缓存；页面内容放在 prompt 中
+PAGE_TYPE_TEMPLATE = PromptTemplate('page_type', f"""分析网页内容的类型。内容类型包括:
+{PAGE_TYPE_RULES}
+
+请仅返回以上类型之一，不要包含其他内容。""", """网页内容:
+{content}
+""")
+
+ENTITIES_TEMPLATE = PromptTemplate('entities', f"""你是一个专业的新闻分析AI。请仔细分析用户提供的新闻内容，提取所有重要实体和它们之间的关系。注意：
+{ENTITY_NOTES}
+
+{ENTITY_TYPE_RULES}
 
 请按照以下示例格式返回JSON（注意：这只是示例，你需要根据实际新闻内容提取实体和关系）：
 
-{example_json}
+{ENTITY_EXAMPLE_JSON}""", """新闻内容：
+{content}""", GRAPH_SCHEMA)
+
+FUSED_TEMPLATE = PromptTemplate('fused', f"""你是一个专业的新闻分析AI。请在一次回答中完成两项任务：判断用户提供的网页内容的类型，并提取所有重要实体和它们之间的关系。
+
+页面类型page_type取值：
+{PAGE_TYPE_RULES}
+
+注意：
+{ENTITY_NOTES}
+
+{ENTITY_TYPE_RULES}
+
+请按照以下示例格式返回JSON（注意：这只是示例，你需要根据实际内容判断类型并提取实体和关系）：
+
+{FUSED_EXAMPLE_JSON}""", """网页内容：
+{content}""", FUSED_SCHEMA)
+
+BATCH_TEMPLATE = PromptTemplate('batch', f"""你是一个专业的新闻分析AI。用户会提供若干篇用[文档 编号]分隔的短文档，请逐篇判断类型并提取实体和关系。
 
-新闻内容：
-{content}"""
+页面类型page_type取值：
+{PAGE_TYPE_RULES}
+
+注意：
+{ENTITY_NOTES}
+6. documents数组中每篇文档对应一项，index为文档编号，不要遗漏文档
+7. 每篇文档的实体ID单独编号，关系只能引用同一篇文档中的实体
+
+{ENTITY_TYPE_RULES}
+
+请按照以下示例格式返回JSON（注意：这只是示例）：
+
+{BATCH_EXAMPLE_JSON}""", """以下共{count}篇文档：
+
+{documents}""", BATCH_SCHEMA)
+
+
+class OllamaClient:
+    def __init__(self, model: str = "llama3:latest", host: Optional[str] = None, port: Optional[int] = None,
+                 chunker: Optional[TextChunker] = None, max_workers: int = 4,
+                 cache: Optional[LLMCache] = None, transport: Optional[OllamaTransport] = None,
+                 max_retries: Optional[int] = None):
+        self.model = model
+        self.cache = cache or get_default_cache()
+        # 未指定主机时复用共享传输层，指定时单独创建
+        if transport is None and (host or port):
+            transport = OllamaTransport(f"http://{host or 'localhost'}:{port or 11434}")
+        self.transport = transport or get_transport()
+        self.chunker = chunker or TextChunker()
+        self.max_workers = max_workers
+        self.usage = TokenUsage()
+        # 输出未通过校验时的最多重试次数
+        self.max_retries = config.LLM_PARSE_RETRIES if max_retries is None else max_retries
+        self.parse_stats = get_parse_stats()
+        logger.info(f"Initialized OllamaClient with model: {model}")
+    
+    def _generate(self, prompt: str, system: str = None, format: Any = None) -> Dict[str, Any]:
+        """调用Ollama生成接口，format 为 "json" 或输出的JSON Schema"""
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            # 保持模型常驻，已缓存的静态前缀在下一次请求时仍然有效
+            "keep_alive": config.OLLAMA_KEEP_ALIVE
+        }
+        
+        if system:
+            payload["system"] = system
+        if format:
+            payload["format"] = format
+        
+        try:
+            start_time = time.time()
+            
+            response = self.transport.post("/api/generate", json=payload)
+            response.raise_for_status()
+            
+            processing_time = time.time() - start_time
+            logger.info(f"Generation completed in {processing_time:.2f} seconds")
+            
+            result = response.json()
+            self.usage.record(result, self.model)
+            return result
+        except requests.exceptions.Timeout:
+            logger.error("Request to Ollama API timed out")
+            return {"error": "Request timed out"}
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error calling Ollama API: {str(e)}")
+            return {"error": str(e)}
+        except Exception as e:
+            logger.error(f"Unexpected error: {str(e)}")
+            return {"error": f"Unexpected error: {str(e)}"}
+
+    def _cache_key(self, prompt: str, system: str = "", format: Any = None) -> str:
+        return LLMCache.make_key(self.model, prompt, system, {"format": format} if format else None)
+
+    def generate(self, prompt: str, system: str = "", format: Any = None, refresh: bool = False) -> Dict[str, Any]:
+        """生成响应，refresh 为真时跳过缓存重新生成（结果仍会写入缓存）"""
+        return self._generate_cached(prompt, system, format, refresh)[0]
+
+    def _generate_cached(self, prompt: str, system: str = "", format: Any = None,
+                         refresh: bool = False) -> Tuple[Dict[str, Any], bool]:
+        """生成响应，同时返回是否命中缓存"""
+        try:
+            cache_key = self._cache_key(prompt, system, format)
+            cached = None if refresh else self.cache.get(cache_key)
+            if cached is not None:
+                return cached, True
+            logger.info(f"Cache miss for key: {cache_key[:8]}...")
+            
+            # 记录提示词：完整提示词可能很长，只按比例采样记录，并截断到固定长度
+            if sampled(config.PROMPT_LOG_SAMPLE_RATE):
+                limit = config.PROMPT_LOG_MAX_CHARS
+                logger.info("Prompt sent to LLM:\n" + "-"*50 + "\n" + prompt[:limit] + "\n" + "-"*50)
+                if system:
+                    logger.info("System prompt:\n" + "-"*50 + "\n" + system[:limit] + "\n" + "-"*50)
+            
+            result = self._generate(prompt, system, format)
+            # 失败的响应不写入缓存，下次请求会重新生成
+            self.cache.set(cache_key, result, self.model)
+            return result, False
+        except Exception as e:
+            logger.error(f"Error in generate: {str(e)}")
+            return {"response": "", "error": str(e)}, False
+
+    @staticmethod
+    def _format(template: PromptTemplate) -> Any:
+        """按 OLLAMA_FORMAT 配置决定是否约束输出格式：schema、json 或 none"""
+        if template.schema is None or config.OLLAMA_FORMAT == 'none':
+            return None
+        return template.schema if config.OLLAMA_FORMAT == 'schema' else 'json'
+
+    @staticmethod
+    def _outcome(result: Dict[str, Any]) -> str:
+        if "error" in result:
+            return PARSE_FAILURE
+        if result.get("dropped"):
+            return VALIDATION_FAILURE
+        return OK
+
+    @classmethod
+    def _score(cls, result: Dict[str, Any]):
+        dropped = result.get("dropped") or {}
+        return (cls._outcome(result) == OK, "error" not in result,
+                -sum(dropped.values()), len(result.get("entities", [])))
+
+    def _generate_validated(self, template: PromptTemplate,
+                            parse: Callable[[Dict[str, Any]], Dict[str, Any]], **values) -> Dict[str, Any]:
+        """生成并解析校验结果；只有未通过校验的输出才重试（最多 max_retries 次），返回最好的一次结果
+
+        重试跳过缓存重新生成；最终缓存中保留最好的那次响应。命中缓存时直接使用缓存的结果，
+        即使它未通过校验也不再重试（缓存中已是上次重试后最好的结果），也不计入解析统计。
+        请求本身失败（超时、连接错误）由传输层重试，这里不再重试，也不计入解析统计。
+        """
+        system, prompt = template.render(**values)
+        format = self._format(template)
+        best_result, best_response = None, None
+        for attempt in range(self.max_retries + 1):
+            response, cached = self._generate_cached(prompt, system, format, refresh=attempt > 0)
+            result = parse(response)
+            if cached:
+                return result
+            if response.get("error"):
+                return result if best_result is None else best_result
+            outcome = self._outcome(result)
+            self.parse_stats.record(self.model, outcome, retry=attempt > 0)
+            if best_result is None or self._score(result) > self._score(best_result):
+                best_result, best_response = result, response
+            if outcome == OK:
+                break
+            logger.warning(f"{template.name} output failed validation ({outcome}), attempt {attempt + 1}")
+        if best_response is not response:
+            self.cache.set(self._cache_key(prompt, system, format), best_response, self.model)
+        return best_result
 
     def analyze_page_type(self, content: str) -> Dict[str, Any]:
         """分析页面类型"""
-        prompt = self._get_page_type_prompt(content)
-        response = self.generate(prompt)
+        system, prompt = PAGE_TYPE_TEMPLATE.render(content=content)
+        response = self.generate(prompt, system)
         try:
             result = response.get("response", "")
             return {"type": result.strip()}
@@ -197,46 +394,152 @@ class OllamaClient:
             }
 
     def extract_entities_relations(self, content: str, page_type: str) -> Dict[str, Any]:
-        """从内容中提取实体和关系"""
-        prompt = self._get_entities_prompt(content, page_type)
-        response = self.generate(prompt)
+        """从内容中提取实体和关系，长文本自动分片并发抽取后合并"""
+        chunks = self.chunker.chunk(content)
+        if len(chunks) <= 1:
+            return self._extract_single(content, page_type)
+
+        logger.info(f"Extracting entities from {len(chunks)} chunks")
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+            results = list(executor.map(lambda chunk: self._extract_single(chunk, page_type), chunks))
+        return self._merge_results(results)
+
+    def analyze_and_extract(self, content: str) -> Dict[str, Any]:
+        """融合模式：一次调用同时返回页面类型（page_type）和实体关系，长文本分片后合并"""
+        chunks = self.chunker.chunk(content)
+        if len(chunks) <= 1:
+            return self._extract_fused(content)
+
+        logger.info(f"Extracting entities from {len(chunks)} chunks (fused)")
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+            results = list(executor.map(self._extract_fused, chunks))
+        merged = self._merge_results(results)
+        # 页面类型取各片段中出现最多的已知类型
+        types = [r.get("page_type") for r in results if "error" not in r and r.get("page_type") != "unknown"]
+        merged["page_type"] = Counter(types).most_common(1)[0][0] if types else "unknown"
+        return merged
+
+    def extract_batch(self, contents: List[str], max_tokens: Optional[int] = None) -> List[Dict[str, Any]]:
+        """批量模式：把多篇短文档打包进同一个请求，按顺序返回每篇文档的 page_type 和实体关系
+
+        每个请求的文档总长度不超过 max_tokens（默认为分片大小），超长的文档单独走融合模式。
+        某篇文档在批量结果中缺失或无效时，单独重新抽取该文档。
+        """
+        budget = max_tokens or self.chunker.max_tokens
+        batches: List[List[int]] = []
+        current: List[int] = []
+        current_tokens = 0
+        for index, content in enumerate(contents):
+            tokens = estimate_tokens(content)
+            if current and current_tokens + tokens > budget:
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(index)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(contents)
+
+        def run(batch: List[int]) -> None:
+            if len(batch) == 1:
+                results[batch[0]] = self.analyze_and_extract(contents[batch[0]])
+                return
+            for index, result in zip(batch, self._extract_batch([contents[i] for i in batch])):
+                results[index] = result if result is not None else self.analyze_and_extract(contents[index])
+
+        logger.info(f"Extracting {len(contents)} documents in {len(batches)} requests")
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(batches)))) as executor:
+            list(executor.map(run, batches))
+        return results
+
+    def _merge_results(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """合并各片段的抽取结果，记录失败的片段数"""
+        succeeded = [r for r in results if "error" not in r]
+        merged = merge_chunk_graphs(succeeded)
+        if not succeeded:
+            merged["error"] = results[0].get("error")
+        elif len(succeeded) < len(results):
+            merged["failed_chunks"] = len(results) - len(succeeded)
+        return merged
+
+    @staticmethod
+    def _page_type(value: Any) -> str:
+        value = str(value or "").strip().lower()
+        return value if value in PAGE_TYPES else "unknown"
+
+    def _extract_single(self, content: str, page_type: str) -> Dict[str, Any]:
+        """对单段内容调用LLM提取实体和关系"""
+        return self._generate_validated(ENTITIES_TEMPLATE, self._parse_graph, content=content)
+
+    def _extract_fused(self, content: str) -> Dict[str, Any]:
+        """对单段内容调用一次LLM，同时返回页面类型和实体关系"""
+        return self._generate_validated(FUSED_TEMPLATE, self._parse_fused, content=content)
+
+    @staticmethod
+    def _parse_graph(response: Dict[str, Any]) -> Dict[str, Any]:
         try:
             result = response.get("response", "")
-            print("LLM Response:", result)  # 添加调试输出
-            parsed_result = json.loads(result)
-            
-            # 验证结果格式
-            if not isinstance(parsed_result, dict):
-                raise ValueError("Response is not a dictionary")
-            
-            if "entities" not in parsed_result or "relationships" not in parsed_result:
-                raise ValueError("Missing required keys: entities or relationships")
-            
-            # 验证实体ID的唯一性
-            entity_ids = [e.get("id") for e in parsed_result.get("entities", [])]
-            if len(entity_ids) != len(set(entity_ids)):
-                raise ValueError("Duplicate entity IDs found")
-            
-            # 验证关系引用的实体是否存在
-            valid_ids = set(entity_ids)
-            valid_relationships = []
-            for rel in parsed_result.get("relationships", []):
-                if rel.get("source") in valid_ids and rel.get("target") in valid_ids:
-                    valid_relationships.append(rel)
+            logger.debug(f"LLM Response: {result}")
+            # 容忍代码块标记、多余文字和截断的输出，保留能解析出的部分
+            return validate_graph(loads_tolerant(result))
             
+        except Exception as e:
+            logger.error(f"Error parsing response: {str(e)}")
             return {
-                "entities": parsed_result.get("entities", []),
-                "relationships": valid_relationships
+                "entities": [],
+                "relationships": [],
+                "error": f"Failed to parse response: {response.get('error') or str(e)}"
             }
-            
+
+    @classmethod
+    def _parse_fused(cls, response: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            parsed_result = loads_tolerant(response.get("response", ""))
+            result = validate_graph(parsed_result)
+            result["page_type"] = cls._page_type(parsed_result.get("page_type"))
+            return result
         except Exception as e:
-            print(f"Error parsing response: {str(e)}")  # 添加错误调试输出
+            logger.error(f"Error parsing fused response: {str(e)}")
             return {
+                "page_type": "unknown",
                 "entities": [],
                 "relationships": [],
-                "error": f"Failed to parse response: {str(e)}"
+                "error": f"Failed to parse response: {response.get('error') or str(e)}"
             }
 
+    def _extract_batch(self, contents: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """一个请求处理多篇文档，解析失败的文档返回None"""
+        documents = '\n\n'.join(f"[文档 {i}]\n{content}" for i, content in enumerate(contents, 1))
+        system, prompt = BATCH_TEMPLATE.render(count=len(contents), documents=documents)
+        response, cached = self._generate_cached(prompt, system, self._format(BATCH_TEMPLATE))
+        results: List[Optional[Dict[str, Any]]] = [None] * len(contents)
+        try:
+            # 输出被截断时保留已完整输出的文档，缺失的文档由调用方单独重新抽取
+            documents = loads_tolerant(response.get("response", "")).get("documents", [])
+        except Exception as e:
+            logger.error(f"Error parsing batch response: {str(e)}")
+            if not response.get("error") and not cached:
+                self.parse_stats.record(self.model, PARSE_FAILURE)
+            return results
+
+        for document in documents:
+            try:
+                index = int(document.get("index")) - 1
+                if 0 <= index < len(contents) and results[index] is None:
+                    result = validate_graph(document)
+                    result["page_type"] = self._page_type(document.get("page_type"))
+                    results[index] = result
+            except Exception as e:
+                logger.warning(f"Invalid document in batch response: {str(e)}")
+        missing = sum(1 for r in results if r is None)
+        if missing:
+            logger.warning(f"{missing} of {len(contents)} documents missing from batch response")
+        if not cached:
+            valid = not missing and all(self._outcome(r) == OK for r in results)
+            self.parse_stats.record(self.model, OK if valid else VALIDATION_FAILURE)
+        return results
+
 # 测试代码
 if __name__ == "__main__":
     client = OllamaClient()
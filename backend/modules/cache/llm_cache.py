@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.cache')
+
+
+class LLMCache:
+    """基于SQLite的LLM响应缓存
+
+    以 模型 + 生成参数 + 提示词 的哈希作为键，进程重启后仍然有效。
+    支持按条目数、总字节数和TTL淘汰，只缓存成功的响应。
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 5000,
+                 max_bytes: int = 256 * 1024 * 1024, ttl: float = 7 * 24 * 3600):
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, 'llm_cache.sqlite3')
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache(accessed_at)')
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(model: str, prompt: str, system: str = '', options: Optional[Dict[str, Any]] = None) -> str:
+        """根据模型、参数和提示词生成缓存键"""
+        payload = json.dumps({
+            'model': model,
+            'system': system or '',
+            'options': options or {},
+            'prompt_sha256': hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存，过期或不存在时返回None"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT value, created_at FROM llm_cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                if row is not None:
+                    self.conn.execute('DELETE FROM llm_cache WHERE key = ?', (key,))
+                    self.conn.commit()
+                self.misses += 1
+                return None
+
+            self.conn.execute('UPDATE llm_cache SET accessed_at = ? WHERE key = ?', (now, key))
+            self.conn.commit()
+            self.hits += 1
+
+        logger.info(f"Cache hit for key: {key[:8]}...")
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Dict[str, Any], model: str = '') -> None:
+        """写入缓存，包含error字段的响应不会被缓存"""
+        if not isinstance(value, dict) or value.get('error'):
+            return
+
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO llm_cache (key, model, value, size, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, model, data, len(data.encode('utf-8')), now, now)
+            )
+            self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now: float) -> None:
+        """淘汰过期条目，再按最近访问时间淘汰超出容量的条目"""
+        if self.ttl:
+            self.conn.execute('DELETE FROM llm_cache WHERE created_at < ?', (now - self.ttl,))
+
+        count, total = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache').fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        rows = self.conn.execute('SELECT key, size FROM llm_cache ORDER BY accessed_at').fetchall()
+        evicted = []
+        for key, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            count -= 1
+            total -= size
+        self.conn.executemany('DELETE FROM llm_cache WHERE key = ?', evicted)
+        logger.info(f"Evicted {len(evicted)} cache entries")
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self.lock:
+            self.conn.execute('DELETE FROM llm_cache')
+            self.conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存统计信息"""
+        with self.lock:
+            count, total = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache').fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'entries': count,
+            'bytes': total,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> LLMCache:
+    """获取进程内共享的缓存实例，路径可通过GRAPHRAGER_CACHE_DIR环境变量配置"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            cache_dir = os.environ.get('GRAPHRAGER_CACHE_DIR', DEFAULT_CACHE_DIR)
+            _default_cache = LLMCache(os.path.join(cache_dir, 'llm_cache.sqlite3'))
+        return _default_cache
@@ -0,0 +1,129 @@
+import re
+import math
+import heapq
+import unicodedata
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from modules.graph_generator.compact import CompactGraph
+from modules.graph_generator.store import normalize_name
+
+# 连续的中文字符或字母数字
+TOKEN_PATTERN = re.compile(r'[0-9a-z]+|[㐀-䶿一-鿿]+')
+# 名称中的词比描述中的词权重更高
+NAME_WEIGHT = 3.0
+# 问题中直接出现了实体名称时的额外得分
+MENTION_BONUS = 10.0
+# 大图谱中出现在过多节点中的词（如“公司”）区分度很低，只在没有其他词时才使用
+MAX_POSTINGS_FRACTION = 0.2
+MIN_POSTINGS_LIMIT = 1000
+# 一次查询最多累加的倒排表长度，按词的稀有程度依次处理，保证查询耗时有上限
+MAX_SCANNED_POSTINGS = 5000
+
+
+def tokenize(text: str) -> Iterator[str]:
+    """中文按相邻两字切分（不依赖分词词典），字母数字按单词切分"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    for run in TOKEN_PATTERN.findall(text):
+        if run[0] < '㐀' or len(run) == 1:
+            yield run
+        else:
+            for i in range(len(run) - 1):
+                yield run[i:i + 2]
+
+
+class GraphIndex:
+    """图谱实体的倒排索引
+
+    索引建立后查询只遍历问题中各词的倒排表，开销与命中的节点数成正比，与图谱规模无关。
+    倒排表为节点下标的整数数组；名称和描述分别建表，名称命中的权重更高。
+    """
+
+    def __init__(self, graph: CompactGraph, descriptions: Optional[Dict[str, str]] = None):
+        self.graph = graph
+        self.descriptions = descriptions or {}
+        self.names: Dict[str, array] = {}
+        self.texts: Dict[str, array] = {}
+        for index, node_id in enumerate(graph.node_ids.values):
+            for term in set(tokenize(graph.labels[index])):
+                self.names.setdefault(term, array('i')).append(index)
+            description = self.descriptions.get(node_id)
+            if description:
+                for term in set(tokenize(description)):
+                    self.texts.setdefault(term, array('i')).append(index)
+
+    @property
+    def node_count(self) -> int:
+        return self.graph.node_count
+
+    def _idf(self, term: str) -> float:
+        df = len(self.names.get(term, ())) + len(self.texts.get(term, ()))
+        return math.log(1 + self.node_count / df) if df else 0.0
+
+    def search(self, query: str, limit: int = 8) -> List[Tuple[int, float]]:
+        """返回得分最高的 (节点下标, 得分)"""
+        frequency = {term: len(self.names.get(term, ())) + len(self.texts.get(term, ()))
+                     for term in set(tokenize(query))}
+        terms = sorted((term for term, df in frequency.items() if df), key=frequency.get)
+        max_postings = max(MIN_POSTINGS_LIMIT, int(self.node_count * MAX_POSTINGS_FRACTION))
+        selective = [term for term in terms if frequency[term] <= max_postings]
+        scores: Dict[int, float] = {}
+        scanned = 0
+        for term in selective or terms[:1]:
+            if scanned and scanned + frequency[term] > MAX_SCANNED_POSTINGS:
+                break
+            scanned += frequency[term]
+            idf = self._idf(term)
+            for index in self.names.get(term, ()):
+                scores[index] = scores.get(index, 0.0) + NAME_WEIGHT * idf
+            for index in self.texts.get(term, ()):
+                scores[index] = scores.get(index, 0.0) + idf
+
+        # 只对候选节点检查名称是否完整出现在问题中
+        normalized_query = normalize_name(query)
+        for index in scores:
+            name = normalize_name(self.graph.labels[index])
+            if name and name in normalized_query:
+                scores[index] += MENTION_BONUS * (1 + len(name) / 10)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    def expand(self, seeds: List[Tuple[int, float]], max_nodes: int = 40, max_edges: int = 80,
+               per_node: int = 8, max_scan: int = 2000) -> Tuple[List[int], List[int]]:
+        """从命中的节点向外扩展一跳，返回 (节点下标, 边编号)
+
+        每个节点最多保留 per_node 个邻居（按邻居度数从高到低），高度数节点最多检查
+        max_scan 条边，结果规模只取决于参数，不随图谱增大。
+        """
+        graph = self.graph
+        selected: Dict[int, None] = {index: None for index, _ in seeds}
+        edges: Dict[int, None] = {}
+        out_offsets, out_ids, in_offsets, in_ids = graph.csr
+        for index, _ in seeds:
+            candidates: Dict[int, int] = {}
+            scanned = 0
+            for offsets, ids, far in ((out_offsets, out_ids, graph.dst), (in_offsets, in_ids, graph.src)):
+                for edge in ids[offsets[index]:offsets[index + 1]]:
+                    if scanned >= max_scan:
+                        break
+                    scanned += 1
+                    neighbor = far[edge]
+                    if neighbor != index:
+                        candidates.setdefault(neighbor, edge)
+            ranked = heapq.nlargest(per_node, candidates.items(), key=lambda item: self._degree(item[0]))
+            for neighbor, edge in ranked:
+                if len(edges) < max_edges:
+                    edges[edge] = None
+                if len(selected) < max_nodes:
+                    selected[neighbor] = None
+        # 已选节点之间的其他边也一并提供给模型
+        for index in list(selected):
+            for edge in graph.out_edges(index)[:max_scan]:
+                if len(edges) >= max_edges:
+                    break
+                if graph.dst[edge] in selected:
+                    edges[edge] = None
+        return list(selected), [edge for edge in edges if graph.src[edge] in selected and graph.dst[edge] in selected]
+
+    def _degree(self, index: int) -> int:
+        out_offsets, _, in_offsets, _ = self.graph.csr
+        return out_offsets[index + 1] - out_offsets[index] + in_offsets[index + 1] - in_offsets[index]
@@ -0,0 +1,315 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+import config
+from modules.chat.index import GraphIndex
+from modules.graph_generator.compact import CompactGraph
+from modules.graph_generator.persistence import GraphRepository
+from modules.graph_generator.store import GraphStore
+from modules.llm_processor.prompts import PromptTemplate
+from modules.llm_processor.stream_parser import parse_graph
+from modules.metrics.registry import get_metrics
+from modules.ollama.async_transport import AsyncOllamaTransport, httpx
+from modules.ollama.transport import OllamaTransport
+from modules.ollama.usage import TokenUsage
+from modules.web_extractor.page_cache import PageCache
+
+logger = logging.getLogger(__name__)
+
+CHAT_TEMPLATE = PromptTemplate(
+    'chat',
+    system=(
+        "你是一个基于知识图谱回答问题的助手。回答只能依据提供的图谱实体、关系和原文片段，"
+        "资料中没有相关信息时直接说明无法从图谱中找到答案，不要编造。"
+        "回答使用与问题相同的语言，简洁准确，提到实体时使用资料中的名称。"
+    ),
+    template="{context}\n\n{history}问题：{question}\n回答："
+)
+
+# 对话历史中每条消息的最大长度
+HISTORY_MESSAGE_CHARS = 500
+
+
+class ChatContext:
+    """一次检索的结果：选中的实体、关系和原文片段，按字符预算组装为提示词中的资料"""
+
+    def __init__(self, entities: List[Dict[str, Any]], relationships: List[Dict[str, Any]],
+                 snippets: List[Dict[str, str]]):
+        self.entities = entities
+        self.relationships = relationships
+        self.snippets = snippets
+
+    def references(self) -> List[Dict[str, Any]]:
+        """回答引用的知识点（命中的实体）"""
+        return [{'id': e['id'], 'name': e['name'], 'type': e['type']} for e in self.entities if e.get('matched')]
+
+    def render(self, max_chars: int) -> str:
+        """按 命中实体 -> 关系 -> 相邻实体 -> 原文片段 的优先级填充，总长度不超过 max_chars"""
+        sections = [
+            ('实体', [self._entity_line(e) for e in self.entities if e.get('matched')]),
+            ('关系', [f"{r['source']} -[{r['type'] or '相关'}]-> {r['target']}"
+                     + (f"：{r['description']}" if r.get('description') else '') for r in self.relationships]),
+            ('相关实体', [self._entity_line(e) for e in self.entities if not e.get('matched')]),
+            ('原文片段', [f"[{s['source']}] {s['text']}" for s in self.snippets])
+        ]
+        lines: List[str] = []
+        used = 0
+        for title, items in sections:
+            header = f"## {title}"
+            for item in items:
+                cost = len(item) + 1 + (len(header) + 1 if header else 0)
+                if used + cost > max_chars:
+                    break
+                if header:
+                    lines.append(header)
+                    header = None
+                lines.append(item)
+                used += cost
+        return '\n'.join(lines) if lines else '（图谱中没有找到相关资料）'
+
+    @staticmethod
+    def _entity_line(entity: Dict[str, Any]) -> str:
+        line = f"- {entity['name']}（{entity['type'] or '实体'}）"
+        return f"{line}：{entity['description']}" if entity.get('description') else line
+
+
+class IndexedGraph:
+    """建立了检索索引的图谱，附带实体/关系描述和来源URL"""
+
+    def __init__(self, graph: CompactGraph, descriptions: Dict[str, str],
+                 relation_descriptions: Dict[Tuple[str, str, str], str], sources: Dict[str, List[str]]):
+        self.graph = graph
+        self.index = GraphIndex(graph, descriptions)
+        self.descriptions = descriptions
+        self.relation_descriptions = relation_descriptions
+        self.sources = sources
+        # (图谱ID, 版本)，累积图谱的图谱ID为空字符串
+        self.key: Optional[Tuple[str, int]] = None
+
+
+class ChatService:
+    """基于图谱的对话：倒排索引检索实体 -> 一跳邻居扩展 -> 按预算组装资料 -> 调用Ollama
+
+    发送给模型的只有检索出的子图和少量原文片段，提示词长度由 CHAT_CONTEXT_CHARS 等配置限定，
+    与图谱和网页的大小无关。索引按 (graph_id, 版本) 缓存，累积图谱按版本号缓存。
+    """
+
+    def __init__(self, repository: GraphRepository, store: GraphStore, transport: OllamaTransport,
+                 page_cache: Optional[PageCache] = None, cache_size: int = None):
+        self.repository = repository
+        self.store = store
+        self.transport = transport
+        self.page_cache = page_cache
+        self.cache_size = cache_size or config.CHAT_INDEX_CACHE
+        self.indexes: 'OrderedDict[Tuple[str, int], IndexedGraph]' = OrderedDict()
+        self.lock = threading.Lock()
+        self.usage = TokenUsage()
+
+    def _cached(self, key: Tuple[str, int], build) -> IndexedGraph:
+        with self.lock:
+            indexed = self.indexes.get(key)
+            if indexed is not None:
+                self.indexes.move_to_end(key)
+                return indexed
+        indexed = build()
+        indexed.key = key
+        with self.lock:
+            self.indexes[key] = indexed
+            while len(self.indexes) > self.cache_size:
+                self.indexes.popitem(last=False)
+        return indexed
+
+    def get_index(self, graph_id: Optional[str] = None) -> Optional[IndexedGraph]:
+        """获取已保存图谱（最新版本）或累积图谱的索引，图谱不存在时返回None"""
+        if graph_id is None:
+            return self._cached(('', self.store.version), self._build_merged)
+        meta = self.repository.get_meta(graph_id)
+        if meta is None:
+            return None
+        return self._cached((graph_id, meta['version']), lambda: self._build_stored(meta))
+
+    def _build_stored(self, meta: Dict[str, Any]) -> IndexedGraph:
+        """已保存的图谱只有结构，描述从保存时附带的LLM原始输出中读取"""
+        graph = self.repository.load(meta['graph_id'], meta['version'])
+        raw = self.repository.load_raw(meta['graph_id'], meta['version'])
+        extracted = parse_graph(raw) if raw else {}
+        descriptions, relation_descriptions = self._descriptions(extracted)
+        sources = {node_id: [meta['url']] for node_id in graph.node_ids.values} if meta.get('url') else {}
+        logger.info(f"Indexed graph {meta['graph_id']} v{meta['version']}: {graph.node_count} nodes")
+        return IndexedGraph(graph, descriptions, relation_descriptions, sources)
+
+    def _build_merged(self) -> IndexedGraph:
+        data = self.store.to_graph()
+        graph = CompactGraph.from_entities(data)
+        descriptions, relation_descriptions = self._descriptions(data)
+        sources = {e['id']: e.get('sources') or [] for e in data['entities']}
+        return IndexedGraph(graph, descriptions, relation_descriptions, sources)
+
+    @staticmethod
+    def _descriptions(data: Dict[str, Any]) -> Tuple[Dict[str, str], Dict[Tuple[str, str, str], str]]:
+        descriptions = {
+            str(e['id']): str(e['description']) for e in data.get('entities') or []
+            if isinstance(e, dict) and e.get('id') is not None and e.get('description')
+        }
+        relation_descriptions = {
+            (str(r.get('source')), str(r.get('target')), r.get('type') or ''): str(r['description'])
+            for r in data.get('relationships') or [] if isinstance(r, dict) and r.get('description')
+        }
+        return descriptions, relation_descriptions
+
+    def retrieve(self, question: str, indexed: IndexedGraph) -> ChatContext:
+        """检索与问题相关的子图和原文片段"""
+        with get_metrics().span('retrieve'):
+            graph = indexed.graph
+            seeds = indexed.index.search(question, config.CHAT_SEED_NODES)
+            nodes, edges = indexed.index.expand(seeds, config.CHAT_MAX_NODES, config.CHAT_MAX_EDGES)
+            matched = {index for index, _ in seeds}
+            ids = graph.node_ids.values
+            entities = [{
+                'id': ids[index],
+                'name': graph.labels[index],
+                'type': graph.types.values[graph.node_types[index]],
+                'description': indexed.descriptions.get(ids[index], ''),
+                'matched': index in matched
+            } for index in nodes]
+            relationships = []
+            for edge in edges:
+                source, target = ids[graph.src[edge]], ids[graph.dst[edge]]
+                edge_type = graph.edge_types.values[graph.edge_type[edge]]
+                relationships.append({
+                    'source': graph.labels[graph.src[edge]],
+                    'target': graph.labels[graph.dst[edge]],
+                    'type': edge_type,
+                    'description': indexed.relation_descriptions.get((source, target, edge_type), '')
+                })
+            snippets = self._snippets([e for e in entities if e['matched']], indexed.sources)
+        return ChatContext(entities, relationships, snippets)
+
+    def _snippets(self, entities: List[Dict[str, Any]], sources: Dict[str, List[str]]) -> List[Dict[str, str]]:
+        """从网页缓存中已提取的正文里截取实体名称附近的片段"""
+        if self.page_cache is None:
+            return []
+        snippets = []
+        texts: Dict[str, Optional[str]] = {}
+        radius = config.CHAT_SNIPPET_CHARS // 2
+        for entity in entities:
+            if len(snippets) >= config.CHAT_SNIPPETS:
+                break
+            for url in sources.get(entity['id'], [])[:3]:
+                if url not in texts:
+                    cached = self.page_cache.get_text(url, 'main') or self.page_cache.get_text(url, 'full')
+                    texts[url] = cached['text'] if cached else None
+                text = texts[url]
+                position = text.find(entity['name']) if text else -1
+                if position < 0:
+                    continue
+                start = max(0, position - radius)
+                snippet = ' '.join(text[start:position + len(entity['name']) + radius].split())
+                if all(snippet != s['text'] for s in snippets):
+                    snippets.append({'source': url, 'text': snippet})
+                break
+        return snippets
+
+    def build_request(self, model: str, question: str, context: ChatContext,
+                      history: Optional[List[Dict[str, str]]] = None, stream: bool = False) -> Dict[str, Any]:
+        """构造Ollama generate请求；资料、历史和问题都有长度上限"""
+        system, prompt = CHAT_TEMPLATE.render(
+            context=context.render(config.CHAT_CONTEXT_CHARS),
+            history=self._history(history),
+            question=question[:config.CHAT_QUESTION_CHARS]
+        )
+        return {
+            'model': model,
+            'system': system,
+            'prompt': prompt,
+            'stream': stream,
+            'keep_alive': config.OLLAMA_KEEP_ALIVE,
+            'options': {'temperature': 0.3}
+        }
+
+    @staticmethod
+    def _history(history: Optional[List[Dict[str, str]]]) -> str:
+        """最近几轮对话，每条截断到固定长度"""
+        if not history:
+            return ''
+        lines = []
+        for message in history[-config.CHAT_HISTORY_MESSAGES:]:
+            if not isinstance(message, dict) or not message.get('content'):
+                continue
+            role = '用户' if message.get('role', 'user') == 'user' else '助手'
+            lines.append(f"{role}：{str(message['content'])[:HISTORY_MESSAGE_CHARS]}")
+        return '对话历史：\n' + '\n'.join(lines) + '\n\n' if lines else ''
+
+    def prepare(self, model: str, question: str, graph_id: Optional[str] = None,
+                history: Optional[List[Dict[str, str]]] = None,
+                stream: bool = False) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """检索并构造请求，返回 (请求数据, 引用的实体)；graph_id 不存在时抛出 KeyError"""
+        indexed = self.get_index(graph_id)
+        if indexed is None:
+            raise KeyError(graph_id)
+        context = self.retrieve(question, indexed)
+        return self.build_request(model, question, context, history, stream), context.references()
+
+    def answer(self, payload: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """非流式调用，返回 (回答, token用量)"""
+        try:
+            response = self.transport.post('/api/generate', json={**payload, 'stream': False})
+            response.raise_for_status()
+            result = response.json()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Chat request failed: {str(e)}")
+            raise Exception(f"无法连接到Ollama服务: {str(e)}")
+        return result.get('response', '').strip(), self.usage.record(result, payload['model'])
+
+    def answer_stream(self, payload: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """流式调用，逐块产出Ollama的响应，最后一块带 usage"""
+        try:
+            with self.transport.post('/api/generate', json={**payload, 'stream': True}, stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if 'error' in chunk:
+                        raise ValueError(f"Ollama返回错误: {chunk['error']}")
+                    if chunk.get('done'):
+                        chunk['usage'] = self.usage.record(chunk, payload['model'])
+                        yield chunk
+                        break
+                    yield chunk
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Chat streaming request failed: {str(e)}")
+            raise Exception(f"无法连接到Ollama服务: {str(e)}")
+
+    async def aanswer(self, transport: AsyncOllamaTransport, payload: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """answer 的异步版本"""
+        try:
+            response = await transport.post('/api/generate', json={**payload, 'stream': False})
+            response.raise_for_status()
+            result = response.json()
+        except httpx.HTTPError as e:
+            logger.error(f"Chat request failed: {str(e)}")
+            raise Exception(f"无法连接到Ollama服务: {str(e)}")
+        return result.get('response', '').strip(), self.usage.record(result, payload['model'])
+
+    async def aanswer_stream(self, transport: AsyncOllamaTransport,
+                             payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """answer_stream 的异步版本"""
+        try:
+            async for line in transport.stream_lines('/api/generate', {**payload, 'stream': True}):
+                chunk = json.loads(line)
+                if 'error' in chunk:
+                    raise ValueError(f"Ollama返回错误: {chunk['error']}")
+                if chunk.get('done'):
+                    chunk['usage'] = self.usage.record(chunk, payload['model'])
+                    yield chunk
+                    break
+                yield chunk
+        except httpx.HTTPError as e:
+            logger.error(f"Chat streaming request failed: {str(e)}")
+            raise Exception(f"无法连接到Ollama服务: {str(e)}")
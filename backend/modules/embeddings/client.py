@@ -0,0 +1,222 @@
+import os
+import re
+import struct
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # numpy为可选依赖，未安装时不提供向量功能
+    np = None
+
+import requests
+
+import config
+from modules.cache.llm_cache import DEFAULT_CACHE_DIR
+from modules.metrics.registry import get_metrics
+from modules.ollama.transport import OllamaTransport
+
+logger = logging.getLogger(__name__)
+
+# 文件头：魔数 + 向量维度
+HEADER = struct.Struct('<8sI4x')
+MAGIC = b'GRVEC001'
+
+
+def safe_name(name: str) -> str:
+    """模型名称、图谱ID等转换为可用作文件名的字符串"""
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', name)
+
+
+def text_key(text: str) -> bytes:
+    """文本的缓存键（十六进制SHA-1，不含空字节，可以直接作为定长字符串保存）"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest().encode('ascii')
+
+
+def normalize_rows(vectors: 'np.ndarray') -> 'np.ndarray':
+    """按行归一化为单位向量，之后点积即余弦相似度"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class VectorCache:
+    """按文本哈希保存向量的追加写文件
+
+    每条记录为 (键, 向量) 的定长结构，新向量一次写入追加到文件末尾，读取时用内存映射，
+    重启后不需要把向量读入内存也不需要重新计算。多个进程共用同一文件时，
+    未命中的键会重新映射文件以看到其他进程追加的记录。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.dim: Optional[int] = None
+        self.data: Optional['np.memmap'] = None
+        self.rows: Dict[bytes, int] = {}
+        self.size = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path):
+            self._refresh()
+
+    def _dtype(self, dim: int) -> 'np.dtype':
+        return np.dtype([('key', 'S40'), ('vector', '<f4', (dim,))])
+
+    def _refresh(self) -> None:
+        """重新映射文件，索引新追加的记录；末尾不完整的记录（写入中断）被忽略"""
+        size = os.path.getsize(self.path)
+        if size == self.size or size < HEADER.size:
+            return
+        with open(self.path, 'rb') as f:
+            magic, dim = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"Not a vector cache file: {self.path}")
+        dtype = self._dtype(dim)
+        count = (size - HEADER.size) // dtype.itemsize
+        start = len(self.rows)
+        self.dim = dim
+        self.size = size
+        if count == 0:
+            return
+        self.data = np.memmap(self.path, dtype=dtype, mode='r', offset=HEADER.size, shape=(count,))
+        if count > start:
+            self.rows.update(zip(self.data['key'][start:count].tolist(), range(start, count)))
+
+    def lookup(self, keys: Sequence[bytes]) -> Dict[bytes, int]:
+        """返回已缓存的 键 -> 行号"""
+        with self.lock:
+            if any(key not in self.rows for key in keys) and os.path.exists(self.path):
+                self._refresh()
+            return {key: self.rows[key] for key in keys if key in self.rows}
+
+    def vectors(self, rows: Sequence[int]) -> 'np.ndarray':
+        with self.lock:
+            return np.asarray(self.data['vector'][np.asarray(rows, dtype=np.int64)], dtype=np.float32)
+
+    def add(self, keys: Sequence[bytes], vectors: 'np.ndarray') -> None:
+        """追加向量，维度与文件中已有的不同时抛出ValueError"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dim = vectors.shape[1]
+        with self.lock:
+            if os.path.exists(self.path):
+                self._refresh()
+            if self.dim is not None and self.dim != dim:
+                raise ValueError(f"Embedding dimension changed from {self.dim} to {dim}: {self.path}")
+            dtype = self._dtype(dim)
+            records = np.empty(len(keys), dtype=dtype)
+            records['key'] = list(keys)
+            records['vector'] = vectors
+            with open(self.path, 'ab') as f:
+                if f.tell() == 0:
+                    f.write(HEADER.pack(MAGIC, dim))
+                else:
+                    # 截掉上次写入中断留下的不完整记录，保证新记录对齐
+                    complete = HEADER.size + (f.tell() - HEADER.size) // dtype.itemsize * dtype.itemsize
+                    if complete != f.tell():
+                        f.truncate(complete)
+                f.write(records.tobytes())
+            self._refresh()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+class EmbeddingClient:
+    """通过Ollama的 /api/embed 接口计算文本向量
+
+    输入去重后按 batch_size 分批请求，结果归一化后写入按模型区分的 VectorCache，
+    同一文本只计算一次。
+    """
+
+    def __init__(self, transport: OllamaTransport, model: str = None, batch_size: int = None,
+                 cache_dir: Optional[str] = None):
+        self.transport = transport
+        self.model = model or config.EMBEDDING_MODEL
+        self.batch_size = batch_size or config.EMBEDDING_BATCH_SIZE
+        self.cache_dir = cache_dir or os.path.join(
+            os.environ.get('GRAPHRAGER_CACHE_DIR', DEFAULT_CACHE_DIR), 'embeddings')
+        self.caches: Dict[str, VectorCache] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def available() -> bool:
+        return np is not None
+
+    def cache_for(self, model: str) -> VectorCache:
+        with self.lock:
+            cache = self.caches.get(model)
+            if cache is None:
+                cache = VectorCache(os.path.join(self.cache_dir, f'{safe_name(model)}.vec'))
+                self.caches[model] = cache
+            return cache
+
+    def embed(self, texts: Sequence[str], model: Optional[str] = None) -> 'np.ndarray':
+        """返回 (文本数, 维度) 的单位向量矩阵，与输入顺序一致"""
+        if np is None:
+            raise RuntimeError("numpy is required for embeddings")
+        model = model or self.model
+        cache = self.cache_for(model)
+        keys = [text_key(text) for text in texts]
+        found = cache.lookup(keys)
+
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        with self.lock:
+            self.hits += len(keys) - sum(1 for key in keys if key in missing)
+            self.misses += len(missing)
+
+        if missing:
+            pending = list(missing.items())
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+                with get_metrics().span('embed'):
+                    vectors = self._request(model, [text for _, text in batch])
+                cache.add([key for key, _ in batch], normalize_rows(vectors))
+            found = cache.lookup(keys)
+
+        if not keys:
+            return np.zeros((0, cache.dim or 0), dtype=np.float32)
+        return cache.vectors([found[key] for key in keys])
+
+    def embed_one(self, text: str, model: Optional[str] = None) -> 'np.ndarray':
+        return self.embed([text], model)[0]
+
+    def _request(self, model: str, texts: List[str]) -> 'np.ndarray':
+        """一次请求计算一批文本的向量；旧版Ollama没有 /api/embed 时逐条调用 /api/embeddings"""
+        try:
+            response = self.transport.post('/api/embed', json={
+                'model': model,
+                'input': texts,
+                'keep_alive': config.OLLAMA_KEEP_ALIVE
+            })
+            if response.status_code == 404 and 'model' not in response.text.lower():
+                return np.array([self._request_legacy(model, text) for text in texts], dtype=np.float32)
+            response.raise_for_status()
+            embeddings = response.json().get('embeddings') or []
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Embedding request failed: {str(e)}")
+            raise Exception(f"无法连接到Ollama服务: {str(e)}")
+        if len(embeddings) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+        logger.info(f"Embedded {len(texts)} texts with model {model}")
+        return np.array(embeddings, dtype=np.float32)
+
+    def _request_legacy(self, model: str, text: str) -> List[float]:
+        response = self.transport.post('/api/embeddings', json={'model': model, 'prompt': text})
+        response.raise_for_status()
+        return response.json()['embedding']
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': sum(len(cache) for cache in self.caches.values())
+            }
@@ -0,0 +1,238 @@
+import os
+import json
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy为可选依赖，未安装时不提供向量功能
+    np = None
+
+from modules.embeddings.client import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+FLAT = 'flat'
+IVF = 'ivf'
+# 分块计算相似度时每块得分矩阵的最大元素数，限制内存占用
+BLOCK_ELEMENTS = 1 << 24
+
+
+def _top_k(scores: 'np.ndarray', k: int) -> Tuple['np.ndarray', 'np.ndarray']:
+    """每行得分最高的k个 (下标, 得分)，按得分从高到低排列"""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        empty = np.zeros((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1)
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+
+def quantize(vectors: 'np.ndarray') -> Tuple['np.ndarray', 'np.ndarray']:
+    """逐向量的int8标量量化，返回 (码, 缩放系数)，内存为float32的1/4"""
+    scale = np.abs(vectors).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    codes = np.round(vectors / scale[:, None]).astype(np.int8)
+    return codes, scale.astype(np.float32)
+
+
+def kmeans(vectors: 'np.ndarray', k: int, iterations: int = 10, seed: int = 42,
+           sample_size: int = 256) -> 'np.ndarray':
+    """球面k-means（余弦距离），只用每个簇 sample_size 个样本训练，返回单位向量质心"""
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    sample = vectors[rng.choice(n, min(n, k * sample_size), replace=False)] if n > k * sample_size else vectors
+    centroids = np.array(sample[rng.choice(len(sample), k, replace=False)], dtype=np.float32)
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        counts = np.bincount(assignment, minlength=k)
+        empty = counts == 0
+        # 按簇排序后分段求和，比 np.add.at 快得多
+        starts = np.cumsum(counts) - counts
+        sums = np.zeros_like(centroids)
+        sums[~empty] = np.add.reduceat(sample[np.argsort(assignment, kind='stable')], starts[~empty])
+        # 空簇重新随机取一个样本
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class VectorIndex:
+    """基于NumPy的向量索引，按余弦相似度查询最近邻
+
+    flat 模式把所有查询分块与全部向量做矩阵乘法，结果精确；ivf 模式先用k-means把向量
+    分成约 sqrt(N) 个簇，查询时只比较最近的 nprobe 个簇，适合大图谱。quantized 为真时
+    向量以int8保存，得分为近似值。索引可以保存到目录，加载时以内存映射方式打开。
+    """
+
+    def __init__(self, vectors: 'np.ndarray', ids: Sequence[str], mode: str = 'auto',
+                 nlist: Optional[int] = None, nprobe: int = 8, quantized: bool = False,
+                 ivf_min_size: int = 50000):
+        if np is None:
+            raise RuntimeError("numpy is required for the vector index")
+        vectors = normalize_rows(vectors)
+        if len(vectors) != len(ids):
+            raise ValueError("vectors and ids must have the same length")
+        self.ids = list(ids)
+        self.dim = vectors.shape[1] if vectors.ndim == 2 else 0
+        self.nprobe = nprobe
+        self.mode = mode if mode != 'auto' else (IVF if len(vectors) >= ivf_min_size else FLAT)
+        self.centroids: Optional['np.ndarray'] = None
+        self.offsets: Optional['np.ndarray'] = None
+        # 向量在索引中的存放顺序 -> 原始下标；ivf模式下同一个簇的向量连续存放
+        self.order = np.arange(len(vectors))
+
+        if self.mode == IVF and len(vectors):
+            nlist = nlist or max(1, int(np.sqrt(len(vectors))))
+            self.centroids = kmeans(vectors, min(nlist, len(vectors)))
+            assignment = self._assign(vectors)
+            self.order = np.argsort(assignment, kind='stable')
+            self.offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=len(self.centroids)))))
+            vectors = vectors[self.order]
+
+        self.quantized = quantized
+        if quantized:
+            self.vectors, self.scale = quantize(vectors)
+        else:
+            self.vectors, self.scale = vectors, None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _assign(self, vectors: 'np.ndarray') -> 'np.ndarray':
+        step = max(1, BLOCK_ELEMENTS // max(1, len(self.centroids)))
+        return np.concatenate([np.argmax(vectors[i:i + step] @ self.centroids.T, axis=1)
+                               for i in range(0, len(vectors), step)])
+
+    def _scores(self, queries: 'np.ndarray', start: int, end: int) -> 'np.ndarray':
+        block = self.vectors[start:end]
+        if self.quantized:
+            return (queries @ block.T.astype(np.float32)) * self.scale[start:end]
+        return queries @ block.T
+
+    def search(self, queries: 'np.ndarray', k: int = 10,
+               exclude_self: bool = False) -> List[List[Tuple[str, float]]]:
+        """批量查询，返回每个查询的 [(ID, 相似度)]
+
+        exclude_self 为真时第i个查询应为索引中的第i个向量，结果中去掉它自身。
+        """
+        queries = normalize_rows(np.atleast_2d(queries))
+        if not len(self) or not len(queries):
+            return [[] for _ in range(len(queries))]
+        # 以索引内的向量查询时多取一个，去掉向量自身
+        extra = 1 if exclude_self else 0
+        if self.mode == IVF:
+            indices, scores = self._search_ivf(queries, k + extra)
+        else:
+            indices, scores = self._search_flat(queries, k + extra)
+
+        results = []
+        for row, (row_indices, row_scores) in enumerate(zip(indices, scores)):
+            hits = [(self.ids[i], float(s)) for i, s in zip(row_indices, row_scores)
+                    if i >= 0 and not (exclude_self and i == row)]
+            results.append(hits[:k])
+        return results
+
+    def _search_flat(self, queries: 'np.ndarray', k: int) -> Tuple['np.ndarray', 'np.ndarray']:
+        n = len(self.vectors)
+        query_step = max(1, BLOCK_ELEMENTS // n)
+        all_indices, all_scores = [], []
+        for q in range(0, len(queries), query_step):
+            scores = self._scores(queries[q:q + query_step], 0, n)
+            indices, top_scores = _top_k(scores, k)
+            all_indices.append(self.order[indices])
+            all_scores.append(top_scores)
+        return np.concatenate(all_indices), np.concatenate(all_scores)
+
+    def _search_ivf(self, queries: 'np.ndarray', k: int) -> Tuple['np.ndarray', 'np.ndarray']:
+        """按簇处理：每个簇与探查到它的所有查询做一次矩阵乘法，再与已有结果合并取前k个"""
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes, _ = _top_k(queries @ self.centroids.T, nprobe)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        flat_probes = probes.ravel()
+        by_cluster = np.argsort(flat_probes, kind='stable')
+        bounds = np.searchsorted(flat_probes[by_cluster], np.arange(len(self.centroids) + 1))
+        for cluster in range(len(self.centroids)):
+            start, end = self.offsets[cluster], self.offsets[cluster + 1]
+            if start == end or bounds[cluster] == bounds[cluster + 1]:
+                continue
+            rows = by_cluster[bounds[cluster]:bounds[cluster + 1]] // nprobe
+            block_indices, block_scores = _top_k(self._scores(queries[rows], start, end), k)
+            merged_indices = np.concatenate((indices[rows], self.order[block_indices + start]), axis=1)
+            merged_scores = np.concatenate((scores[rows], block_scores.astype(np.float32)), axis=1)
+            top, top_scores = _top_k(merged_scores, k)
+            indices[rows] = np.take_along_axis(merged_indices, top, axis=1)
+            scores[rows] = top_scores
+        return indices, scores
+
+    def save(self, directory: str) -> None:
+        """保存到目录：向量为 .npy（可内存映射），ID和参数为JSON"""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'vectors.npy'), self.vectors)
+        np.save(os.path.join(directory, 'order.npy'), self.order)
+        if self.scale is not None:
+            np.save(os.path.join(directory, 'scale.npy'), self.scale)
+        if self.centroids is not None:
+            np.save(os.path.join(directory, 'centroids.npy'), self.centroids)
+            np.save(os.path.join(directory, 'offsets.npy'), self.offsets)
+        meta = {'mode': self.mode, 'dim': self.dim, 'nprobe': self.nprobe, 'quantized': self.quantized}
+        tmp_path = os.path.join(directory, 'index.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({**meta, 'ids': self.ids}, f, ensure_ascii=False)
+        # 元数据最后写入，目录中存在 index.json 即表示索引完整
+        os.replace(tmp_path, os.path.join(directory, 'index.json'))
+
+    @classmethod
+    def load(cls, directory: str) -> Optional['VectorIndex']:
+        """加载保存的索引，向量以只读内存映射方式打开；索引不存在时返回None"""
+        meta_path = os.path.join(directory, 'index.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        index = cls.__new__(cls)
+        index.ids = meta['ids']
+        index.dim = meta['dim']
+        index.mode = meta['mode']
+        index.nprobe = meta['nprobe']
+        index.quantized = meta['quantized']
+        index.vectors = np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r')
+        index.order = np.load(os.path.join(directory, 'order.npy'))
+        index.scale = np.load(os.path.join(directory, 'scale.npy')) if index.quantized else None
+        if index.mode == IVF:
+            index.centroids = np.load(os.path.join(directory, 'centroids.npy'))
+            index.offsets = np.load(os.path.join(directory, 'offsets.npy'))
+        else:
+            index.centroids = index.offsets = None
+        return index
+
+
+def near_duplicates(vectors: 'np.ndarray', threshold: float, groups: Optional[Sequence[str]] = None,
+                    k: int = 5, **index_options) -> List[Tuple[int, int, float]]:
+    """找出相似度不低于 threshold 的向量对 (i, j, 相似度)，i < j；给出 groups 时只比较同组的向量"""
+    if np is None:
+        raise RuntimeError("numpy is required for the vector index")
+    vectors = np.asarray(vectors, dtype=np.float32)
+    members: dict = {}
+    for i, group in enumerate(groups if groups is not None else [''] * len(vectors)):
+        members.setdefault(group, []).append(i)
+
+    pairs = {}
+    for rows in members.values():
+        if len(rows) < 2:
+            continue
+        index = VectorIndex(vectors[rows], [str(i) for i in range(len(rows))], **index_options)
+        for a, hits in enumerate(index.search(vectors[rows], k, exclude_self=True)):
+            for b, score in hits:
+                b = int(b)
+                if score < threshold or a == b:
+                    continue
+                i, j = sorted((rows[a], rows[b]))
+                pairs[(i, j)] = max(score, pairs.get((i, j), score))
+    return sorted(((i, j, score) for (i, j), score in pairs.items()), key=lambda pair: -pair[2])
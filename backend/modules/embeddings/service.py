@@ -0,0 +1,157 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import config
+from modules.chat.service import ChatService, IndexedGraph
+from modules.embeddings.client import EmbeddingClient, safe_name
+from modules.embeddings.index import VectorIndex, near_duplicates
+from modules.graph_generator.store import GraphStore
+from modules.metrics.registry import get_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def entity_text(name: str, description: str = '') -> str:
+    """语义检索时实体的向量文本：名称加描述"""
+    return f"{name}：{description}" if description else name
+
+
+class SemanticSearch:
+    """基于向量的实体去重和语义检索
+
+    图谱及其描述复用对话服务的检索索引缓存；实体向量由 EmbeddingClient 计算并缓存，
+    向量索引按 (图谱ID, 版本, 模型) 缓存在内存中，已保存图谱的索引同时写入磁盘，
+    重启后以内存映射方式加载，不需要重新计算向量或重新训练聚类。
+    """
+
+    def __init__(self, embedder: EmbeddingClient, chat_service: ChatService, directory: Optional[str] = None,
+                 cache_size: int = None):
+        self.embedder = embedder
+        self.chat_service = chat_service
+        self.directory = directory or os.path.join(embedder.cache_dir, 'indexes')
+        self.cache_size = cache_size or config.CHAT_INDEX_CACHE
+        self.indexes: 'OrderedDict[Tuple[str, int, str], VectorIndex]' = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _build(self, indexed: IndexedGraph, model: str) -> VectorIndex:
+        graph = indexed.graph
+        ids = graph.node_ids.values
+        texts = [entity_text(graph.labels[i], indexed.descriptions.get(node_id, '')) for i, node_id in enumerate(ids)]
+        vectors = self.embedder.embed(texts, model)
+        with get_metrics().span('vector_index'):
+            return VectorIndex(vectors, ids, nprobe=config.VECTOR_NPROBE, quantized=config.VECTOR_QUANTIZE,
+                               ivf_min_size=config.VECTOR_IVF_MIN_SIZE)
+
+    def index_for(self, indexed: IndexedGraph, model: Optional[str] = None) -> VectorIndex:
+        """获取图谱的向量索引，已保存图谱优先从磁盘加载"""
+        model = model or self.embedder.model
+        graph_id, version = indexed.key
+        key = (graph_id, version, model)
+        with self.lock:
+            index = self.indexes.get(key)
+            if index is not None:
+                self.indexes.move_to_end(key)
+                return index
+
+        # 累积图谱经常变化，只在内存中缓存
+        path = os.path.join(self.directory, safe_name(graph_id), f'v{version}-{safe_name(model)}') if graph_id else None
+        index = VectorIndex.load(path) if path else None
+        if index is None:
+            index = self._build(indexed, model)
+            if path:
+                index.save(path)
+                logger.info(f"Saved vector index for graph {graph_id} v{version}: {len(index)} vectors")
+
+        with self.lock:
+            self.indexes[key] = index
+            while len(self.indexes) > self.cache_size:
+                self.indexes.popitem(last=False)
+        return index
+
+    def related(self, graph_id: Optional[str] = None, query: Optional[str] = None, node_id: Optional[str] = None,
+                k: int = 10, model: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按问题文本或已有节点查找语义相近的实体；图谱或节点不存在时抛出 KeyError"""
+        indexed = self.chat_service.get_index(graph_id)
+        if indexed is None:
+            raise KeyError(graph_id)
+        graph = indexed.graph
+        if node_id is not None:
+            row = graph.node_ids.get(node_id)
+            if row is None:
+                raise KeyError(node_id)
+            text = entity_text(graph.labels[row], indexed.descriptions.get(node_id, ''))
+        else:
+            text = query
+
+        index = self.index_for(indexed, model)
+        vector = self.embedder.embed_one(text, model)
+        with get_metrics().span('vector_search'):
+            hits = index.search(vector, k + (1 if node_id is not None else 0))[0]
+        results = []
+        for hit_id, score in hits:
+            if hit_id == node_id:
+                continue
+            row = graph.node_ids.get(hit_id)
+            results.append({
+                'id': hit_id,
+                'name': graph.labels[row],
+                'type': graph.types.values[graph.node_types[row]],
+                'score': score
+            })
+        return results[:k]
+
+    def find_duplicates(self, store: GraphStore, threshold: Optional[float] = None,
+                        model: Optional[str] = None) -> List[Dict[str, Any]]:
+        """找出累积图谱中名称语义相近的同类型实体，返回 [{keep, drop, score, ...}]
+
+        提及次数多的节点优先作为保留节点，与它相似度不低于阈值的节点并入，不按传递关系扩展。
+        """
+        threshold = threshold if threshold is not None else config.EMBEDDING_DEDUP_THRESHOLD
+        with store.lock:
+            nodes = [dict(node) for node in store.nodes.values()]
+        if len(nodes) < 2:
+            return []
+        # 去重只比较名称，描述的差异不应影响判断
+        vectors = self.embedder.embed([str(node['name']) for node in nodes], model)
+        with get_metrics().span('dedup'):
+            pairs = near_duplicates(vectors, threshold, groups=[node.get('type', '') for node in nodes],
+                                    nprobe=config.VECTOR_NPROBE, ivf_min_size=config.VECTOR_IVF_MIN_SIZE)
+
+        neighbors: Dict[int, Dict[int, float]] = {}
+        for i, j, score in pairs:
+            neighbors.setdefault(i, {})[j] = score
+            neighbors.setdefault(j, {})[i] = score
+
+        # 按提及次数从多到少选出保留节点，只有与保留节点本身相似度达到阈值的节点才并入该组，
+        # A~B、B~C 不会让相似度低于阈值的 A 和 C 合并
+        keep_of: Dict[int, int] = {}
+        merges = []
+        for i in sorted(neighbors, key=lambda n: (-nodes[n]['mentions'], n)):
+            if i in keep_of:
+                continue
+            keep_of[i] = i
+            for j, score in sorted(neighbors[i].items(), key=lambda item: (-item[1], item[0])):
+                if j in keep_of:
+                    continue
+                keep_of[j] = i
+                merges.append({
+                    'keep': nodes[i]['id'],
+                    'keep_name': nodes[i]['name'],
+                    'drop': nodes[j]['id'],
+                    'drop_name': nodes[j]['name'],
+                    'type': nodes[j].get('type', ''),
+                    'score': score
+                })
+        return merges
+
+    def dedupe(self, store: GraphStore, threshold: Optional[float] = None, model: Optional[str] = None,
+               dry_run: bool = False) -> List[Dict[str, Any]]:
+        """合并累积图谱中的近似重复实体，dry_run 为真时只返回将要合并的实体"""
+        merges = self.find_duplicates(store, threshold, model)
+        if merges and not dry_run:
+            store.merge_nodes({merge['drop']: merge['keep'] for merge in merges})
+            logger.info(f"Merged {len(merges)} near-duplicate entities")
+        return merges
@@ -0,0 +1,327 @@
+from array import array
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from modules.graph_generator.store import ENTITY_KEYS, RELATIONSHIP_KEYS
+
+# 边样式查找表，所有边共享，不再在每条边上重复存储
+DEFAULT_EDGE_STYLE = {'arrows': 'to', 'color': {'color': '#999'}}
+
+
+def _text(value: Any) -> str:
+    """外部传入的分组/类型/URL等字段转为字符串，None 视为空；列表、字典等不可哈希的值无法驻留"""
+    if value is None:
+        return ''
+    return value if isinstance(value, str) else str(value)
+
+
+class Interner:
+    """字符串 -> 连续整数编号
+
+    也可以包装一个只读的字符串序列（如内存映射的 StringColumn），反向索引在首次查询时才建立。
+    """
+
+    def __init__(self, values: Optional[Sequence[str]] = None):
+        self.values = values if values is not None else []
+        self._index: Optional[Dict[str, int]] = None if values is not None else {}
+
+    @property
+    def index(self) -> Dict[str, int]:
+        if self._index is None:
+            self._index = {value: i for i, value in enumerate(self.values)}
+        return self._index
+
+    def intern(self, value: str) -> int:
+        code = self.index.get(value)
+        if code is None:
+            code = len(self.values)
+            self.index[value] = code
+            self.values.append(value)
+        return code
+
+    def get(self, value: str) -> Optional[int]:
+        return self.index.get(value)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class StringColumn(Sequence):
+    """UTF-8字节块 + 偏移量表示的只读字符串列，访问时才解码"""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return max(len(self.offsets) - 1, 0)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return bytes(self.data[self.offsets[index]:self.offsets[index + 1]]).decode('utf-8')
+
+
+class PointColumn(Sequence):
+    """交替存储 x、y 的只读坐标列"""
+
+    def __init__(self, values):
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.values) // 2
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.values[2 * index], self.values[2 * index + 1]
+
+
+class CompactGraph:
+    """数组存储的紧凑图谱
+
+    节点ID映射为整数下标，节点属性按列存储；边只保存 (起点, 终点, 类型编号, 样式编号)
+    四个整数数组，类型名称和样式放在查找表中。出边/入边使用CSR邻接数组，
+    邻居查询的开销与节点度数成正比。只在接口边界上转换为vis.js的 nodes/edges 格式。
+    """
+
+    def __init__(self):
+        self.node_ids = Interner()
+        self.labels: List[str] = []
+        self.groups = Interner()
+        self.node_groups = array('H')
+        self.types = Interner()
+        self.node_types = array('H')
+        # 来源URL通常被大量节点共享，同样做字符串驻留
+        self.urls = Interner()
+        self.node_urls = array('i')
+
+        self.edge_types = Interner()
+        self.edge_styles: List[Dict[str, Any]] = [DEFAULT_EDGE_STYLE]
+        self.src = array('i')
+        self.dst = array('i')
+        self.edge_type = array('I')
+        self.edge_style = array('B')
+
+        # 节点坐标（服务端布局后填充）
+        self.positions: Optional[List[Tuple[float, float]]] = None
+        self._csr: Optional[Tuple[array, array, array, array]] = None
+
+    @property
+    def node_count(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.src)
+
+    def add_node(self, node_id: str, label: Optional[str] = None, group: str = 'default',
+                 node_type: str = '', url: str = '') -> int:
+        """添加节点，ID已存在时保留原有节点，返回节点下标"""
+        index = self.node_ids.get(node_id)
+        if index is not None:
+            return index
+        index = self.node_ids.intern(node_id)
+        self.labels.append(label if label is not None else node_id)
+        self.node_groups.append(self.groups.intern(group or 'default'))
+        self.node_types.append(self.types.intern(node_type or ''))
+        self.node_urls.append(self.urls.intern(url) if url else -1)
+        self._csr = None
+        return index
+
+    def add_edge(self, source: str, target: str, label: str = '', style: int = 0) -> bool:
+        """添加边，端点不存在时忽略"""
+        s = self.node_ids.get(source)
+        t = self.node_ids.get(target)
+        if s is None or t is None:
+            return False
+        self.src.append(s)
+        self.dst.append(t)
+        self.edge_type.append(self.edge_types.intern(label or ''))
+        self.edge_style.append(style)
+        self._csr = None
+        return True
+
+    @classmethod
+    def from_nodes_edges(cls, nodes: Iterable[Dict], edges: Iterable[Dict]) -> 'CompactGraph':
+        """从 nodes/edges（source/target 或 from/to）构建，缺少ID或ID不是字符串/整数的节点被忽略
+
+        分组、类型、URL 和边类型统一转为字符串。
+        """
+        graph = cls()
+        positions = []
+        for node in nodes:
+            if not isinstance(node, dict) or not isinstance(node.get('id'), (str, int)) \
+                    or graph.node_ids.get(node['id']) is not None:
+                continue
+            graph.add_node(node['id'], node.get('label', node['id']), _text(node.get('group')),
+                           _text(node.get('type')), _text(node.get('url')))
+            if positions is not None and isinstance(node.get('x'), (int, float)) and isinstance(node.get('y'), (int, float)):
+                positions.append((node['x'], node['y']))
+            else:
+                positions = None
+        # 所有节点都带坐标时保留布局
+        if positions:
+            graph.positions = positions
+        for edge in edges:
+            if not isinstance(edge, dict):
+                continue
+            source, target = edge.get('source', edge.get('from')), edge.get('target', edge.get('to'))
+            if isinstance(source, (str, int)) and isinstance(target, (str, int)):
+                graph.add_edge(source, target, _text(edge.get('type', edge.get('label'))))
+        return graph
+
+    @classmethod
+    def from_entities(cls, graph: Dict, max_nodes: Optional[int] = None) -> 'CompactGraph':
+        """从 entities/relationships（或 nodes/edges）格式的抽取结果构建"""
+        entities = next((graph[k] for k in ENTITY_KEYS if isinstance(graph.get(k), list)), [])
+        relationships = next((graph[k] for k in RELATIONSHIP_KEYS if isinstance(graph.get(k), list)), [])
+        if max_nodes is not None:
+            entities = entities[:max_nodes]
+        compact = cls()
+        for entity in entities:
+            if not isinstance(entity, dict) or entity.get('id') is None:
+                continue
+            node_id = str(entity['id'])
+            node_type = _text(entity.get('type'))
+            compact.add_node(node_id, str(entity.get('name') or entity.get('label') or node_id),
+                             node_type or 'default', node_type, _text(entity.get('url')))
+        for rel in relationships:
+            if not isinstance(rel, dict):
+                continue
+            compact.add_edge(str(rel.get('source', rel.get('from'))), str(rel.get('target', rel.get('to'))),
+                             _text(rel.get('type', rel.get('label'))))
+        return compact
+
+    def to_entities(self) -> Dict[str, List[Dict[str, Any]]]:
+        """转换回 entities/relationships 格式"""
+        entities = []
+        for i, node_id in enumerate(self.node_ids.values):
+            entity = {'id': node_id, 'name': self.labels[i], 'type': self.types.values[self.node_types[i]]}
+            if self.node_urls[i] >= 0:
+                entity['url'] = self.urls.values[self.node_urls[i]]
+            entities.append(entity)
+        ids = self.node_ids.values
+        relationships = [{
+            'source': ids[self.src[e]],
+            'target': ids[self.dst[e]],
+            'type': self.edge_types.values[self.edge_type[e]]
+        } for e in range(self.edge_count)]
+        return {'entities': entities, 'relationships': relationships}
+
+    def degrees(self) -> List[int]:
+        """各节点的度数（出度 + 入度）"""
+        out_offsets, _, in_offsets, _ = self.csr
+        return [out_offsets[i + 1] - out_offsets[i] + in_offsets[i + 1] - in_offsets[i]
+                for i in range(self.node_count)]
+
+    def _build_csr(self) -> Tuple[array, array, array, array]:
+        """计数排序构建出边和入边的CSR数组：offsets[i]..offsets[i+1] 为节点i的边编号区间"""
+        n, m = self.node_count, self.edge_count
+        result = []
+        for keys in (self.src, self.dst):
+            offsets = array('i', [0] * (n + 1))
+            for k in keys:
+                offsets[k + 1] += 1
+            for i in range(n):
+                offsets[i + 1] += offsets[i]
+            cursor = array('i', offsets)
+            edge_ids = array('i', [0] * m)
+            for e, k in enumerate(keys):
+                edge_ids[cursor[k]] = e
+                cursor[k] += 1
+            result.extend((offsets, edge_ids))
+        return tuple(result)
+
+    @property
+    def csr(self) -> Tuple[array, array, array, array]:
+        """(出边offsets, 出边编号, 入边offsets, 入边编号)，按需构建并缓存"""
+        if self._csr is None:
+            self._csr = self._build_csr()
+        return self._csr
+
+    def out_edges(self, index: int) -> array:
+        out_offsets, out_ids, _, _ = self.csr
+        return out_ids[out_offsets[index]:out_offsets[index + 1]]
+
+    def in_edges(self, index: int) -> array:
+        _, _, in_offsets, in_ids = self.csr
+        return in_ids[in_offsets[index]:in_offsets[index + 1]]
+
+    def neighbors(self, node_id: str) -> List[str]:
+        """相邻节点ID（出边和入边），开销与节点度数成正比"""
+        index = self.node_ids.get(node_id)
+        if index is None:
+            return []
+        seen = {}
+        for e in self.out_edges(index):
+            seen.setdefault(self.dst[e], None)
+        for e in self.in_edges(index):
+            seen.setdefault(self.src[e], None)
+        return [self.node_ids.values[i] for i in seen]
+
+    def degree(self, node_id: str) -> int:
+        index = self.node_ids.get(node_id)
+        if index is None:
+            return 0
+        out_offsets, _, in_offsets, _ = self.csr
+        return (out_offsets[index + 1] - out_offsets[index]) + (in_offsets[index + 1] - in_offsets[index])
+
+    def edge_pairs(self) -> List[Tuple[int, int]]:
+        return list(zip(self.src, self.dst))
+
+    def memory_bytes(self) -> int:
+        """数组部分占用的字节数（不含字符串查找表）"""
+        arrays = [self.node_groups, self.node_types, self.node_urls, self.src, self.dst,
+                  self.edge_type, self.edge_style]
+        if self._csr is not None:
+            arrays.extend(self._csr)
+        return sum(a.itemsize * len(a) for a in arrays)
+
+    def iter_nodes(self) -> Iterator[Dict[str, Any]]:
+        """逐个生成vis.js格式的节点"""
+        for i, node_id in enumerate(self.node_ids.values):
+            node = {
+                'id': node_id,
+                'label': self.labels[i],
+                'group': self.groups.values[self.node_groups[i]]
+            }
+            # 保留可选的类型和来源信息
+            node_type = self.types.values[self.node_types[i]]
+            if node_type:
+                node['type'] = node_type
+            if self.node_urls[i] >= 0:
+                node['url'] = self.urls.values[self.node_urls[i]]
+            if self.positions is not None:
+                node['x'] = round(self.positions[i][0], 2)
+                node['y'] = round(self.positions[i][1], 2)
+            yield node
+
+    def iter_edges(self, styled: bool = True) -> Iterator[Dict[str, Any]]:
+        """逐个生成vis.js格式的边，styled为False时不展开样式查找表"""
+        ids = self.node_ids.values
+        type_names = self.edge_types.values
+        for e in range(self.edge_count):
+            edge = {
+                'id': f'e{e}',
+                'from': ids[self.src[e]],
+                'to': ids[self.dst[e]],
+                'label': type_names[self.edge_type[e]]
+            }
+            if styled:
+                edge.update(self.edge_styles[self.edge_style[e]])
+            elif self.edge_style[e]:
+                edge['style'] = self.edge_style[e]
+            yield edge
+
+    def to_vis(self) -> Dict[str, List[Dict]]:
+        """转换为vis.js使用的 nodes/edges 格式"""
+        return {'nodes': list(self.iter_nodes()), 'edges': list(self.iter_edges())}
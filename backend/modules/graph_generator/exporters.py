@@ -0,0 +1,316 @@
+import csv
+import io
+import json
+import struct
+import tempfile
+import zipfile
+import zlib
+from typing import Callable, Dict, Iterable, Iterator, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+from modules.graph_generator.compact import CompactGraph
+
+try:
+    import numpy as np
+except ImportError:  # numpy为可选依赖，仅npz格式需要
+    np = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack为可选依赖
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard为可选依赖
+    zstandard = None
+
+# 每累积这么多条记录输出一次，避免逐条产生过多小块
+BATCH_SIZE = 1000
+# npz先写入临时文件，超过该大小才落盘
+SPOOL_SIZE = 8 * 1024 * 1024
+READ_SIZE = 64 * 1024
+
+COMPACT_SEPARATORS = (',', ':')
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=COMPACT_SEPARATORS)
+
+
+def _json_array(items: Iterable) -> Iterator[str]:
+    """逐批输出JSON数组"""
+    yield '['
+    batch = []
+    first = True
+    for item in items:
+        batch.append(_dumps(item))
+        if len(batch) >= BATCH_SIZE:
+            yield ('' if first else ',') + ','.join(batch)
+            first = False
+            batch = []
+    if batch:
+        yield ('' if first else ',') + ','.join(batch)
+    yield ']'
+
+
+def _encode(chunks: Iterable[str]) -> Iterator[bytes]:
+    for chunk in chunks:
+        yield chunk.encode('utf-8')
+
+
+def iter_json_text(graph: CompactGraph) -> Iterator[str]:
+    """紧凑JSON：边不展开样式，样式查找表只输出一次"""
+    yield '{"nodes":'
+    yield from _json_array(graph.iter_nodes())
+    yield ',"edges":'
+    yield from _json_array(graph.iter_edges(styled=False))
+    yield ',"edge_styles":' + _dumps(graph.edge_styles) + '}'
+
+
+def iter_json(graph: CompactGraph, **options) -> Iterator[bytes]:
+    return _encode(iter_json_text(graph))
+
+
+def iter_gzip(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """流式gzip压缩"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_zstd(chunks: Iterable[bytes], level: int = 3) -> Iterator[bytes]:
+    """流式zstd压缩"""
+    if zstandard is None:
+        raise ValueError("zstd export requires the zstandard package")
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_msgpack(graph: CompactGraph, **options) -> Iterator[bytes]:
+    """MessagePack：先写数组长度头，再逐个写入节点和边"""
+    if msgpack is None:
+        raise ValueError("MessagePack export requires the msgpack package")
+    packer = msgpack.Packer(use_bin_type=True)
+    yield packer.pack_map_header(3)
+    for key, count, items in (('nodes', graph.node_count, graph.iter_nodes()),
+                              ('edges', graph.edge_count, graph.iter_edges(styled=False))):
+        buffer = [packer.pack(key), packer.pack_array_header(count)]
+        for item in items:
+            buffer.append(packer.pack(item))
+            if len(buffer) >= BATCH_SIZE:
+                yield b''.join(buffer)
+                buffer = []
+        yield b''.join(buffer)
+    yield packer.pack('edge_styles') + packer.pack(graph.edge_styles)
+
+
+def iter_graphml(graph: CompactGraph, **options) -> Iterator[bytes]:
+    """GraphML，逐批写出节点和边"""
+    def chunks() -> Iterator[str]:
+        yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+               '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+               '<key id="label" for="node" attr.name="label" attr.type="string"/>\n'
+               '<key id="group" for="node" attr.name="group" attr.type="string"/>\n'
+               '<key id="type" for="node" attr.name="type" attr.type="string"/>\n'
+               '<key id="url" for="node" attr.name="url" attr.type="string"/>\n'
+               '<key id="x" for="node" attr.name="x" attr.type="double"/>\n'
+               '<key id="y" for="node" attr.name="y" attr.type="double"/>\n'
+               '<key id="relation" for="edge" attr.name="label" attr.type="string"/>\n'
+               '<graph id="G" edgedefault="directed">\n')
+        batch = []
+        for node in graph.iter_nodes():
+            data = ''.join(f'<data key="{key}">{escape(str(node[key]))}</data>'
+                           for key in ('label', 'group', 'type', 'url', 'x', 'y') if key in node)
+            batch.append(f'<node id={quoteattr(str(node["id"]))}>{data}</node>\n')
+            if len(batch) >= BATCH_SIZE:
+                yield ''.join(batch)
+                batch = []
+        for edge in graph.iter_edges(styled=False):
+            batch.append(f'<edge id="{edge["id"]}" source={quoteattr(str(edge["from"]))} '
+                         f'target={quoteattr(str(edge["to"]))}>'
+                         f'<data key="relation">{escape(str(edge["label"]))}</data></edge>\n')
+            if len(batch) >= BATCH_SIZE:
+                yield ''.join(batch)
+                batch = []
+        batch.append('</graph>\n</graphml>\n')
+        yield ''.join(batch)
+
+    return _encode(chunks())
+
+
+NODE_CSV_FIELDS = ['id', 'label', 'group', 'type', 'url', 'x', 'y']
+EDGE_CSV_FIELDS = ['id', 'from', 'to', 'label']
+
+
+def iter_csv(graph: CompactGraph, table: str = 'nodes', **options) -> Iterator[bytes]:
+    """CSV节点表或边表（table=nodes/edges）"""
+    if table not in ('nodes', 'edges'):
+        raise ValueError(f"Unsupported CSV table: {table}")
+    fields = NODE_CSV_FIELDS if table == 'nodes' else EDGE_CSV_FIELDS
+    rows = graph.iter_nodes() if table == 'nodes' else graph.iter_edges(styled=False)
+
+    def chunks() -> Iterator[str]:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        for count, row in enumerate(rows, 1):
+            writer.writerow(row)
+            if count % BATCH_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    return _encode(chunks())
+
+
+def _pack_strings(values) -> Tuple['np.ndarray', 'np.ndarray']:
+    """字符串列存储为 UTF-8 字节 + 偏移量，可以直接内存映射"""
+    encoded = [str(value).encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(value) for value in encoded])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_strings(data: 'np.ndarray', offsets: 'np.ndarray', index: int) -> str:
+    return bytes(data[offsets[index]:offsets[index + 1]]).decode('utf-8')
+
+
+def graph_columns(graph: CompactGraph) -> Dict[str, 'np.ndarray']:
+    """紧凑图谱的列式数组"""
+    columns = {
+        'node_group': np.frombuffer(graph.node_groups, dtype=np.uint16),
+        'node_type': np.frombuffer(graph.node_types, dtype=np.uint16),
+        'node_url': np.frombuffer(graph.node_urls, dtype=np.int32),
+        'edge_src': np.frombuffer(graph.src, dtype=np.int32),
+        'edge_dst': np.frombuffer(graph.dst, dtype=np.int32),
+        'edge_type': np.frombuffer(graph.edge_type, dtype=np.uint32),
+        'edge_style': np.frombuffer(graph.edge_style, dtype=np.uint8),
+        'edge_styles': np.frombuffer(_dumps(graph.edge_styles).encode('utf-8'), dtype=np.uint8)
+    }
+    for name, values in (('node_id', graph.node_ids.values), ('node_label', graph.labels),
+                         ('group', graph.groups.values), ('type', graph.types.values),
+                         ('url', graph.urls.values), ('relation', graph.edge_types.values)):
+        columns[f'{name}_data'], columns[f'{name}_offsets'] = _pack_strings(values)
+    if graph.positions is not None:
+        columns['node_xy'] = np.asarray(graph.positions, dtype=np.float32).reshape(-1, 2)
+    return columns
+
+
+def iter_npz(graph: CompactGraph, **options) -> Iterator[bytes]:
+    """列式npz（不压缩），重新加载时各数组可以直接内存映射，见 load_npz"""
+    if np is None:
+        raise ValueError("npz export requires numpy")
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as spool:
+        with zipfile.ZipFile(spool, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for name, column in graph_columns(graph).items():
+                with archive.open(f'{name}.npy', 'w', force_zip64=True) as member:
+                    np.lib.format.write_array(member, np.ascontiguousarray(column), allow_pickle=False)
+        spool.seek(0)
+        while True:
+            chunk = spool.read(READ_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def load_npz(path: str, mmap_mode: str = 'r') -> Dict[str, 'np.ndarray']:
+    """加载 iter_npz 导出的文件，未压缩的成员直接内存映射而不读入内存"""
+    if np is None:
+        raise ValueError("npz import requires numpy")
+    columns = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    columns[name] = np.lib.format.read_array(member)
+                continue
+            # 跳过本地文件头，定位到 .npy 数据
+            f.seek(info.header_offset)
+            header = f.read(30)
+            name_length, extra_length = struct.unpack('<HH', header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if 0 in shape:
+                columns[name] = np.zeros(shape, dtype=dtype)
+            else:
+                columns[name] = np.memmap(f, dtype=dtype, mode=mmap_mode, offset=f.tell(), shape=shape,
+                                          order='F' if fortran_order else 'C')
+    return columns
+
+
+def columns_to_graph(columns: Dict[str, 'np.ndarray']) -> CompactGraph:
+    """从列式数组还原紧凑图谱"""
+    def strings(name: str):
+        data, offsets = columns[f'{name}_data'], columns[f'{name}_offsets']
+        return [unpack_strings(data, offsets, i) for i in range(len(offsets) - 1)]
+
+    graph = CompactGraph()
+    for value in strings('node_id'):
+        graph.node_ids.intern(value)
+    graph.labels = strings('node_label')
+    for interner, name in ((graph.groups, 'group'), (graph.types, 'type'),
+                           (graph.urls, 'url'), (graph.edge_types, 'relation')):
+        for value in strings(name):
+            interner.intern(value)
+    for target, name in ((graph.node_groups, 'node_group'), (graph.node_types, 'node_type'),
+                         (graph.node_urls, 'node_url'), (graph.src, 'edge_src'), (graph.dst, 'edge_dst'),
+                         (graph.edge_type, 'edge_type'), (graph.edge_style, 'edge_style')):
+        target.frombytes(np.ascontiguousarray(columns[name]).tobytes())
+    graph.edge_styles = json.loads(bytes(columns['edge_styles']).decode('utf-8'))
+    if 'node_xy' in columns:
+        graph.positions = [(float(x), float(y)) for x, y in columns['node_xy']]
+    return graph
+
+
+# 格式名 -> (MIME类型, 文件扩展名, 导出函数)
+EXPORT_FORMATS: Dict[str, Tuple[str, str, Callable[..., Iterator[bytes]]]] = {
+    'json': ('application/json', 'json', iter_json),
+    'json.gz': ('application/gzip', 'json.gz', lambda graph, **options: iter_gzip(iter_json(graph))),
+    'json.zst': ('application/zstd', 'json.zst', lambda graph, **options: iter_zstd(iter_json(graph))),
+    'msgpack': ('application/x-msgpack', 'msgpack', iter_msgpack),
+    'npz': ('application/octet-stream', 'npz', iter_npz),
+    'graphml': ('application/graphml+xml', 'graphml', iter_graphml),
+    'csv': ('text/csv', 'csv', iter_csv)
+}
+
+FORMAT_ALIASES = {'gzip': 'json.gz', 'zstd': 'json.zst'}
+
+
+def export_stream(graph: CompactGraph, format: str = 'json', **options) -> Tuple[Iterator[bytes], str, str]:
+    """按格式流式导出，返回 (字节块迭代器, MIME类型, 文件扩展名)
+
+    依赖缺失或参数错误时在开始输出之前抛出 ValueError。
+    """
+    format = FORMAT_ALIASES.get(format, format)
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {format}")
+    mimetype, extension, exporter = EXPORT_FORMATS[format]
+    chunks = exporter(graph, **options)
+    # 生成器在首次迭代时才执行，先取出第一块使错误尽早暴露
+    try:
+        first = next(chunks)
+    except StopIteration:
+        first = b''
+
+    def stream() -> Iterator[bytes]:
+        yield first
+        yield from chunks
+
+    if format == 'csv':
+        extension = f"{options.get('table', 'nodes')}.csv"
+    return stream(), mimetype, extension
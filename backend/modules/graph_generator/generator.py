@@ -1,50 +1,164 @@
 import json
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional, Tuple
 import logging
 
+import config
+from modules.graph_generator.compact import CompactGraph
+from modules.graph_generator.exporters import export_stream
+from modules.graph_generator.layout import ForceLayout
+from modules.graph_generator.store import GraphStore
+from modules.metrics.registry import get_metrics
+
 class GraphGenerator:
-    def __init__(self):
+    def __init__(self, store: Optional[GraphStore] = None):
         self.logger = logging.getLogger(__name__)
+        # 跨页面累积的图谱，实体按名称和别名增量合并
+        self.store = store or GraphStore()
+        self.layout_engine = ForceLayout(iterations=config.LAYOUT_ITERATIONS, seed=config.LAYOUT_SEED)
+        # 累积图谱上一次的节点坐标，用于热启动
+        self.positions: Dict[str, Tuple[float, float]] = {}
+        self.layout_version = None
 
     def format_graph_data(self, nodes: List[Dict], edges: List[Dict]) -> Dict:
         """格式化图谱数据为前端可用格式"""
         try:
-            # 确保节点ID唯一
-            unique_nodes = {}
-            for node in nodes:
-                if node['id'] not in unique_nodes:
-                    unique_nodes[node['id']] = {
-                        'id': node['id'],
-                        'label': node.get('label', node['id']),
-                        'group': node.get('group', 'default')
-                    }
-
-            # 处理边
-            formatted_edges = []
-            for i, edge in enumerate(edges):
-                if edge['source'] in unique_nodes and edge['target'] in unique_nodes:
-                    formatted_edges.append({
-                        'id': f'e{i}',  # 添加唯一ID
-                        'from': edge['source'],
-                        'to': edge['target'],
-                        'label': edge.get('type', edge.get('label', '')),  # 优先使用type字段
-                        'arrows': 'to',
-                        'color': {'color': '#999'}  # 添加边的颜色
-                    })
-
-            return {
-                'nodes': list(unique_nodes.values()),
-                'edges': formatted_edges
-            }
+            # 节点ID唯一，边的端点必须存在
+            with get_metrics().span('graph_format'):
+                return CompactGraph.from_nodes_edges(nodes, edges).to_vis()
         except Exception as e:
             self.logger.error(f"Data formatting failed: {str(e)}")
             return {'nodes': [], 'edges': []}
 
-    def apply_layout(self, graph_data: Dict) -> Dict:
-        """应用图谱布局算法"""
-        # 这里可以添加自定义布局算法
-        # 目前返回原始数据，实际布局将在前端处理
-        return graph_data
+    def build_graph(self, graph: Dict, max_nodes: Optional[int] = None) -> CompactGraph:
+        """将 entities/relationships 格式转换为紧凑图谱"""
+        with get_metrics().span('graph_format'):
+            return CompactGraph.from_entities(graph, max_nodes)
+
+    def entities_to_graph(self, graph: Dict, max_nodes: Optional[int] = None) -> Dict:
+        """将 entities/relationships 格式转换为前端可用的 nodes/edges"""
+        return self.build_graph(graph, max_nodes).to_vis()
+
+    def render_graph(self, graph: Dict, max_nodes: Optional[int] = None,
+                     warm_start: Optional[Dict[str, Tuple[float, float]]] = None) -> Dict:
+        """构建紧凑图谱并计算布局，最后才转换为前端格式"""
+        compact = self.build_graph(graph, max_nodes)
+        self.layout_compact(compact, warm_start)
+        return self.to_payload(compact)
+
+    def to_payload(self, compact: CompactGraph) -> Dict:
+        """紧凑图谱转换为前端格式，带坐标时附加布局信息"""
+        with get_metrics().span('graph_format'):
+            payload = compact.to_vis()
+        if compact.positions is not None:
+            payload['layout'] = self._layout_info()
+        return payload
+
+    def merge_graph(self, graph: Dict, source: Optional[str] = None) -> Dict[str, str]:
+        """将新图谱增量合并到累积图谱中，返回 局部ID -> 全局ID 的映射"""
+        return self.store.merge(graph, source)
+
+    def get_merged_compact(self, max_nodes: Optional[int] = None) -> CompactGraph:
+        """获取累积图谱的紧凑表示（带布局坐标），已有节点沿用上一次的坐标"""
+        version = self.store.version
+        compact = self.build_graph(self.store.to_graph(), max_nodes)
+        # 图谱版本未变化时直接沿用上一次的坐标，避免热启动反复微调导致坐标漂移
+        if version == self.layout_version and all(node_id in self.positions for node_id in compact.node_ids.values):
+            compact.positions = [self.positions[node_id] for node_id in compact.node_ids.values]
+        elif self.layout_compact(compact, self.positions):
+            self.positions.update(zip(compact.node_ids.values, compact.positions))
+            self.layout_version = version
+        return compact
+
+    def get_merged_graph(self, max_nodes: Optional[int] = None) -> Dict:
+        """获取累积图谱（前端格式，带布局坐标）"""
+        return self.to_payload(self.get_merged_compact(max_nodes))
+
+    def clear_positions(self) -> None:
+        self.positions.clear()
+        self.layout_version = None
+
+    def _layout_info(self) -> Dict:
+        return {'algorithm': 'force', 'physics': False, 'seed': self.layout_engine.seed}
+
+    def _can_layout(self, node_count: int) -> bool:
+        return 0 < node_count <= config.LAYOUT_MAX_NODES and ForceLayout.available()
+
+    def layout_compact(self, compact: CompactGraph,
+                       warm_start: Optional[Dict[str, Tuple[float, float]]] = None) -> bool:
+        """为紧凑图谱计算布局坐标，成功时写入 compact.positions"""
+        if not self._can_layout(compact.node_count):
+            return False
+        try:
+            with get_metrics().span('layout'):
+                positions = self.layout_engine.layout_pairs(compact.node_ids.values, compact.edge_pairs(), warm_start)
+        except Exception as e:
+            self.logger.error(f"Layout failed: {str(e)}")
+            return False
+        compact.positions = [positions[node_id] for node_id in compact.node_ids.values]
+        return True
+
+    def apply_layout(self, graph_data: Dict, warm_start: Optional[Dict[str, Tuple[float, float]]] = None) -> Dict:
+        """应用图谱布局算法
+
+        在服务端计算力导向布局，把坐标写入节点的 x/y，并在 layout 字段中标记前端可以关闭物理引擎。
+        未安装numpy或节点数超过上限时返回原始数据，由前端计算布局。
+        """
+        nodes = graph_data.get('nodes', [])
+        if not self._can_layout(len(nodes)):
+            return graph_data
+
+        try:
+            node_ids = [node['id'] for node in nodes]
+            edges = [(edge['from'], edge['to']) for edge in graph_data.get('edges', [])]
+            positions = self.layout_engine.layout(node_ids, edges, warm_start)
+        except Exception as e:
+            self.logger.error(f"Layout failed: {str(e)}")
+            return graph_data
+
+        laid_out = [{**node, 'x': round(positions[node['id']][0], 2), 'y': round(positions[node['id']][1], 2)}
+                    for node in nodes]
+        return {**graph_data, 'nodes': laid_out, 'layout': self._layout_info()}
+
+    def analyze_graph(self, compact: CompactGraph, top_k: int = 10) -> Dict:
+        """图谱概要：按度数选出关键实体，以及关键实体之间的关系"""
+        degrees = compact.degrees()
+        ranked = sorted(range(compact.node_count), key=lambda i: -degrees[i])[:top_k]
+        ids = compact.node_ids.values
+        key_entities = [{
+            'id': ids[i],
+            'label': compact.labels[i],
+            'type': compact.types.values[compact.node_types[i]],
+            'degree': degrees[i]
+        } for i in ranked]
+
+        # 关键实体的出边（CSR按节点查询，开销与度数成正比）
+        key_set = set(ranked)
+        relationships = []
+        for i in ranked:
+            for e in compact.out_edges(i):
+                if compact.dst[e] in key_set:
+                    relationships.append({
+                        'source': ids[i],
+                        'target': ids[compact.dst[e]],
+                        'label': compact.edge_types.values[compact.edge_type[e]]
+                    })
+
+        type_counts: Dict[str, int] = {}
+        for code in compact.node_types:
+            name = compact.types.values[code] or 'default'
+            type_counts[name] = type_counts.get(name, 0) + 1
+        main_types = '、'.join(f"{name}({count})" for name, count in
+                              sorted(type_counts.items(), key=lambda item: -item[1])[:5])
+        summary = f"图谱包含 {compact.node_count} 个实体、{compact.edge_count} 条关系"
+        if main_types:
+            summary += f"，主要实体类型：{main_types}"
+
+        return {
+            'summary': summary,
+            'key_entities': key_entities,
+            'relationships': relationships[:top_k * 2],
+            'type_counts': type_counts
+        }
 
     def generate_graph(self, data: Dict) -> Dict:
         """生成最终的图谱数据"""
@@ -73,14 +187,13 @@ class GraphGenerator:
     def export_graph(self, graph_data: Dict, format: str = 'json') -> Dict:
         """导出图谱数据"""
         try:
-            if format == 'json':
-                return {
-                    'data': json.dumps(graph_data, ensure_ascii=False, indent=2),
-                    'format': 'json',
-                    'status': 'success'
-                }
-            else:
-                raise ValueError(f"Unsupported export format: {format}")
+            chunks, mimetype, extension = self.stream_export(graph_data, format)
+            data = b''.join(chunks)
+            return {
+                'data': data.decode('utf-8') if mimetype.startswith(('text/', 'application/json')) else data,
+                'format': format,
+                'status': 'success'
+            }
         except Exception as e:
             self.logger.error(f"Export failed: {str(e)}")
             return {
@@ -88,3 +201,12 @@ class GraphGenerator:
                 'status': 'error',
                 'error': str(e)
             }
+
+    def stream_export(self, graph_data, format: str = 'json', **options) -> Tuple[Iterator[bytes], str, str]:
+        """流式导出图谱（nodes/edges 或紧凑图谱），返回 (字节块迭代器, MIME类型, 文件扩展名)"""
+        if not isinstance(graph_data, CompactGraph):
+            nodes, edges = graph_data.get('nodes', []), graph_data.get('edges', [])
+            if not isinstance(nodes, list) or not isinstance(edges, list):
+                raise ValueError("nodes and edges must be lists")
+            graph_data = CompactGraph.from_nodes_edges(nodes, edges)
+        return export_stream(graph_data, format, **options)
@@ -0,0 +1,197 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy为可选依赖，未安装时由前端计算布局
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+class ForceLayout:
+    """向量化的力导向布局（Fruchterman-Reingold）
+
+    节点数较少时精确计算两两斥力；节点较多时把节点划分到网格中，用网格的质心
+    近似远处节点的斥力，每轮迭代开销为 O(节点数 × 网格数)。
+    结果可复现（固定随机种子），并支持用已有坐标热启动：已有节点只做小幅调整，
+    新节点放在已定位邻居的中心附近，添加节点不会打乱整个布局。
+    """
+
+    def __init__(self, iterations: int = 60, scale: float = 1000.0, seed: int = 42,
+                 exact_threshold: int = 400, warm_mobility: float = 0.05, cache_size: int = 32,
+                 gravity: float = 1.0):
+        self.iterations = iterations
+        self.scale = scale
+        self.seed = seed
+        self.exact_threshold = exact_threshold
+        self.warm_mobility = warm_mobility
+        self.cache_size = cache_size
+        self.gravity = gravity
+        self.cache: 'OrderedDict[str, Dict[str, Tuple[float, float]]]' = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def available() -> bool:
+        return np is not None
+
+    def _cache_key(self, node_ids: List[str], edges: List[Tuple[int, int]],
+                   warm_start: Optional[Dict[str, Tuple[float, float]]]) -> str:
+        digest = hashlib.sha256()
+        digest.update(repr((self.iterations, self.scale, self.seed, self.gravity)).encode('utf-8'))
+        digest.update('\x1f'.join(node_ids).encode('utf-8'))
+        digest.update(repr(sorted(edges)).encode('utf-8'))
+        if warm_start:
+            known = set(node_ids)
+            digest.update(repr(sorted((k, v) for k, v in warm_start.items() if k in known)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def layout(self, node_ids: List[str], edges: List[Tuple[str, str]],
+               warm_start: Optional[Dict[str, Tuple[float, float]]] = None) -> Dict[str, Tuple[float, float]]:
+        """计算布局，返回 节点ID -> (x, y)"""
+        if np is None:
+            raise RuntimeError("numpy is required for server-side layout")
+
+        index = {node_id: i for i, node_id in enumerate(node_ids)}
+        edge_pairs = [(index[s], index[t]) for s, t in edges if s in index and t in index]
+        return self.layout_pairs(node_ids, edge_pairs, warm_start)
+
+    def layout_pairs(self, node_ids: List[str], edge_pairs: List[Tuple[int, int]],
+                     warm_start: Optional[Dict[str, Tuple[float, float]]] = None) -> Dict[str, Tuple[float, float]]:
+        """边以节点下标对给出的布局计算，供紧凑图谱直接使用"""
+        if np is None:
+            raise RuntimeError("numpy is required for server-side layout")
+
+        edge_pairs = [(s, t) for s, t in edge_pairs if s != t]
+        key = self._cache_key(node_ids, edge_pairs, warm_start)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+        positions = self._compute(len(node_ids), edge_pairs, node_ids, warm_start or {})
+        result = {node_id: (float(positions[i, 0]), float(positions[i, 1])) for i, node_id in enumerate(node_ids)}
+
+        with self.lock:
+            self.cache[key] = result
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return result
+
+    def _initial_positions(self, n: int, edge_pairs: List[Tuple[int, int]], node_ids: List[str],
+                           warm_start: Dict[str, Tuple[float, float]], scale: float, rng) -> Tuple['np.ndarray', 'np.ndarray']:
+        """初始坐标：已有节点取热启动坐标，新节点放在已定位邻居的中心附近"""
+        positions = rng.uniform(-0.5, 0.5, size=(n, 2)) * scale
+        fixed = np.zeros(n, dtype=bool)
+        for i, node_id in enumerate(node_ids):
+            if node_id in warm_start:
+                positions[i] = warm_start[node_id]
+                fixed[i] = True
+
+        if fixed.any() and not fixed.all() and edge_pairs:
+            src, dst = np.array(edge_pairs).T
+            sums = np.zeros((n, 2))
+            counts = np.zeros(n)
+            for a, b in ((src, dst), (dst, src)):
+                mask = fixed[b] & ~fixed[a]
+                np.add.at(sums, a[mask], positions[b[mask]])
+                np.add.at(counts, a[mask], 1)
+            placed = counts > 0
+            jitter = rng.normal(0, scale * 0.02, size=(int(placed.sum()), 2))
+            positions[placed] = sums[placed] / counts[placed, None] + jitter
+        return positions, fixed
+
+    @staticmethod
+    def _pairwise(positions: 'np.ndarray', others: 'np.ndarray', masses: 'np.ndarray', k: float,
+                  exclude_self: bool = False) -> 'np.ndarray':
+        """positions 中每个点受到 others 中各点（质量为 masses）的斥力，x/y分量分开计算以减少临时数组"""
+        dx = positions[:, 0, None] - others[None, :, 0]
+        dy = positions[:, 1, None] - others[None, :, 1]
+        weight = dx * dx
+        weight += dy * dy
+        np.maximum(weight, 1e-6, out=weight)
+        if exclude_self:
+            np.fill_diagonal(weight, np.inf)
+        np.divide(masses * (k * k), weight, out=weight)
+        return np.stack(((dx * weight).sum(axis=1), (dy * weight).sum(axis=1)), axis=1)
+
+    def _repulsion(self, positions: 'np.ndarray', k: float) -> 'np.ndarray':
+        """计算斥力位移，大图使用网格质心近似"""
+        n = len(positions)
+        if n <= self.exact_threshold:
+            return self._pairwise(positions, positions, np.ones(n), k, exclude_self=True)
+
+        # 网格近似：每个节点受到各网格质心的斥力，自身所在网格扣除自身
+        cells_per_side = max(4, min(16, int(np.sqrt(n / 8))))
+        lo = positions.min(axis=0)
+        span = np.maximum(positions.max(axis=0) - lo, 1e-6)
+        cell_xy = np.minimum(((positions - lo) / span * cells_per_side).astype(int), cells_per_side - 1)
+        cell = cell_xy[:, 0] * cells_per_side + cell_xy[:, 1]
+        num_cells = cells_per_side * cells_per_side
+
+        counts = np.bincount(cell, minlength=num_cells).astype(float)
+        sums = np.zeros((num_cells, 2))
+        np.add.at(sums, cell, positions)
+        occupied = counts > 0
+        centers = sums[occupied] / counts[occupied, None]
+        masses = counts[occupied]
+
+        force = self._pairwise(positions, centers, masses, k)
+
+        # 修正自身所在网格：去掉包含自身的质心贡献，换成去掉自身后的质心
+        occupied_index = np.cumsum(occupied) - 1
+        own = occupied_index[cell]
+        own_delta = positions - centers[own]
+        own_dist2 = np.maximum((own_delta ** 2).sum(axis=-1), 1e-6)
+        force -= own_delta * (k * k * masses[own] / own_dist2)[:, None]
+
+        rest = counts[cell] - 1
+        has_rest = rest > 0
+        rest_center = (sums[cell][has_rest] - positions[has_rest]) / rest[has_rest, None]
+        rest_delta = positions[has_rest] - rest_center
+        rest_dist2 = np.maximum((rest_delta ** 2).sum(axis=-1), 1e-6)
+        force[has_rest] += rest_delta * (k * k * rest[has_rest] / rest_dist2)[:, None]
+        return force
+
+    def _compute(self, n: int, edge_pairs: List[Tuple[int, int]], node_ids: List[str],
+                 warm_start: Dict[str, Tuple[float, float]]) -> 'np.ndarray':
+        rng = np.random.default_rng(self.seed)
+        if n == 0:
+            return np.zeros((0, 2))
+        if n == 1:
+            return np.array([warm_start.get(node_ids[0], (0.0, 0.0))], dtype=float)
+
+        # 画布边长随节点数增长，保持节点间距大致不变
+        scale = self.scale * max(1.0, float(np.sqrt(n / 100)))
+        positions, fixed = self._initial_positions(n, edge_pairs, node_ids, warm_start, scale, rng)
+        k = scale / np.sqrt(n)
+        mobility = np.where(fixed, self.warm_mobility, 1.0)
+        src, dst = (np.array(edge_pairs).T if edge_pairs else (np.zeros(0, int), np.zeros(0, int)))
+
+        temperature = scale * (0.05 if fixed.any() else 0.2)
+        cooling = temperature / (self.iterations + 1)
+        for _ in range(self.iterations):
+            displacement = self._repulsion(positions, k)
+
+            if len(src):
+                delta = positions[src] - positions[dst]
+                dist = np.maximum(np.sqrt((delta ** 2).sum(axis=-1)), 1e-6)
+                pull = delta * (dist / k)[:, None]
+                np.add.at(displacement, src, -pull)
+                np.add.at(displacement, dst, pull)
+
+            # 向中心的引力，避免孤立节点和小连通分量被斥力推到远处
+            radius = np.sqrt((positions ** 2).sum(axis=-1))
+            displacement -= positions * (self.gravity * radius / scale)[:, None]
+
+            length = np.maximum(np.sqrt((displacement ** 2).sum(axis=-1)), 1e-6)
+            step = np.minimum(length, temperature) * mobility
+            positions += displacement / length[:, None] * step[:, None]
+            temperature -= cooling
+
+        if not fixed.any():
+            positions -= positions.mean(axis=0)
+        return positions
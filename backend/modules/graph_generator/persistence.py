@@ -0,0 +1,302 @@
+import os
+import json
+import mmap
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from array import array
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 上只有单进程部署，进程内的锁已足够
+    fcntl = None
+
+from modules.cache.llm_cache import DEFAULT_CACHE_DIR
+from modules.graph_generator.compact import CompactGraph, Interner, PointColumn, StringColumn
+
+logger = logging.getLogger(__name__)
+
+# 每列在段文件中按8字节对齐
+ALIGNMENT = 8
+SEGMENTS = ('nodes', 'edges')
+CSR_COLUMNS = ('out_offsets', 'out_edges', 'in_offsets', 'in_edges')
+
+
+def _pack_strings(values) -> Tuple[bytes, array]:
+    encoded = [str(value).encode('utf-8') for value in values]
+    offsets = array('q', [0])
+    total = 0
+    for value in encoded:
+        total += len(value)
+        offsets.append(total)
+    return b''.join(encoded), offsets
+
+
+class GraphRepository:
+    """按 graph_id 持久化的图谱库
+
+    节点列和边列分别追加写入 nodes.seg / edges.seg 两个只追加的段文件，打开时内存映射，
+    加载图谱时各列直接引用映射的内存而不复制；SQLite 索引记录每个版本的列位置、
+    来源URL和内容哈希。同一URL再次保存时生成新版本，内容哈希未变化时直接返回已有版本。
+    多个工作进程共用同一目录时，保存过程（确定版本号、追加段文件、写入索引）持有目录下
+    save.lock 的文件锁，各进程记录的偏移不会指向其他进程写入的数据。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, 'graphs')
+        os.makedirs(self.path, exist_ok=True)
+        self.lock = threading.Lock()
+        self.maps: Dict[str, mmap.mmap] = {}
+        self.files = {name: open(os.path.join(self.path, f'{name}.seg'), 'ab+') for name in SEGMENTS}
+        self.lock_file = open(os.path.join(self.path, 'save.lock'), 'a')
+
+        self.conn = sqlite3.connect(os.path.join(self.path, 'index.sqlite3'), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS graphs (
+                graph_id TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                url TEXT,
+                content_hash TEXT,
+                model TEXT,
+                node_count INTEGER NOT NULL,
+                edge_count INTEGER NOT NULL,
+                columns TEXT NOT NULL,
+                tables TEXT NOT NULL,
+                raw TEXT,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (graph_id, version)
+            );
+            CREATE INDEX IF NOT EXISTS graphs_url ON graphs (url, created_at);
+            CREATE INDEX IF NOT EXISTS graphs_content_hash ON graphs (content_hash, created_at);
+        ''')
+        self.conn.commit()
+
+    META_FIELDS = 'graph_id, version, url, content_hash, model, node_count, edge_count, created_at'
+
+    @classmethod
+    def _meta(cls, row) -> Dict[str, Any]:
+        return dict(zip([f.strip() for f in cls.META_FIELDS.split(',')], row))
+
+    @contextmanager
+    def _save_lock(self):
+        """进程内的锁加上跨进程的文件锁"""
+        with self.lock:
+            if fcntl is None:
+                yield
+                return
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _append(self, segment: str, columns: List[Tuple[str, str, bytes]]) -> Dict[str, List]:
+        """把若干列追加到段文件末尾，返回 列名 -> [偏移, 类型码, 元素个数]"""
+        f = self.files[segment]
+        f.seek(0, os.SEEK_END)
+        offset = f.tell()
+        layout = {}
+        for name, typecode, data in columns:
+            padding = -offset % ALIGNMENT
+            if padding:
+                f.write(b'\0' * padding)
+                offset += padding
+            f.write(data)
+            layout[name] = [offset, typecode, len(data) // array(typecode).itemsize]
+            offset += len(data)
+        f.flush()
+        os.fsync(f.fileno())
+        return layout
+
+    def _view(self, segment: str, offset: int, typecode: str, count: int):
+        """段文件中一列的只读视图（内存映射，不复制）"""
+        nbytes = count * array(typecode).itemsize
+        if nbytes == 0:
+            return memoryview(b'').cast(typecode)
+        mapped = self.maps.get(segment)
+        if mapped is None or len(mapped) < offset + nbytes:
+            # 段文件只会追加，重新映射即可看到新数据；旧映射由仍在使用的视图保持
+            mapped = mmap.mmap(self.files[segment].fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[segment] = mapped
+        return memoryview(mapped)[offset:offset + nbytes].cast(typecode)
+
+    def _latest(self, where: str, params: tuple) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(
+            f'SELECT {self.META_FIELDS} FROM graphs WHERE {where} ORDER BY created_at DESC, version DESC LIMIT 1',
+            params
+        ).fetchone()
+        return self._meta(row) if row else None
+
+    def find(self, url: Optional[str] = None, content_hash: Optional[str] = None,
+             model: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """按来源URL和/或内容哈希查找最新的图谱版本"""
+        conditions, params = [], []
+        for field, value in (('url', url), ('content_hash', content_hash), ('model', model)):
+            if value is not None:
+                conditions.append(f'{field} = ?')
+                params.append(value)
+        if not conditions:
+            return None
+        with self.lock:
+            return self._latest(' AND '.join(conditions), tuple(params))
+
+    def get_meta(self, graph_id: str, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            if version is None:
+                return self._latest('graph_id = ?', (graph_id,))
+            return self._latest('graph_id = ? AND version = ?', (graph_id, version))
+
+    def versions(self, graph_id: str) -> List[Dict[str, Any]]:
+        with self.lock:
+            rows = self.conn.execute(
+                f'SELECT {self.META_FIELDS} FROM graphs WHERE graph_id = ? ORDER BY version', (graph_id,)
+            ).fetchall()
+        return [self._meta(row) for row in rows]
+
+    def save(self, graph: CompactGraph, url: Optional[str] = None, content_hash: Optional[str] = None,
+             model: Optional[str] = None, graph_id: Optional[str] = None, raw: Optional[str] = None) -> Dict[str, Any]:
+        """保存图谱的新版本，raw 为可选的LLM原始输出
+
+        未指定 graph_id 时沿用同一URL已有的 graph_id；最新版本的内容哈希相同时不重复写入。
+        """
+        with self._save_lock():
+            if graph_id is None and url:
+                previous = self._latest('url = ? AND model IS ?', (url, model))
+                graph_id = previous['graph_id'] if previous else None
+            latest = self._latest('graph_id = ?', (graph_id,)) if graph_id else None
+            if latest and content_hash and latest['content_hash'] == content_hash and latest['model'] == model:
+                return latest
+
+            graph_id = graph_id or uuid.uuid4().hex[:16]
+            version = latest['version'] + 1 if latest else 1
+
+            node_columns = [
+                ('node_group', 'H', bytes(graph.node_groups)),
+                ('node_type', 'H', bytes(graph.node_types)),
+                ('node_url', 'i', bytes(graph.node_urls))
+            ]
+            for name, values in (('node_id', graph.node_ids.values), ('label', graph.labels)):
+                data, offsets = _pack_strings(values)
+                node_columns.extend([(f'{name}_data', 'B', data), (f'{name}_offsets', 'q', offsets.tobytes())])
+            if graph.positions is not None:
+                points = array('d', [v for point in graph.positions for v in point])
+                node_columns.append(('positions', 'd', points.tobytes()))
+            edge_columns = [
+                ('src', 'i', bytes(graph.src)),
+                ('dst', 'i', bytes(graph.dst)),
+                ('edge_type', 'I', bytes(graph.edge_type)),
+                ('edge_style', 'B', bytes(graph.edge_style))
+            ]
+            # 同时保存CSR邻接数组，加载后邻居查询无需重建索引
+            for name, values in zip(CSR_COLUMNS, graph.csr):
+                edge_columns.append((name, 'i', bytes(values)))
+
+            columns = {'nodes': self._append('nodes', node_columns), 'edges': self._append('edges', edge_columns)}
+            # 类型名称、URL等查找表通常很小，直接存入索引
+            tables = {
+                'groups': list(graph.groups.values),
+                'types': list(graph.types.values),
+                'urls': list(graph.urls.values),
+                'edge_types': list(graph.edge_types.values),
+                'edge_styles': graph.edge_styles
+            }
+            created_at = time.time()
+            self.conn.execute(
+                'INSERT INTO graphs (graph_id, version, url, content_hash, model, node_count, edge_count, '
+                'columns, tables, raw, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (graph_id, version, url, content_hash, model, graph.node_count, graph.edge_count,
+                 json.dumps(columns), json.dumps(tables, ensure_ascii=False), raw, created_at)
+            )
+            self.conn.commit()
+
+        logger.info(f"Saved graph {graph_id} v{version}: {graph.node_count} nodes, {graph.edge_count} edges")
+        return {
+            'graph_id': graph_id,
+            'version': version,
+            'url': url,
+            'content_hash': content_hash,
+            'model': model,
+            'node_count': graph.node_count,
+            'edge_count': graph.edge_count,
+            'created_at': created_at
+        }
+
+    def load(self, graph_id: str, version: Optional[int] = None) -> Optional[CompactGraph]:
+        """加载图谱（默认最新版本），各列为内存映射的只读视图"""
+        with self.lock:
+            if version is None:
+                row = self.conn.execute(
+                    'SELECT columns, tables FROM graphs WHERE graph_id = ? ORDER BY version DESC LIMIT 1',
+                    (graph_id,)
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    'SELECT columns, tables FROM graphs WHERE graph_id = ? AND version = ?', (graph_id, version)
+                ).fetchone()
+            if row is None:
+                return None
+            columns, tables = json.loads(row[0]), json.loads(row[1])
+            views = {
+                segment: {name: self._view(segment, *spec) for name, spec in layout.items()}
+                for segment, layout in columns.items()
+            }
+
+        nodes, edges = views['nodes'], views['edges']
+        graph = CompactGraph()
+        graph.node_ids = Interner(StringColumn(nodes['node_id_data'], nodes['node_id_offsets']))
+        graph.labels = StringColumn(nodes['label_data'], nodes['label_offsets'])
+        graph.node_groups = nodes['node_group']
+        graph.node_types = nodes['node_type']
+        graph.node_urls = nodes['node_url']
+        if 'positions' in nodes:
+            graph.positions = PointColumn(nodes['positions'])
+        graph.groups = Interner(tables['groups'])
+        graph.types = Interner(tables['types'])
+        graph.urls = Interner(tables['urls'])
+        graph.edge_types = Interner(tables['edge_types'])
+        graph.edge_styles = tables['edge_styles']
+        graph.src = edges['src']
+        graph.dst = edges['dst']
+        graph.edge_type = edges['edge_type']
+        graph.edge_style = edges['edge_style']
+        if all(name in edges for name in CSR_COLUMNS):
+            graph._csr = tuple(edges[name] for name in CSR_COLUMNS)
+        return graph
+
+    def load_raw(self, graph_id: str, version: int) -> Optional[str]:
+        """读取保存时附带的LLM原始输出"""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT raw FROM graphs WHERE graph_id = ? AND version = ?', (graph_id, version)
+            ).fetchone()
+        return row[0] if row else None
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            graphs, versions = self.conn.execute(
+                'SELECT COUNT(DISTINCT graph_id), COUNT(*) FROM graphs'
+            ).fetchone()
+            return {
+                'graphs': graphs,
+                'versions': versions,
+                'segment_bytes': sum(os.path.getsize(f.name) for f in self.files.values())
+            }
+
+
+_default_repository = None
+_default_repository_lock = threading.Lock()
+
+
+def get_graph_repository() -> GraphRepository:
+    """获取进程内共享的图谱库，目录与LLM缓存相同"""
+    global _default_repository
+    with _default_repository_lock:
+        if _default_repository is None:
+            cache_dir = os.environ.get('GRAPHRAGER_CACHE_DIR', DEFAULT_CACHE_DIR)
+            _default_repository = GraphRepository(os.path.join(cache_dir, 'graphs'))
+        return _default_repository
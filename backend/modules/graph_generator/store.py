@@ -0,0 +1,430 @@
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Set, Tuple, Any, Iterable
+
+# 实体类型对应的全局ID前缀，与抽取提示词中的前缀约定一致
+TYPE_PREFIXES = {
+    'person': 'p',
+    'org': 'o',
+    'location': 'l',
+    'event': 'e',
+    'time': 't',
+    'topic': 'tp'
+}
+
+ENTITY_KEYS = ('entities', 'nodes')
+RELATIONSHIP_KEYS = ('relationships', 'edges', 'relations')
+
+EdgeKey = Tuple[str, str, str]
+# 来源和其中的分组（如页面URL和段落分组的哈希），未指定分组时为None
+ProvenanceKey = Tuple[Optional[str], Optional[str]]
+
+PUNCTUATION_PATTERN = re.compile(r'[\s\W_]+', re.UNICODE)
+LATIN_NAME_PATTERN = re.compile(r'^[a-z][a-z.\'\- ]*$')
+
+
+def normalize_name(name: Any) -> str:
+    """规范化实体名称：全半角统一、小写、去除空白和标点"""
+    if name is None:
+        return ''
+    text = unicodedata.normalize('NFKC', str(name)).lower()
+    return PUNCTUATION_PATTERN.sub('', text)
+
+
+class GraphStore:
+    """可增量合并的内存图谱
+
+    通过规范化名称和别名的哈希索引做实体消歧，合并一个新图谱的开销只与新图谱的
+    实体/关系数量成正比，不需要重建整个图谱。节点获得稳定的全局ID（p1、o1...）。
+    每个节点和关系记录贡献它的 (来源, 分组)，页面某部分被删除后可以撤回只由该部分支持的实体和关系。
+    """
+
+    def __init__(self):
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.edges: Dict[EdgeKey, Dict[str, Any]] = {}
+        # (类型, 规范化名称或别名) -> 全局ID
+        self.name_index: Dict[Tuple[str, str], str] = {}
+        # 规范化名称 -> 全局ID，用于匹配未标注类型的实体
+        self.untyped_index: Dict[str, str] = {}
+        self.counters: Dict[str, int] = {}
+        # (来源, 分组) -> 该分组贡献的节点和关系，以及反向的 节点/关系 -> 贡献它的分组
+        self.provenance: Dict[ProvenanceKey, Tuple[Set[str], Set[EdgeKey]]] = {}
+        self.node_provenance: Dict[str, Set[ProvenanceKey]] = {}
+        self.edge_provenance: Dict[EdgeKey, Set[ProvenanceKey]] = {}
+        # 来源 -> 已合并的分组；节点 -> 以它为端点的关系、为它建立的名称索引键，
+        # 撤回和合并节点时只需处理涉及的节点，不必扫描整个图谱
+        self.source_sections: Dict[Optional[str], Set[Optional[str]]] = {}
+        self.node_edges: Dict[str, Set[EdgeKey]] = {}
+        self.node_keys: Dict[str, Set[Tuple[str, str]]] = {}
+        self.version = 0
+        self.lock = threading.RLock()
+
+    def _next_id(self, entity_type: str, local_id: str) -> str:
+        prefix = TYPE_PREFIXES.get(entity_type)
+        if prefix is None:
+            match = re.match(r'^([A-Za-z]+)', local_id or '')
+            prefix = match.group(1).lower() if match else 'n'
+        self.counters[prefix] = self.counters.get(prefix, 0) + 1
+        return f"{prefix}{self.counters[prefix]}"
+
+    @staticmethod
+    def _raw_names(entity: Dict[str, Any]) -> List[Any]:
+        """实体的名称和别名（原始形式）"""
+        aliases = entity.get('aliases') or []
+        if isinstance(aliases, str):
+            aliases = [aliases]
+        return [entity.get('name') or entity.get('label')] + list(aliases)
+
+    @classmethod
+    def _aliases(cls, entity: Dict[str, Any]) -> List[str]:
+        """实体的名称和别名（规范化后）"""
+        return [n for n in (normalize_name(name) for name in cls._raw_names(entity)) if n]
+
+    @classmethod
+    def _weak_aliases(cls, entity: Dict[str, Any], entity_type: str) -> List[str]:
+        """英文人名额外索引姓氏，使之后出现的 Biden 可以并入 Joe Biden"""
+        if entity_type != 'person':
+            return []
+        weak = []
+        for name in cls._raw_names(entity):
+            text = unicodedata.normalize('NFKC', str(name or '')).strip().lower()
+            if LATIN_NAME_PATTERN.match(text) and ' ' in text:
+                weak.append(normalize_name(text.split()[-1]))
+        return [w for w in weak if w]
+
+    def add_alias(self, node_id: str, alias: str) -> None:
+        """为已有节点手动添加别名"""
+        with self.lock:
+            node = self.nodes[node_id]
+            key = normalize_name(alias)
+            if key:
+                self.name_index[(node.get('type', ''), key)] = node_id
+                self.untyped_index.setdefault(key, node_id)
+                self.node_keys.setdefault(node_id, set()).add((node.get('type', ''), key))
+                if alias not in node['aliases']:
+                    node['aliases'].append(alias)
+
+    def resolve(self, entity: Dict[str, Any]) -> Optional[str]:
+        """查找实体对应的已有节点ID"""
+        entity_type = str(entity.get('type') or entity.get('group') or '').lower()
+        # 只用完整名称查询；姓氏等弱别名只建索引，避免 "Hunter Biden" 被并入 "Joe Biden"
+        for key in self._aliases(entity):
+            if entity_type:
+                node_id = self.name_index.get((entity_type, key))
+            else:
+                node_id = self.untyped_index.get(key)
+            if node_id:
+                return node_id
+        return None
+
+    def _index(self, node_id: str, entity: Dict[str, Any], entity_type: str) -> None:
+        keys = self.node_keys.setdefault(node_id, set())
+        for key in self._aliases(entity):
+            self.name_index[(entity_type, key)] = node_id
+            self.untyped_index.setdefault(key, node_id)
+            keys.add((entity_type, key))
+        for key in self._weak_aliases(entity, entity_type):
+            self.name_index.setdefault((entity_type, key), node_id)
+            keys.add((entity_type, key))
+
+    def _unindex(self, node_id: str) -> None:
+        """删除仍指向该节点的名称索引"""
+        for entity_type, key in self.node_keys.pop(node_id, ()):
+            if self.name_index.get((entity_type, key)) == node_id:
+                del self.name_index[(entity_type, key)]
+            if self.untyped_index.get(key) == node_id:
+                del self.untyped_index[key]
+
+    def _link_edge(self, key: EdgeKey) -> None:
+        self.node_edges.setdefault(key[0], set()).add(key)
+        self.node_edges.setdefault(key[1], set()).add(key)
+
+    def _unlink_edge(self, key: EdgeKey) -> None:
+        for node_id in key[:2]:
+            keys = self.node_edges.get(node_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.node_edges[node_id]
+
+    def _add_entity(self, entity: Dict[str, Any], source: Optional[str]) -> str:
+        entity_type = str(entity.get('type') or entity.get('group') or '').lower()
+        node_id = self.resolve(entity)
+
+        if node_id is None:
+            node_id = self._next_id(entity_type, str(entity.get('id', '')))
+            node = {k: v for k, v in entity.items() if k not in ('id', 'aliases')}
+            node['id'] = node_id
+            node['type'] = entity_type
+            node['name'] = entity.get('name') or entity.get('label') or str(entity.get('id', node_id))
+            node['aliases'] = []
+            node['sources'] = []
+            node['mentions'] = 0
+            self.nodes[node_id] = node
+        else:
+            node = self.nodes[node_id]
+            # 补充缺失的属性，已有属性保持不变
+            for key, value in entity.items():
+                if key not in ('id', 'aliases') and value and not node.get(key):
+                    node[key] = value
+
+        for alias in self._raw_names(entity):
+            if alias and alias != node['name'] and alias not in node['aliases']:
+                node['aliases'].append(alias)
+        if source and source not in node['sources']:
+            node['sources'].append(source)
+        node['mentions'] += 1
+
+        self._index(node_id, entity, entity_type)
+        return node_id
+
+    def merge(self, graph: Dict[str, Any], source: Optional[str] = None,
+              section: Optional[str] = None) -> Dict[str, str]:
+        """合并一个图谱（entities/relationships 或 nodes/edges），返回 局部ID -> 全局ID 的映射
+
+        section 为图谱在来源中对应的分组（如段落分组的哈希），之后可以用 retract 撤回。
+        """
+        entities = next((graph[k] for k in ENTITY_KEYS if isinstance(graph.get(k), list)), [])
+        relationships = next((graph[k] for k in RELATIONSHIP_KEYS if isinstance(graph.get(k), list)), [])
+
+        with self.lock:
+            origin = (source, section)
+            node_members, edge_members = self.provenance.setdefault(origin, (set(), set()))
+            self.source_sections.setdefault(source, set()).add(section)
+            id_map: Dict[str, str] = {}
+            for entity in entities:
+                if not isinstance(entity, dict) or entity.get('id') is None:
+                    continue
+                node_id = self._add_entity(entity, source)
+                id_map[str(entity['id'])] = node_id
+                node_members.add(node_id)
+                self.node_provenance.setdefault(node_id, set()).add(origin)
+
+            for rel in relationships:
+                if not isinstance(rel, dict):
+                    continue
+                source_id = id_map.get(str(rel.get('source', rel.get('from'))))
+                target_id = id_map.get(str(rel.get('target', rel.get('to'))))
+                if source_id is None or target_id is None or source_id == target_id:
+                    continue
+                rel_type = rel.get('type', rel.get('label', '')) or ''
+                key = (source_id, target_id, rel_type)
+                edge = self.edges.get(key)
+                if edge is None:
+                    edge = {k: v for k, v in rel.items() if k not in ('source', 'target', 'from', 'to', 'label')}
+                    edge.update({'source': source_id, 'target': target_id, 'type': rel_type,
+                                 'sources': [], 'weight': 0})
+                    self.edges[key] = edge
+                    self._link_edge(key)
+                edge['weight'] += 1
+                if source and source not in edge['sources']:
+                    edge['sources'].append(source)
+                edge_members.add(key)
+                self.edge_provenance.setdefault(key, set()).add(origin)
+
+            self.version += 1
+            return id_map
+
+    def sections(self, source: Optional[str]) -> Set[Optional[str]]:
+        """已合并的该来源的分组"""
+        with self.lock:
+            return set(self.source_sections.get(source, ()))
+
+    def retract(self, source: Optional[str], sections: Iterable[Optional[str]]) -> Dict[str, int]:
+        """撤回来源中的若干分组：只由这些分组支持的节点和关系被删除，
+        其余的减少提及次数/权重，不再有该来源支持时从 sources 中去掉该来源。返回删除的节点数和关系数
+        """
+        with self.lock:
+            removed_nodes: Set[str] = set()
+            removed_edges = 0
+            for section in sections:
+                key = (source, section)
+                members = self.provenance.pop(key, None)
+                if members is None:
+                    continue
+                merged = self.source_sections[source]
+                merged.discard(section)
+                if not merged:
+                    del self.source_sections[source]
+                node_members, edge_members = members
+                for edge_key in edge_members:
+                    remaining = self._discard_provenance(self.edge_provenance, edge_key, key)
+                    if remaining is None:
+                        continue
+                    if not remaining:
+                        if self.edges.pop(edge_key, None) is not None:
+                            self._unlink_edge(edge_key)
+                            removed_edges += 1
+                    elif edge_key in self.edges:
+                        edge = self.edges[edge_key]
+                        edge['weight'] = max(1, edge['weight'] - 1)
+                        self._drop_source(edge, source, remaining)
+                for node_id in node_members:
+                    remaining = self._discard_provenance(self.node_provenance, node_id, key)
+                    if remaining is None or node_id not in self.nodes:
+                        continue
+                    if not remaining:
+                        removed_nodes.add(node_id)
+                    else:
+                        node = self.nodes[node_id]
+                        node['mentions'] = max(1, node['mentions'] - 1)
+                        self._drop_source(node, source, remaining)
+
+            for node_id in removed_nodes:
+                del self.nodes[node_id]
+                self._unindex(node_id)
+                # 关系的分组总是其两端节点分组的子集，这里只是兜底
+                for edge_key in list(self.node_edges.get(node_id, ())):
+                    del self.edges[edge_key]
+                    self._unlink_edge(edge_key)
+                    for provenance_key in self.edge_provenance.pop(edge_key, ()):
+                        if provenance_key in self.provenance:
+                            self.provenance[provenance_key][1].discard(edge_key)
+                    removed_edges += 1
+            self.version += 1
+            return {'nodes': len(removed_nodes), 'edges': removed_edges}
+
+    @staticmethod
+    def _discard_provenance(provenance: Dict[Any, Set[ProvenanceKey]], item: Any,
+                            key: ProvenanceKey) -> Optional[Set[ProvenanceKey]]:
+        """从节点/关系的分组中去掉一个，返回剩余的分组；没有记录时返回None"""
+        keys = provenance.get(item)
+        if keys is None:
+            return None
+        keys.discard(key)
+        if not keys:
+            del provenance[item]
+        return keys
+
+    @staticmethod
+    def _drop_source(item: Dict[str, Any], source: Optional[str], remaining: Set[ProvenanceKey]) -> None:
+        if source and all(src != source for src, _ in remaining) and source in item['sources']:
+            item['sources'].remove(source)
+
+    def replace_source(self, source: str, sections: Dict[str, Dict[str, Any]],
+                       keep: Iterable[str] = ()) -> Dict[str, int]:
+        """用来源的最新分组替换已合并的内容：新分组被合并，已合并且仍存在的分组保持不变，
+        不再存在的分组（包括未分组合并的内容）被撤回；keep 中的分组不合并也不撤回
+        """
+        with self.lock:
+            current = self.sections(source)
+            stale = current - set(sections) - set(keep)
+            added = [section for section in sections if section not in current]
+            # 先合并再撤回，新旧分组中都有的实体保留原来的节点ID
+            for section in added:
+                self.merge(sections[section], source, section)
+            retracted = self.retract(source, stale)
+            return {
+                'added': len(added),
+                'kept': len(sections) - len(added),
+                'removed': len(stale),
+                'retracted_nodes': retracted['nodes'],
+                'retracted_edges': retracted['edges']
+            }
+
+    def merge_nodes(self, id_map: Dict[str, str]) -> None:
+        """合并已有节点，id_map 为 被合并节点ID -> 保留节点ID
+
+        被合并节点的名称和别名成为保留节点的别名，来源、提及次数和缺失的属性一并转移；
+        指向被合并节点的边改为指向保留节点，重复的边合并权重，自环被删除。
+        """
+        with self.lock:
+            id_map = {drop: keep for drop, keep in id_map.items()
+                      if drop != keep and drop in self.nodes and keep in self.nodes}
+            if not id_map:
+                return
+            for drop_id, keep_id in id_map.items():
+                drop = self.nodes.pop(drop_id)
+                keep = self.nodes[keep_id]
+                for alias in [drop['name']] + drop['aliases']:
+                    if alias and alias != keep['name'] and alias not in keep['aliases']:
+                        keep['aliases'].append(alias)
+                for source in drop['sources']:
+                    if source not in keep['sources']:
+                        keep['sources'].append(source)
+                keep['mentions'] += drop['mentions']
+                for key, value in drop.items():
+                    if value and not keep.get(key):
+                        keep[key] = value
+                for key in self.node_provenance.pop(drop_id, set()):
+                    self.provenance[key][0].discard(drop_id)
+                    self.provenance[key][0].add(keep_id)
+                    self.node_provenance.setdefault(keep_id, set()).add(key)
+
+            # 被合并节点的索引键转给保留节点（id_map 的值都是保留下来的节点）
+            for drop_id, keep_id in id_map.items():
+                keep_keys = self.node_keys.setdefault(keep_id, set())
+                for entity_type, key in self.node_keys.pop(drop_id, ()):
+                    if self.name_index.get((entity_type, key)) == drop_id:
+                        self.name_index[(entity_type, key)] = keep_id
+                    if self.untyped_index.get(key) == drop_id:
+                        self.untyped_index[key] = keep_id
+                    keep_keys.add((entity_type, key))
+
+            # 只有以被合并节点为端点的关系需要改写
+            affected = set()
+            for drop_id in id_map:
+                affected.update(self.node_edges.get(drop_id, ()))
+            for old_key in affected:
+                edge = self.edges.pop(old_key)
+                self._unlink_edge(old_key)
+                source_id, target_id, rel_type = old_key
+                source_id = id_map.get(source_id, source_id)
+                target_id = id_map.get(target_id, target_id)
+                key = (source_id, target_id, rel_type)
+                for provenance_key in self.edge_provenance.pop(old_key, set()):
+                    self.provenance[provenance_key][1].discard(old_key)
+                    if source_id != target_id:
+                        self.provenance[provenance_key][1].add(key)
+                        self.edge_provenance.setdefault(key, set()).add(provenance_key)
+                if source_id == target_id:
+                    continue
+                existing = self.edges.get(key)
+                if existing is None:
+                    edge.update({'source': source_id, 'target': target_id})
+                    self.edges[key] = edge
+                    self._link_edge(key)
+                else:
+                    existing['weight'] += edge['weight']
+                    for source in edge['sources']:
+                        if source not in existing['sources']:
+                            existing['sources'].append(source)
+            self.version += 1
+
+    def merge_many(self, graphs: Iterable[Tuple[Dict[str, Any], Optional[str]]]) -> None:
+        """依次合并多个 (图谱, 来源) """
+        for graph, source in graphs:
+            self.merge(graph, source)
+
+    def to_graph(self) -> Dict[str, List[Dict[str, Any]]]:
+        """导出为 entities/relationships 格式"""
+        with self.lock:
+            return {
+                'entities': [dict(node) for node in self.nodes.values()],
+                'relationships': [dict(edge) for edge in self.edges.values()]
+            }
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                'node_count': len(self.nodes),
+                'edge_count': len(self.edges),
+                'alias_count': len(self.name_index),
+                'version': self.version
+            }
+
+    def clear(self) -> None:
+        with self.lock:
+            self.nodes.clear()
+            self.edges.clear()
+            self.name_index.clear()
+            self.untyped_index.clear()
+            self.counters.clear()
+            self.provenance.clear()
+            self.node_provenance.clear()
+            self.edge_provenance.clear()
+            self.source_sections.clear()
+            self.node_edges.clear()
+            self.node_keys.clear()
+            self.version += 1
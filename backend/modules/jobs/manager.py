@@ -0,0 +1,173 @@
+import time
+import uuid
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+PENDING = 'pending'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class InMemoryJobBackend:
+    """进程内的任务存储和队列
+
+    其他后端（如Redis）只需实现相同的 save/load/update/push/pop 方法即可替换。
+    """
+
+    def __init__(self, max_finished: int = 1000):
+        self.jobs: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self.pending = queue.Queue()
+        self.max_finished = max_finished
+        self.lock = threading.Lock()
+
+    def save(self, job: Dict[str, Any]) -> None:
+        with self.lock:
+            self.jobs[job['id']] = job
+            self._trim()
+
+    def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id: str, **fields) -> None:
+        with self.lock:
+            if job_id in self.jobs:
+                self.jobs[job_id].update(fields, updated_at=time.time())
+
+    def push(self, job_id: str) -> None:
+        self.pending.put(job_id)
+
+    def pop(self, timeout: float) -> Optional[str]:
+        try:
+            return self.pending.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _trim(self) -> None:
+        """只保留最近的已完成任务，避免内存无限增长"""
+        finished = [job_id for job_id, job in self.jobs.items() if job['status'] in (SUCCEEDED, FAILED)]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
+
+
+class JobManager:
+    """图谱生成任务队列
+
+    固定数量的工作线程从队列中取任务执行，同一模型同时运行的任务数受限，
+    避免本地Ollama同时加载过多请求。handler(job, progress) 负责实际处理，
+    progress(stage, value) 用于上报进度。
+    """
+
+    def __init__(self, handler: Callable[[Dict[str, Any], Callable[[str, float], None]], Any],
+                 backend: Optional[InMemoryJobBackend] = None, max_workers: int = 4,
+                 model_limits: Optional[Dict[str, int]] = None, default_model_limit: int = 1):
+        self.handler = handler
+        self.backend = backend or InMemoryJobBackend()
+        self.max_workers = max_workers
+        self.model_limits = model_limits or {}
+        self.default_model_limit = default_model_limit
+        self.model_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self.slots_lock = threading.Lock()
+        self.slot_freed = threading.Condition()
+        self.stopping = threading.Event()
+        self.workers = []
+
+    def start(self) -> None:
+        """启动工作线程"""
+        if self.workers:
+            return
+        self.stopping.clear()
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        logger.info(f"Started {self.max_workers} job workers")
+
+    def shutdown(self, wait: bool = True) -> None:
+        """停止工作线程，正在执行的任务会执行完毕"""
+        self.stopping.set()
+        with self.slot_freed:
+            self.slot_freed.notify_all()
+        if wait:
+            for worker in self.workers:
+                worker.join()
+        self.workers = []
+
+    def submit(self, url: str, model: str, prompt: str, **params) -> str:
+        """提交任务，返回任务ID"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self.backend.save({
+            'id': job_id,
+            'status': PENDING,
+            'stage': 'queued',
+            'progress': 0.0,
+            'url': url,
+            'model': model,
+            'prompt': prompt,
+            'params': params,
+            'result': None,
+            'error': None,
+            'created_at': now,
+            'updated_at': now
+        })
+        self.backend.push(job_id)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """查询任务状态"""
+        return self.backend.load(job_id)
+
+    def _model_slot(self, model: str) -> threading.BoundedSemaphore:
+        with self.slots_lock:
+            if model not in self.model_slots:
+                limit = self.model_limits.get(model, self.default_model_limit)
+                self.model_slots[model] = threading.BoundedSemaphore(limit)
+            return self.model_slots[model]
+
+    def _worker_loop(self) -> None:
+        while not self.stopping.is_set():
+            job_id = self.backend.pop(timeout=0.5)
+            if job_id is None:
+                continue
+            job = self.backend.load(job_id)
+            if job is None:
+                continue
+
+            slot = self._model_slot(job['model'])
+            if not slot.acquire(blocking=False):
+                # 该模型并发已满，放回队尾，让其他模型的任务先执行
+                self.backend.push(job_id)
+                with self.slot_freed:
+                    self.slot_freed.wait(timeout=0.1)
+                continue
+
+            try:
+                self._run(job)
+            finally:
+                slot.release()
+                with self.slot_freed:
+                    self.slot_freed.notify_all()
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        job_id = job['id']
+        self.backend.update(job_id, status=RUNNING, stage='started', started_at=time.time())
+
+        def progress(stage: str, value: float) -> None:
+            self.backend.update(job_id, stage=stage, progress=round(min(max(value, 0.0), 1.0), 3))
+
+        try:
+            result = self.handler(job, progress)
+            self.backend.update(job_id, status=SUCCEEDED, stage='done', progress=1.0,
+                                result=result, finished_at=time.time())
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            self.backend.update(job_id, status=FAILED, stage='failed', error=str(e), finished_at=time.time())
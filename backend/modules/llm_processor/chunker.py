@@ -0,0 +1,76 @@
+import re
+from typing import List
+
+# 中日韩字符大致一个字符对应一个token，其余文本按约4个字符一个token估算
+CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+SENTENCE_PATTERN = re.compile(r'[^。！？!?；;.\n]+[。！？!?；;.\n]*|[。！？!?；;.\n]+')
+
+
+def estimate_tokens(text: str) -> int:
+    """快速估算文本的token数量"""
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
+
+
+class TextChunker:
+    """按token预算将长文本切分为带重叠的片段"""
+
+    def __init__(self, max_tokens: int = 1500, overlap_tokens: int = 150):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def split_sentences(self, text: str) -> List[str]:
+        """按句子切分，超长句子按字符硬切"""
+        sentences = []
+        for match in SENTENCE_PATTERN.finditer(text):
+            sentence = match.group(0)
+            if not sentence.strip():
+                continue
+            if estimate_tokens(sentence) <= self.max_tokens:
+                sentences.append(sentence)
+                continue
+            # 没有标点的超长文本，按估算的字符数切分
+            step = max(1, len(sentence) * self.max_tokens // estimate_tokens(sentence))
+            sentences.extend(sentence[i:i + step] for i in range(0, len(sentence), step))
+        return sentences
+
+    def chunk(self, text: str) -> List[str]:
+        """切分文本，相邻片段之间保留overlap_tokens左右的重叠"""
+        if not text:
+            return []
+        if estimate_tokens(text) <= self.max_tokens:
+            return [text]
+
+        chunks = []
+        current: List[str] = []
+        current_tokens = 0
+
+        for sentence in self.split_sentences(text):
+            tokens = estimate_tokens(sentence)
+            if current and current_tokens + tokens > self.max_tokens:
+                chunks.append(''.join(current).strip())
+
+                # 从末尾回溯句子作为下一片段的重叠部分
+                overlap: List[str] = []
+                overlap_size = 0
+                for prev in reversed(current):
+                    prev_tokens = estimate_tokens(prev)
+                    if overlap_size + prev_tokens > self.overlap_tokens:
+                        break
+                    overlap.insert(0, prev)
+                    overlap_size += prev_tokens
+                current = overlap
+                current_tokens = overlap_size
+
+            current.append(sentence)
+            current_tokens += tokens
+
+        if current:
+            chunks.append(''.join(current).strip())
+
+        return chunks
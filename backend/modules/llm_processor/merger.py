@@ -0,0 +1,78 @@
+import re
+from typing import Dict, List, Tuple
+
+from modules.llm_processor.stream_parser import ENTITY_KEYS, RELATIONSHIP_KEYS
+
+ID_PREFIX_PATTERN = re.compile(r'^([A-Za-z]+)')
+
+
+def split_graph(graph: Dict) -> Tuple[str, List[Dict], str, List[Dict]]:
+    """识别图谱使用的字段名，返回 (实体字段, 实体列表, 关系字段, 关系列表)"""
+    entity_key = next((k for k in ENTITY_KEYS if isinstance(graph.get(k), list)), ENTITY_KEYS[0])
+    relationship_key = next((k for k in RELATIONSHIP_KEYS if isinstance(graph.get(k), list)), RELATIONSHIP_KEYS[0])
+    return entity_key, graph.get(entity_key) or [], relationship_key, graph.get(relationship_key) or []
+
+
+def merge_chunk_graphs(graphs: List[Dict]) -> Dict[str, List[Dict]]:
+    """合并各片段抽取的图谱
+
+    每个片段的ID都从p1、o1开始编号，合并时按原有前缀重新分配全局ID；
+    类型和名称相同的实体（片段重叠部分常见）合并为同一个节点。
+    """
+    entity_key = relationship_key = None
+    merged_entities: List[Dict] = []
+    merged_relationships: List[Dict] = []
+    by_name: Dict[Tuple[str, str], str] = {}
+    prefix_counters: Dict[str, int] = {}
+    seen_relationships = set()
+
+    for graph in graphs:
+        if not isinstance(graph, dict):
+            continue
+        e_key, entities, r_key, relationships = split_graph(graph)
+        entity_key = entity_key or (e_key if entities else None)
+        relationship_key = relationship_key or (r_key if relationships else None)
+
+        id_map: Dict[str, str] = {}
+        for entity in entities:
+            if not isinstance(entity, dict) or entity.get('id') is None:
+                continue
+            local_id = str(entity['id'])
+            name = str(entity.get('name') or entity.get('label') or local_id).strip().lower()
+            name_key = (str(entity.get('type', '')).lower(), name)
+
+            if name_key in by_name:
+                id_map[local_id] = by_name[name_key]
+                continue
+
+            match = ID_PREFIX_PATTERN.match(local_id)
+            prefix = match.group(1) if match else 'n'
+            prefix_counters[prefix] = prefix_counters.get(prefix, 0) + 1
+            global_id = f"{prefix}{prefix_counters[prefix]}"
+
+            by_name[name_key] = global_id
+            id_map[local_id] = global_id
+            merged_entities.append({**entity, 'id': global_id})
+
+        for rel in relationships:
+            if not isinstance(rel, dict):
+                continue
+            source = id_map.get(str(rel.get('source', rel.get('from'))))
+            target = id_map.get(str(rel.get('target', rel.get('to'))))
+            if source is None or target is None:
+                continue
+            label = rel.get('type', rel.get('label', ''))
+            rel_key = (source, target, label)
+            if rel_key in seen_relationships:
+                continue
+            seen_relationships.add(rel_key)
+
+            remapped = {k: v for k, v in rel.items() if k not in ('from', 'to')}
+            remapped['source'] = source
+            remapped['target'] = target
+            merged_relationships.append(remapped)
+
+    return {
+        entity_key or ENTITY_KEYS[0]: merged_entities,
+        relationship_key or RELATIONSHIP_KEYS[0]: merged_relationships
+    }
@@ -0,0 +1,44 @@
+import threading
+from typing import Any, Dict, Optional
+
+# 单次生成的结果分类
+OK = 'ok'
+PARSE_FAILURE = 'parse_failure'            # 输出无法解析出图谱
+VALIDATION_FAILURE = 'validation_failure'  # 能解析，但有重复ID、缺少字段或悬空关系被丢弃
+
+
+class ParseStats:
+    """按模型统计LLM输出的解析失败率和重试情况"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.models: Dict[str, Dict[str, int]] = {}
+
+    def record(self, model: str, outcome: str, retry: bool = False) -> None:
+        with self.lock:
+            stats = self.models.setdefault(model, {
+                'generations': 0, OK: 0, PARSE_FAILURE: 0, VALIDATION_FAILURE: 0, 'retries': 0, 'recovered': 0
+            })
+            stats['generations'] += 1
+            stats[outcome] += 1
+            if retry:
+                stats['retries'] += 1
+                if outcome == OK:
+                    stats['recovered'] += 1
+
+    def snapshot(self, model: Optional[str] = None) -> Dict[str, Any]:
+        """每个模型的计数和失败率（解析失败 + 校验失败）/ 生成次数"""
+        with self.lock:
+            models = {name: dict(stats) for name, stats in self.models.items() if model in (None, name)}
+        for stats in models.values():
+            failures = stats[PARSE_FAILURE] + stats[VALIDATION_FAILURE]
+            stats['failure_rate'] = round(failures / stats['generations'], 4) if stats['generations'] else 0.0
+        return models
+
+
+_default_stats = ParseStats()
+
+
+def get_parse_stats() -> ParseStats:
+    """获取进程内共享的解析统计"""
+    return _default_stats
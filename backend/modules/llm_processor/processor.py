@@ -1,39 +1,42 @@
 import requests
 import json
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.llm_processor.chunker import TextChunker
+from modules.llm_processor.merger import merge_chunk_graphs
+from modules.llm_processor.stream_parser import parse_graph
+from modules.cache.llm_cache import LLMCache, get_default_cache
+from modules.ollama.transport import OllamaTransport, get_transport
+from modules.ollama.async_transport import AsyncOllamaTransport, httpx
+from modules.ollama.usage import TokenUsage
+from modules.metrics.registry import get_metrics
+import config
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class LLMProcessor:
-    def __init__(self, host: str = "http://localhost:11434"):
+    SYSTEM_PROMPT = "你是一个专业的知识图谱生成助手。请严格按照要求生成JSON格式的输出。"
+
+    def __init__(self, transport: Optional[OllamaTransport] = None, cache: Optional[LLMCache] = None):
         """初始化LLM处理器"""
-        self.host = host
+        # 默认使用共享的传输层（连接池、超时和重试策略统一配置）
+        self.transport = transport or get_transport()
+        self.host = self.transport.host
+        self.cache = cache or get_default_cache()
         self.default_model = "llama3:latest"  # 使用已安装的模型
+        self.usage = TokenUsage()
         
     def get_models(self) -> List[Dict[str, Any]]:
         """获取可用的模型列表"""
         try:
-            response = requests.get(f"{self.host}/api/tags")
-            response.raise_for_status()
-            
-            # 检查响应内容类型
-            content_type = response.headers.get('content-type', '')
-            if 'application/json' not in content_type.lower():
-                logger.error(f"Unexpected content type: {content_type}")
-                logger.error(f"Response text: {response.text[:200]}")  # 只记录前200个字符
-                raise ValueError(f"服务器返回了非JSON响应: {content_type}")
-            
-            # 解析响应
-            data = response.json()
-            if not isinstance(data, list):
-                raise ValueError("Invalid response format from Ollama API")
-                
             # 提取模型信息
             models = []
-            for model in data:
+            for model in self.transport.list_models():
                 if isinstance(model, dict) and 'name' in model:
                     models.append({
                         'name': model['name'],
@@ -50,29 +53,61 @@ class LLMProcessor:
             logger.error(f"Error getting models: {str(e)}")
             raise Exception(f"获取模型列表失败: {str(e)}")
             
-    def process(self, model: str, prompt: str, content: str) -> str:
+    def _build_request(self, model: str, prompt: str, content: str, stream: bool,
+                       format: Any = None) -> Dict[str, Any]:
+        """构造Ollama generate请求数据
+
+        系统提示词通过 system 字段发送，与提示词模板中 {text} 之前的部分一起构成每次相同的前缀，
+        模型保持加载（keep_alive）时Ollama只需评估前缀之后的内容。format 为 "json" 或JSON Schema时约束输出格式。
+        """
+        with get_metrics().span('prompt_build', template='structure'):
+            full_prompt = prompt.replace('{text}', content)
+        data = {
+            "model": model or self.default_model,
+            "system": self.SYSTEM_PROMPT,
+            "prompt": full_prompt,
+            "stream": stream,
+            "keep_alive": config.OLLAMA_KEEP_ALIVE,
+            "options": {
+                "temperature": 0.7,
+                "top_p": 0.9,
+                "top_k": 40
+            }
+        }
+        if format:
+            data["format"] = format
+        return data
+
+    def _cache_key(self, data: Dict[str, Any]) -> str:
+        """根据请求数据生成缓存键"""
+        options = data.get("options")
+        if data.get("format"):
+            options = {**options, "format": data["format"]}
+        return LLMCache.make_key(data["model"], data["prompt"], data["system"], options=options)
+
+    def _finish(self, result: Dict[str, Any], data: Dict[str, Any], cache_key: str) -> str:
+        """记录token用量并缓存生成的文本"""
+        self.usage.record(result, data["model"])
+        generated_text = result['response'].strip()
+        logger.info(f"Generated text: {generated_text[:200]}...")  # 只记录前200个字符
+        self.cache.set(cache_key, {'response': generated_text}, data["model"])
+        return generated_text
+
+    def process(self, model: str, prompt: str, content: str, format: Any = None) -> str:
         """处理内容并生成结构化输出"""
         try:
             # 准备请求数据
-            system_prompt = "你是一个专业的知识图谱生成助手。请严格按照要求生成JSON格式的输出。"
-            full_prompt = f"{system_prompt}\n\n{prompt.replace('{text}', content)}"
-            
-            data = {
-                "model": model or self.default_model,
-                "prompt": full_prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "top_k": 40
-                }
-            }
+            data = self._build_request(model, prompt, content, stream=False, format=format)
+            cache_key = self._cache_key(data)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached['response']
             
             logger.info(f"Sending request to Ollama API with model: {model or self.default_model}")
             
-            # 发送请求到Ollama，不设置超时
-            response = requests.post(
-                f"{self.host}/api/generate",  # 使用 generate API 端点
+            # 发送请求到Ollama
+            response = self.transport.post(
+                "/api/generate",  # 使用 generate API 端点
                 json=data
             )
             
@@ -94,10 +129,7 @@ class LLMProcessor:
                 logger.error(f"Invalid response format: {json.dumps(result, indent=2)}")
                 raise ValueError("Ollama API返回了无效的响应格式")
                 
-            # 尝试解析生成的内容为JSON
-            generated_text = result['response'].strip()
-            logger.info(f"Generated text: {generated_text[:200]}...")  # 只记录前200个字符
-            return generated_text
+            return self._finish(result, data, cache_key)
                 
         except requests.exceptions.RequestException as e:
             logger.error(f"Ollama API请求失败: {str(e)}")
@@ -106,10 +138,153 @@ class LLMProcessor:
             logger.error(f"处理内容时发生错误: {str(e)}")
             raise Exception(str(e))
             
+    def process_chunked(self, model: str, prompt: str, content: str,
+                        chunker: Optional[TextChunker] = None, max_workers: int = 4, format: Any = None) -> str:
+        """长文本分片并发处理（map-reduce），返回合并后的图谱JSON"""
+        chunker = chunker or TextChunker()
+        chunks = chunker.chunk(content)
+        if len(chunks) <= 1:
+            return self.process(model, prompt, content, format)
+
+        logger.info(f"Processing {len(chunks)} chunks with up to {max_workers} workers")
+
+        def run(chunk: str) -> Optional[Dict]:
+            try:
+                return parse_graph(self.process(model, prompt, chunk, format))
+            except Exception as e:
+                logger.error(f"处理分片失败: {str(e)}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            graphs = list(executor.map(run, chunks))
+
+        succeeded = [g for g in graphs if g is not None]
+        if not succeeded:
+            raise Exception("所有分片处理均失败")
+        if len(succeeded) < len(chunks):
+            logger.warning(f"{len(chunks) - len(succeeded)} of {len(chunks)} chunks failed")
+
+        return json.dumps(merge_chunk_graphs(succeeded), ensure_ascii=False)
+
+    def process_stream(self, model: str, prompt: str, content: str, format: Any = None) -> Iterator[Dict[str, Any]]:
+        """流式处理内容，按Ollama的输出逐块产出响应数据"""
+        data = self._build_request(model, prompt, content, stream=True, format=format)
+        cache_key = self._cache_key(data)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            # 命中缓存时一次性返回完整结果
+            yield {'response': cached['response'], 'done': True, 'cached': True}
+            return
+
+        logger.info(f"Sending streaming request to Ollama API with model: {model or self.default_model}")
+
+        parts = []
+        try:
+            with self.transport.post(
+                "/api/generate",
+                json=data,
+                stream=True
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if 'error' in chunk:
+                        raise ValueError(f"Ollama返回错误: {chunk['error']}")
+                    parts.append(chunk.get('response', ''))
+                    if chunk.get('done'):
+                        # 最后一块带有本次调用的token数和耗时
+                        chunk['usage'] = self.usage.record(chunk, data["model"])
+                        self.cache.set(cache_key, {'response': ''.join(parts).strip()}, data["model"])
+                        yield chunk
+                        break
+                    yield chunk
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Ollama API流式请求失败: {str(e)}")
+            raise Exception(f"无法连接到Ollama服务: {str(e)}")
+
+    async def aprocess(self, transport: AsyncOllamaTransport, model: str, prompt: str, content: str,
+                       format: Any = None) -> str:
+        """process 的异步版本，等待Ollama响应时不占用线程；任务被取消时Ollama请求随之中断"""
+        data = self._build_request(model, prompt, content, stream=False, format=format)
+        cache_key = self._cache_key(data)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached['response']
+
+        logger.info(f"Sending async request to Ollama API with model: {data['model']}")
+        try:
+            response = await transport.post("/api/generate", json=data)
+            response.raise_for_status()
+            result = response.json()
+        except httpx.HTTPError as e:
+            logger.error(f"Ollama API请求失败: {str(e)}")
+            raise Exception(f"无法连接到Ollama服务: {str(e)}")
+        except ValueError:
+            raise ValueError(f"服务器返回了非JSON响应: {response.headers.get('content-type', '')}")
+        if 'response' not in result:
+            logger.error(f"Invalid response format: {json.dumps(result, indent=2)}")
+            raise ValueError("Ollama API返回了无效的响应格式")
+        return self._finish(result, data, cache_key)
+
+    async def aprocess_chunked(self, transport: AsyncOllamaTransport, model: str, prompt: str, content: str,
+                               chunker: Optional[TextChunker] = None, max_workers: int = 4,
+                               format: Any = None) -> str:
+        """process_chunked 的异步版本，分片请求并发数受 max_workers 限制"""
+        chunker = chunker or TextChunker()
+        chunks = chunker.chunk(content)
+        if len(chunks) <= 1:
+            return await self.aprocess(transport, model, prompt, content, format)
+
+        logger.info(f"Processing {len(chunks)} chunks with up to {max_workers} concurrent requests")
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def run(chunk: str) -> Optional[Dict]:
+            async with semaphore:
+                try:
+                    return parse_graph(await self.aprocess(transport, model, prompt, chunk, format))
+                except Exception as e:
+                    logger.error(f"处理分片失败: {str(e)}")
+                    return None
+
+        graphs = await asyncio.gather(*(run(chunk) for chunk in chunks))
+        succeeded = [g for g in graphs if g is not None]
+        if not succeeded:
+            raise Exception("所有分片处理均失败")
+        if len(succeeded) < len(chunks):
+            logger.warning(f"{len(chunks) - len(succeeded)} of {len(chunks)} chunks failed")
+
+        return json.dumps(merge_chunk_graphs(succeeded), ensure_ascii=False)
+
+    async def aprocess_stream(self, transport: AsyncOllamaTransport, model: str, prompt: str, content: str,
+                              format: Any = None) -> AsyncIterator[Dict[str, Any]]:
+        """process_stream 的异步版本"""
+        data = self._build_request(model, prompt, content, stream=True, format=format)
+        cache_key = self._cache_key(data)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            yield {'response': cached['response'], 'done': True, 'cached': True}
+            return
+
+        logger.info(f"Sending async streaming request to Ollama API with model: {data['model']}")
+        parts = []
+        try:
+            async for line in transport.stream_lines("/api/generate", data):
+                chunk = json.loads(line)
+                if 'error' in chunk:
+                    raise ValueError(f"Ollama返回错误: {chunk['error']}")
+                parts.append(chunk.get('response', ''))
+                if chunk.get('done'):
+                    chunk['usage'] = self.usage.record(chunk, data["model"])
+                    self.cache.set(cache_key, {'response': ''.join(parts).strip()}, data["model"])
+                    yield chunk
+                    break
+                yield chunk
+        except httpx.HTTPError as e:
+            logger.error(f"Ollama API流式请求失败: {str(e)}")
+            raise Exception(f"无法连接到Ollama服务: {str(e)}")
+
     def is_service_available(self) -> bool:
         """检查Ollama服务是否可用"""
-        try:
-            response = requests.get(f"{self.host}/api/tags")
-            return response.status_code == 200
-        except:
-            return False
+        return self.transport.is_available()
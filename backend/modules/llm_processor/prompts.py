@@ -0,0 +1,28 @@
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from modules.metrics.registry import get_metrics
+
+
+class PromptTemplate:
+    """静态前缀 + 动态内容 的提示词模板
+
+    system 为每次请求都完全相同的说明和示例，作为Ollama的 system 字段放在最前面；
+    template 只包含与本次内容相关的部分。前缀逐字节相同时，Ollama可以复用已加载模型中
+    该前缀的KV缓存，只需评估新增的内容，短页面的提示词评估耗时因此大幅减少。
+    schema 为输出的JSON Schema，作为Ollama的 format 字段发送，约束模型只生成符合结构的JSON。
+    """
+
+    def __init__(self, name: str, system: str, template: str = '{content}',
+                 schema: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.system = system
+        self.template = template
+        self.schema = schema
+
+    def render(self, **values) -> Tuple[str, str]:
+        """返回 (system, prompt)"""
+        start = time.perf_counter()
+        prompt = self.template.format(**values)
+        get_metrics().observe_stage('prompt_build', time.perf_counter() - start, template=self.name)
+        return self.system, prompt
@@ -0,0 +1,364 @@
+import json
+import re
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from modules.metrics.registry import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# 大模型可能使用的实体/关系数组字段名
+ENTITY_KEYS = ('entities', 'nodes')
+RELATIONSHIP_KEYS = ('relationships', 'edges', 'relations')
+
+# 字符串内部只需关心引号和转义符，字符串外部只需关心结构字符
+_STRING_SPECIAL = re.compile(r'["\\]')
+_STRUCTURE_SPECIAL = re.compile(r'["{}\[\],]')
+_TOKEN_SPECIAL = re.compile(r'["{}\[\]:,]')
+_FENCE = re.compile(r'^\s*```[\w-]*\s*\n?|\n?\s*```\s*$')
+_CLOSERS = {'{': '}', '[': ']'}
+
+
+class StreamingGraphParser:
+    """增量解析LLM流式输出的图谱JSON
+
+    每次feed一段token文本，当实体数组或关系数组中的某个对象闭合时立即返回该对象，
+    无需等待整个JSON生成完毕。JSON之外的内容（如markdown代码块标记、说明文字）会被忽略，
+    输出被截断时已闭合的对象全部保留。已处理完的文本会被丢弃，缓冲区只保留当前未闭合的对象。
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.pos = 0
+        # 容器栈，每一项为 [类型('{'或'['), 所属字段名, 起始位置]
+        self.stack: List[List[Any]] = []
+        self.in_string = False
+        self.string_start = -1
+        self.last_string = None
+        self.pending_key = None
+        self.finished = False
+        self.entities: List[Dict] = []
+        self.relationships: List[Dict] = []
+        self.entity_key = None
+        self.relationship_key = None
+        # 顶层对象中的字符串字段，如融合模式的 page_type
+        self.fields: Dict[str, str] = {}
+
+    def feed(self, text: str) -> List[Tuple[str, Dict]]:
+        """输入新的文本片段，返回本次新闭合的 (kind, obj) 列表，kind为entity或relationship"""
+        if self.finished or not text:
+            return []
+
+        self.buffer += text
+        events = []
+        buffer = self.buffer
+        i = self.pos
+        end = len(buffer)
+
+        while i < end:
+            if self.in_string:
+                # 直接跳到下一个引号或转义符
+                match = _STRING_SPECIAL.search(buffer, i)
+                if match is None:
+                    i = end
+                    break
+                i = match.start()
+                if buffer[i] == '\\':
+                    if i + 1 >= end:
+                        # 转义符在片段末尾，等下一段文本到达后再处理
+                        break
+                    i += 2
+                    continue
+                self.in_string = False
+                self.last_string = buffer[self.string_start:i + 1]
+                if len(self.stack) == 1 and self.pending_key is not None:
+                    self._set_field(self.pending_key, self.last_string)
+                i += 1
+                continue
+
+            if not self.stack:
+                # 顶层对象之前的内容直接跳过
+                i = buffer.find('{', i)
+                if i < 0:
+                    i = end
+                    break
+                self.stack.append(['{', None, i])
+                i += 1
+                continue
+
+            match = _TOKEN_SPECIAL.search(buffer, i)
+            if match is None:
+                i = end
+                break
+            i = match.start()
+            ch = buffer[i]
+            if ch == '"':
+                self.in_string = True
+                self.string_start = i
+            elif ch == ':':
+                if self.stack[-1][0] == '{' and self.last_string is not None:
+                    try:
+                        self.pending_key = json.loads(self.last_string)
+                    except ValueError:
+                        self.pending_key = None
+            elif ch == ',':
+                self.pending_key = None
+                self.last_string = None
+            elif ch in '{[':
+                key = self.pending_key if self.stack[-1][0] == '{' else None
+                self.stack.append([ch, key, i])
+                self.pending_key = None
+                self.last_string = None
+            else:
+                frame = self.stack.pop()
+                self.pending_key = None
+                self.last_string = None
+                if not self.stack:
+                    self.finished = True
+                    i += 1
+                    break
+                if frame[0] == '{' and len(self.stack) == 2:
+                    event = self._emit(self.stack[-1], buffer[frame[2]:i + 1])
+                    if event:
+                        events.append(event)
+            i += 1
+
+        self._trim(i)
+        return events
+
+    def _trim(self, pos: int) -> None:
+        """丢弃已处理的文本，只保留未闭合的实体/关系对象和未结束的字符串"""
+        keep = self.string_start if self.in_string else pos
+        if len(self.stack) > 2:
+            keep = min(keep, self.stack[2][2])
+        if keep <= 0:
+            self.pos = pos
+            return
+        self.buffer = self.buffer[keep:]
+        self.pos = pos - keep
+        self.string_start -= keep
+        for frame in self.stack:
+            frame[2] -= keep
+
+    def _set_field(self, key: str, raw: str) -> None:
+        try:
+            self.fields[key] = json.loads(raw, strict=False)
+        except ValueError:
+            pass
+
+    def _emit(self, parent: List[Any], raw: str):
+        """解析闭合的对象，并根据所在数组判断是实体还是关系"""
+        if parent[0] != '[':
+            return None
+        key = parent[1]
+        if key in ENTITY_KEYS:
+            kind = 'entity'
+        elif key in RELATIONSHIP_KEYS:
+            kind = 'relationship'
+        else:
+            return None
+
+        try:
+            obj = json.loads(raw, strict=False)
+        except ValueError:
+            # 常见的小错误（多余的逗号）修复后再试一次
+            try:
+                obj = json.loads(strip_trailing_commas(raw), strict=False)
+            except ValueError as e:
+                logger.debug(f"Skipping malformed {kind} object: {str(e)}")
+                return None
+        if not isinstance(obj, dict):
+            return None
+
+        if kind == 'entity':
+            self.entity_key = key
+            self.entities.append(obj)
+        else:
+            self.relationship_key = key
+            self.relationships.append(obj)
+        return kind, obj
+
+    def result(self) -> Dict[str, Any]:
+        """返回目前为止解析出的完整图谱（以及顶层的字符串字段）"""
+        return {
+            **self.fields,
+            self.entity_key or ENTITY_KEYS[0]: list(self.entities),
+            self.relationship_key or RELATIONSHIP_KEYS[0]: list(self.relationships)
+        }
+
+
+def parse_graph(text: str) -> Dict[str, List[Dict]]:
+    """解析完整的LLM输出，容忍代码块标记和前后多余文字"""
+    with get_metrics().span('json_parse'):
+        parser = StreamingGraphParser()
+        parser.feed(text)
+        return parser.result()
+
+
+def strip_fences(text: str) -> str:
+    """去掉首尾的markdown代码块标记"""
+    return _FENCE.sub('', text)
+
+
+def strip_trailing_commas(text: str) -> str:
+    """去掉 } 或 ] 前多余的逗号（字符串内部的逗号保持不变）"""
+    out = []
+    i, end = 0, len(text)
+    while i < end:
+        match = _STRUCTURE_SPECIAL.search(text, i)
+        if match is None:
+            out.append(text[i:])
+            break
+        j = match.start()
+        out.append(text[i:j])
+        ch = text[j]
+        if ch == '"':
+            k = _string_end(text, j + 1)
+            out.append(text[j:k])
+            i = k
+            continue
+        if ch == ',':
+            rest = text[j + 1:].lstrip()
+            if rest[:1] in ('}', ']'):
+                i = j + 1
+                continue
+        out.append(ch)
+        i = j + 1
+    return ''.join(out)
+
+
+def _string_end(text: str, i: int) -> int:
+    """从字符串内容的起点开始，返回闭合引号之后的位置；字符串未闭合时返回文本长度"""
+    end = len(text)
+    while i < end:
+        match = _STRING_SPECIAL.search(text, i)
+        if match is None:
+            return end
+        i = match.start()
+        if text[i] == '\\':
+            i += 2
+            continue
+        return i + 1
+    return end
+
+
+def repair_json(text: str) -> Optional[str]:
+    """截取文本中第一个JSON对象/数组；输出被截断时保留最长的完整前缀并补齐括号
+
+    只在值与值之间的边界（逗号、容器开始或结束处）截断，截断后的结果一定是结构完整的JSON。
+    顶层以下的对象（实体、关系等）视为整体，不完整时整个丢弃，不会留下缺少字段的半个实体。
+    无法找到JSON时返回None。
+    """
+    text = strip_fences(text)
+    starts = [p for p in (text.find('{'), text.find('[')) if p >= 0]
+    if not starts:
+        return None
+    start = min(starts)
+
+    stack: List[str] = []
+    # 栈中除顶层外未闭合的对象数，为0时才可以截断
+    open_objects = 0
+    cut: Optional[Tuple[int, int]] = None
+    i, end = start, len(text)
+    while i < end:
+        match = _STRUCTURE_SPECIAL.search(text, i)
+        if match is None:
+            break
+        i = match.start()
+        ch = text[i]
+        if ch == '"':
+            i = _string_end(text, i + 1)
+            continue
+        if ch in '{[':
+            if ch == '{' and stack:
+                open_objects += 1
+            stack.append(ch)
+            pos = i + 1
+        elif ch in '}]':
+            if not stack or _CLOSERS[stack[-1]] != ch:
+                break
+            stack.pop()
+            if not stack:
+                return text[start:i + 1]
+            if ch == '}':
+                open_objects -= 1
+            pos = i + 1
+        else:
+            pos = i
+        if not open_objects:
+            cut = (pos, len(stack))
+        i += 1
+
+    if cut is None:
+        return None
+    pos, depth = cut
+    return text[start:pos] + ''.join(_CLOSERS[c] for c in reversed(stack[:depth]))
+
+
+def loads_tolerant(text: str) -> Any:
+    """容错地解析LLM输出的JSON：代码块标记、前后说明文字、多余逗号、截断的输出
+
+    完整合法的JSON直接解析；否则解析修复后最长的有效前缀。无法解析时抛出ValueError。
+    """
+    with get_metrics().span('json_parse'):
+        return _loads_tolerant(text)
+
+
+def _loads_tolerant(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    candidate = repair_json(text)
+    if candidate is None:
+        raise ValueError("No JSON object found in response")
+    try:
+        # strict=False 允许字符串中出现未转义的换行等控制字符
+        return json.loads(candidate, strict=False)
+    except ValueError:
+        return json.loads(strip_trailing_commas(candidate), strict=False)
+
+
+def _valid_id(value: Any) -> bool:
+    """实体ID和关系端点只接受字符串或整数，对象、数组等不可哈希的值视为无效"""
+    return isinstance(value, (str, int)) and not isinstance(value, bool)
+
+
+def validate_graph(graph: Any) -> Dict[str, Any]:
+    """校验并清理抽取结果，一次遍历完成
+
+    实体ID重复时保留第一个，缺少ID或ID不是字符串/整数（如对象、数组）的实体被丢弃；
+    关系的两个端点都存在时才保留。丢弃的数量记录在 dropped 中，不会因为个别错误丢掉整个结果。
+    """
+    if not isinstance(graph, dict):
+        raise ValueError("Response is not a dictionary")
+    entity_key = next((k for k in ENTITY_KEYS if isinstance(graph.get(k), list)), None)
+    relationship_key = next((k for k in RELATIONSHIP_KEYS if isinstance(graph.get(k), list)), None)
+    if entity_key is None:
+        raise ValueError("Missing required keys: entities or relationships")
+
+    entities = []
+    ids = set()
+    dropped_entities = 0
+    for entity in graph[entity_key]:
+        entity_id = entity.get('id') if isinstance(entity, dict) else None
+        if not _valid_id(entity_id) or entity_id in ids:
+            dropped_entities += 1
+            continue
+        ids.add(entity_id)
+        entities.append(entity)
+
+    relationships = []
+    dropped_relationships = 0
+    for rel in graph[relationship_key] if relationship_key else []:
+        source = rel.get('source', rel.get('from')) if isinstance(rel, dict) else None
+        target = rel.get('target', rel.get('to')) if isinstance(rel, dict) else None
+        if _valid_id(source) and _valid_id(target) and source in ids and target in ids:
+            relationships.append(rel)
+        else:
+            dropped_relationships += 1
+
+    result = {'entities': entities, 'relationships': relationships}
+    if dropped_entities or dropped_relationships:
+        result['dropped'] = {'entities': dropped_entities, 'relationships': dropped_relationships}
+    return result
@@ -0,0 +1,197 @@
+import time
+import random
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# 各阶段耗时的直方图分桶（秒），覆盖从毫秒级的解析到分钟级的LLM生成
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+# 采集函数返回的指标族：(名称, 类型, 说明, [(标签, 值)])
+MetricFamily = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+# 当前请求的各阶段耗时，用于生成 Server-Timing 响应头
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('graphrager_trace', default=None)
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Histogram:
+    """按标签分组的直方图，只保存每个分桶的计数、总和与次数"""
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.series: Dict[LabelKey, List] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+        # 只计入第一个满足 value <= le 的分桶，输出时再累加
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        for key, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for le, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{_format_labels(key, (("le", _format_value(le)),))} {cumulative}'
+            yield f'{self.name}_bucket{_format_labels(key, (("le", "+Inf"),))} {count}'
+            yield f'{self.name}_sum{_format_labels(key)} {_format_value(total)}'
+            yield f'{self.name}_count{_format_labels(key)} {count}'
+
+
+class Counter:
+    """按标签分组的累加计数"""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.series: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        self.series[key] = self.series.get(key, 0) + amount
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        for key, value in sorted(self.series.items()):
+            yield f'{self.name}{_format_labels(key)} {_format_value(value)}'
+
+
+class MetricsRegistry:
+    """进程内的指标注册表，以Prometheus文本格式输出
+
+    直方图和计数器在处理过程中实时更新；缓存命中率等已有统计通过采集函数在输出时读取，
+    避免在热路径上重复计数。
+    """
+
+    def __init__(self, namespace: str = 'graphrager'):
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, object] = {}
+        self.collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        full_name = f'{self.namespace}_{name}'
+        with self.lock:
+            return self.metrics.setdefault(full_name, Histogram(full_name, help, buckets))
+
+    def counter(self, name: str, help: str) -> Counter:
+        full_name = f'{self.namespace}_{name}'
+        with self.lock:
+            return self.metrics.setdefault(full_name, Counter(full_name, help))
+
+    def observe(self, metric: Histogram, value: float, **labels) -> None:
+        with self.lock:
+            metric.observe(value, **labels)
+
+    def inc(self, metric: Counter, amount: float = 1, **labels) -> None:
+        with self.lock:
+            metric.inc(amount, **labels)
+
+    def add_collector(self, collector: Callable[[], Iterable[MetricFamily]]) -> None:
+        """注册采集函数，输出指标时调用"""
+        self.collectors.append(collector)
+
+    def observe_stage(self, stage: str, seconds: float, **labels) -> None:
+        """记录一个处理阶段的耗时，同时计入当前请求的 Server-Timing"""
+        self.observe(self.stage_duration, seconds, stage=stage, **labels)
+        trace = _current_trace.get()
+        if trace is not None:
+            total, count = trace.get(stage, (0.0, 0))
+            trace[stage] = (total + seconds, count + 1)
+
+    @contextmanager
+    def span(self, stage: str, **labels):
+        """统计代码块耗时的上下文管理器"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() - start, **labels)
+
+    @property
+    def stage_duration(self) -> Histogram:
+        return self.histogram('stage_duration_seconds', 'Duration of processing stages')
+
+    def render(self) -> str:
+        """Prometheus文本格式（text/plain; version=0.0.4）"""
+        lines: List[str] = []
+        with self.lock:
+            for metric in self.metrics.values():
+                lines.extend(metric.render())
+        for collector in self.collectors:
+            for name, kind, help, samples in collector():
+                full_name = f'{self.namespace}_{name}'
+                lines.append(f'# HELP {full_name} {help}')
+                lines.append(f'# TYPE {full_name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{full_name}{_format_labels(_label_key(labels))} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def start_trace() -> contextvars.Token:
+    """开始记录当前请求的阶段耗时"""
+    return _current_trace.set({})
+
+
+def current_trace() -> Optional[Dict[str, Tuple[float, int]]]:
+    """当前请求已记录的阶段耗时，未开始记录时返回None"""
+    return _current_trace.get()
+
+
+def finish_trace(token: contextvars.Token) -> Dict[str, Tuple[float, int]]:
+    """结束记录，返回 阶段 -> (总耗时, 次数)"""
+    trace = _current_trace.get() or {}
+    _current_trace.reset(token)
+    return trace
+
+
+def server_timing(trace: Dict[str, Tuple[float, int]]) -> str:
+    """生成 Server-Timing 响应头，浏览器开发者工具可以直接展示各阶段耗时"""
+    return ', '.join(f'{stage};dur={total * 1000:.1f}' for stage, (total, _) in trace.items())
+
+
+def sampled(rate: float) -> bool:
+    """按比例采样，rate 为0时从不采样，为1时总是采样"""
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+_default_registry = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """获取进程内共享的指标注册表"""
+    return _default_registry
@@ -0,0 +1,116 @@
+import time
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+try:
+    import httpx
+except ImportError:  # 仅ASGI模式需要
+    httpx = None
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncOllamaTransport:
+    """基于httpx.AsyncClient的Ollama传输层，供ASGI模式使用
+
+    与 OllamaTransport 的接口和健康检查缓存一致。请求在事件循环中等待，不占用线程，
+    一个进程可以同时保持大量进行中的LLM调用；请求所在的任务被取消时连接随之关闭，
+    Ollama会停止生成。
+    """
+
+    def __init__(self, host: str = None, max_connections: int = None, max_retries: int = None,
+                 connect_timeout: float = None, read_timeout: float = None, health_ttl: float = None):
+        if httpx is None:
+            raise RuntimeError('httpx is required for the ASGI server: pip install httpx')
+        self.host = (host or config.OLLAMA_HOST).rstrip('/')
+        self.health_ttl = health_ttl if health_ttl is not None else config.OLLAMA_HEALTH_TTL
+        timeout = httpx.Timeout(
+            read_timeout if read_timeout is not None else config.OLLAMA_READ_TIMEOUT,
+            connect=connect_timeout if connect_timeout is not None else config.OLLAMA_CONNECT_TIMEOUT
+        )
+        max_connections = max_connections or config.ASYNC_MAX_CONNECTIONS
+        # httpx只对连接失败做重试，5xx由调用方处理
+        transport = httpx.AsyncHTTPTransport(
+            retries=max_retries if max_retries is not None else config.OLLAMA_MAX_RETRIES,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+        self.client = httpx.AsyncClient(base_url=self.host, timeout=timeout, transport=transport)
+
+        self._probe_lock = asyncio.Lock()
+        self._probe_time = 0.0
+        self._models: Optional[List[Dict[str, Any]]] = None
+        self._probe_error: Optional[str] = None
+
+    async def get(self, path: str, **kwargs) -> 'httpx.Response':
+        return await self.client.get(path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> 'httpx.Response':
+        return await self.client.post(path, **kwargs)
+
+    async def stream_lines(self, path: str, json: Dict[str, Any]) -> AsyncIterator[str]:
+        """POST并逐行读取响应（NDJSON），提前退出或被取消时关闭连接"""
+        async with self.client.stream('POST', path, json=json) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line:
+                    yield line
+
+    async def _probe(self, force: bool = False) -> None:
+        """访问 /api/tags 并缓存结果，TTL内直接复用"""
+        async with self._probe_lock:
+            if not force and time.time() - self._probe_time < self.health_ttl:
+                return
+            try:
+                response = await self.get('/api/tags', timeout=10)
+                response.raise_for_status()
+                self._models = response.json().get('models', [])
+                self._probe_error = None
+            except (httpx.HTTPError, ValueError) as e:
+                logger.warning(f"Ollama health probe failed: {str(e)}")
+                self._models = None
+                self._probe_error = str(e)
+            self._probe_time = time.time()
+
+    async def list_models(self, force: bool = False) -> List[Dict[str, Any]]:
+        """获取模型列表（带短时缓存），服务不可用时抛出ConnectionError"""
+        await self._probe(force)
+        if self._models is None:
+            raise ConnectionError(self._probe_error or "Ollama service unavailable")
+        return list(self._models)
+
+    async def is_available(self, force: bool = False) -> bool:
+        """检查Ollama服务是否可用（带短时缓存）"""
+        await self._probe(force)
+        return self._models is not None
+
+    async def preload(self, model: str, keep_alive: Optional[str] = None) -> bool:
+        """预先加载模型，并按 keep_alive 保持常驻内存"""
+        try:
+            response = await self.post('/api/generate', json={
+                'model': model,
+                'keep_alive': keep_alive or config.OLLAMA_KEEP_ALIVE
+            })
+            response.raise_for_status()
+            return True
+        except httpx.HTTPError as e:
+            logger.warning(f"Failed to preload model {model}: {str(e)}")
+            return False
+
+    def invalidate(self) -> None:
+        """使健康检查缓存失效"""
+        self._probe_time = 0.0
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+def create_async_transport() -> AsyncOllamaTransport:
+    """按配置创建异步传输层：OLLAMA_HOSTS 配置了多个服务时返回 AsyncOllamaPool"""
+    hosts = config.OLLAMA_HOSTS
+    if len(hosts) > 1:
+        from modules.ollama.pool import AsyncOllamaPool
+        return AsyncOllamaPool(hosts)
+    return AsyncOllamaTransport(hosts[0][0] if hosts else None)
@@ -0,0 +1,538 @@
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import requests
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+import config
+from modules.ollama.transport import OllamaTransport
+from modules.ollama.async_transport import AsyncOllamaTransport, httpx
+
+logger = logging.getLogger(__name__)
+
+HostSpec = Tuple[str, Optional[Sequence[str]]]
+
+
+def model_key(name: str) -> str:
+    """模型名称的比较键，"llama3" 与 "llama3:latest" 视为同一模型"""
+    name = (name or '').strip()
+    return name if ':' in name else f'{name}:latest'
+
+
+class Backend:
+    """池中的一个Ollama服务及其路由状态
+
+    models 为配置中声明的模型（为空时以健康检查得到的模型列表为准），loaded 为已加载到
+    内存的模型（来自 /api/ps 和最近成功的请求）。熔断器连续失败 failure_threshold 次后打开，
+    冷却期内不再分配请求；冷却结束后放行一个试探请求（半开），成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, host: str, models: Optional[Sequence[str]] = None):
+        self.host = host.rstrip('/')
+        self.declared: Optional[Set[str]] = {model_key(m) for m in models} if models else None
+        self.available: Optional[Set[str]] = None
+        self.model_info: List[Dict[str, Any]] = []
+        self.loaded: Set[str] = set()
+        self.outstanding = 0
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial = False
+        self.requests = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.checked = False
+
+    def serves(self, model: Optional[str]) -> bool:
+        if not model:
+            return True
+        key = model_key(model)
+        if self.declared is not None:
+            return key in self.declared
+        # 尚未完成健康检查时先假定可用
+        return self.available is None or key in self.available
+
+    def state(self, now: float) -> str:
+        if self.open_until > now:
+            return 'open'
+        if self.open_until:
+            return 'half_open'
+        return 'closed'
+
+    def ready(self, now: float) -> bool:
+        state = self.state(now)
+        return state == 'closed' or (state == 'half_open' and not self.trial)
+
+
+class Lease:
+    """一次 acquire 得到的服务，release 时交回；trial 表示它是半开状态下放行的那个试探请求"""
+
+    __slots__ = ('backend', 'model', 'trial')
+
+    def __init__(self, backend: Backend, model: Optional[str], trial: bool):
+        self.backend = backend
+        self.model = model
+        self.trial = trial
+
+
+class BackendRouter:
+    """在多个Ollama服务之间分配请求
+
+    只在提供该模型、熔断器未打开的服务中选择：优先选择模型已加载的服务（避免切换模型的
+    加载耗时），但其进行中的请求数比最空闲的服务多出 affinity_slack 以上时改选最空闲的服务；
+    其余情况按进行中的请求数最少选择。同步和异步连接池共用该类，选择过程只持有很短的锁。
+    """
+
+    def __init__(self, backends: Iterable[Backend], failure_threshold: int = None, cooldown: float = None,
+                 affinity_slack: int = None):
+        self.backends = list(backends)
+        self.failure_threshold = failure_threshold or config.OLLAMA_BREAKER_FAILURES
+        self.cooldown = cooldown if cooldown is not None else config.OLLAMA_BREAKER_COOLDOWN
+        self.affinity_slack = affinity_slack if affinity_slack is not None else config.OLLAMA_AFFINITY_SLACK
+        self.lock = threading.Lock()
+
+    def acquire(self, model: Optional[str] = None, exclude: Sequence[Backend] = ()) -> Optional[Lease]:
+        """选择一个服务并计入进行中的请求，没有可用服务时返回None；请求结束时把返回的 Lease 交给 release"""
+        now = time.monotonic()
+        key = model_key(model) if model else None
+        with self.lock:
+            candidates = [b for b in self.backends if b not in exclude and b.serves(model) and b.ready(now)]
+            if not candidates:
+                return None
+            least = min(candidates, key=lambda b: (b.outstanding, b.requests))
+            backend = least
+            if key:
+                loaded = [b for b in candidates if key in b.loaded]
+                if loaded:
+                    warm = min(loaded, key=lambda b: (b.outstanding, b.requests))
+                    if warm.outstanding <= least.outstanding + self.affinity_slack:
+                        backend = warm
+            trial = backend.state(now) == 'half_open'
+            if trial:
+                backend.trial = True
+            backend.outstanding += 1
+            backend.requests += 1
+            return Lease(backend, model, trial)
+
+    def release(self, lease: Lease, ok: Optional[bool] = True, error: Optional[str] = None) -> None:
+        """请求结束；ok 为None表示结果与服务状态无关（如客户端取消）
+
+        只有试探请求本身结束时才清除试探标记，半开期间其他（熔断前发出的）请求结束不会放行新的试探。
+        """
+        backend, model = lease.backend, lease.model
+        with self.lock:
+            backend.outstanding -= 1
+            if lease.trial:
+                backend.trial = False
+            if ok:
+                backend.failures = 0
+                backend.open_until = 0.0
+                if model:
+                    backend.loaded.add(model_key(model))
+            elif ok is False:
+                backend.errors += 1
+                backend.failures += 1
+                backend.last_error = error
+                if backend.failures >= self.failure_threshold or backend.open_until:
+                    if not backend.open_until or backend.open_until <= time.monotonic():
+                        logger.warning(f"Ollama backend {backend.host} circuit opened after "
+                                       f"{backend.failures} failures: {error}")
+                    backend.open_until = time.monotonic() + self.cooldown
+
+    def update_health(self, backend: Backend, models: Optional[List[Dict[str, Any]]],
+                      loaded: Optional[List[str]] = None, error: Optional[str] = None) -> None:
+        """记录健康检查结果：服务可用时关闭熔断器并更新模型列表，不可用时打开熔断器"""
+        with self.lock:
+            backend.checked = True
+            if models is None:
+                backend.last_error = error
+                backend.failures = max(backend.failures, self.failure_threshold)
+                backend.open_until = time.monotonic() + self.cooldown
+                return
+            backend.model_info = models
+            backend.available = {model_key(m.get('name') or m.get('model', '')) for m in models}
+            if loaded is not None:
+                backend.loaded = {model_key(name) for name in loaded}
+            backend.failures = 0
+            backend.open_until = 0.0
+
+    def has_candidate(self, model: Optional[str] = None, exclude: Sequence[Backend] = ()) -> bool:
+        now = time.monotonic()
+        with self.lock:
+            return any(b not in exclude and b.serves(model) and b.ready(now) for b in self.backends)
+
+    def healthy(self) -> List[Backend]:
+        now = time.monotonic()
+        with self.lock:
+            return [b for b in self.backends if b.checked and b.state(now) != 'open']
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self.lock:
+            return [{
+                'host': b.host,
+                'state': b.state(now),
+                'models': sorted(b.declared if b.declared is not None else (b.available or ())),
+                'loaded': sorted(b.loaded),
+                'outstanding': b.outstanding,
+                'requests': b.requests,
+                'errors': b.errors,
+                'last_error': b.last_error
+            } for b in self.backends]
+
+
+def merge_models(backends: Iterable[Backend]) -> List[Dict[str, Any]]:
+    """合并各服务的模型列表，同名模型只保留一个"""
+    models: Dict[str, Dict[str, Any]] = {}
+    for backend in backends:
+        for model in backend.model_info:
+            name = model.get('name') or model.get('model', '')
+            if backend.declared is None or model_key(name) in backend.declared:
+                models.setdefault(model_key(name), model)
+    return list(models.values())
+
+
+def _outcome(status_code: int) -> Optional[bool]:
+    """按响应状态码判断服务是否正常：5xx为失败，4xx（如模型不存在）与服务状态无关"""
+    if status_code >= 500:
+        return False
+    return True if status_code < 400 else None
+
+
+def _connect_failed(error: requests.exceptions.RequestException) -> bool:
+    """请求是否在发出之前失败（连接被拒绝、连接超时），只有这时换一个服务不会重复执行生成
+
+    读取超时、连接在响应途中断开时服务可能已在生成，换服务会让同一次生成在多个服务上执行。
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.exceptions.ConnectionError):
+        return False
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+def _loaded_names(response_json: Dict[str, Any]) -> List[str]:
+    return [m.get('name') or m.get('model', '') for m in response_json.get('models', [])]
+
+
+class OllamaPool:
+    """多个Ollama服务组成的连接池，接口与 OllamaTransport 相同
+
+    请求体中的 model 决定可选的服务，由 BackendRouter 选择；连接失败或返回5xx时换一个服务
+    重试（每个服务最多尝试一次）。读取超时、响应中途断开时服务可能已在生成，直接抛出，
+    不换服务重复生成，也不计入熔断。后台线程每 health_ttl 秒检查一次各服务的 /api/tags 和
+    /api/ps，更新模型列表、已加载模型和熔断状态。
+    """
+
+    def __init__(self, hosts: Sequence[HostSpec], router: Optional[BackendRouter] = None,
+                 health_ttl: float = None, monitor: bool = True, **transport_kwargs):
+        self.router = router or BackendRouter(Backend(host, models) for host, models in hosts)
+        self.backends = self.router.backends
+        self.host = self.backends[0].host
+        self.health_ttl = health_ttl if health_ttl is not None else config.OLLAMA_HEALTH_TTL
+        # 失败后由连接池换服务重试，单个服务不再重试
+        transport_kwargs.setdefault('max_retries', 0)
+        self.transports = {b.host: OllamaTransport(b.host, health_ttl=0, **transport_kwargs) for b in self.backends}
+        self._check_lock = threading.Lock()
+        self._check_time = 0.0
+        self._stop = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+        if monitor:
+            self._monitor = threading.Thread(target=self._run_monitor, name='ollama-health', daemon=True)
+            self._monitor.start()
+
+    def url(self, path: str) -> str:
+        return f"{self.host}{path}"
+
+    def _run_monitor(self) -> None:
+        while not self._stop.is_set():
+            self.check(force=True)
+            self._stop.wait(max(self.health_ttl, 1.0))
+
+    def _check_backend(self, backend: Backend) -> None:
+        transport = self.transports[backend.host]
+        timeout = (transport.timeout[0], 10)
+        try:
+            response = transport.get('/api/tags', timeout=timeout)
+            response.raise_for_status()
+            models = response.json().get('models', [])
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"Ollama health probe failed for {backend.host}: {str(e)}")
+            self.router.update_health(backend, None, error=str(e))
+            return
+        try:
+            response = transport.get('/api/ps', timeout=timeout)
+            loaded = _loaded_names(response.json()) if response.ok else None
+        except (requests.exceptions.RequestException, ValueError):
+            loaded = None
+        self.router.update_health(backend, models, loaded)
+
+    def check(self, force: bool = False) -> None:
+        """并行检查所有服务，TTL内直接返回
+
+        检查可能因为某个服务无响应而持续较长时间；其他线程（如后台监控）正在检查时，
+        非强制的调用不等待，直接沿用当前的路由状态，只有尚未完成过任何检查时才等待。
+        """
+        if not force and time.time() - self._check_time < self.health_ttl:
+            return
+        if not self._check_lock.acquire(blocking=force or not self._check_time):
+            return
+        try:
+            if not force and time.time() - self._check_time < self.health_ttl:
+                return
+            with ThreadPoolExecutor(max_workers=len(self.backends)) as executor:
+                list(executor.map(self._check_backend, self.backends))
+            self._check_time = time.time()
+        finally:
+            self._check_lock.release()
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        body = kwargs.get('json') if isinstance(kwargs.get('json'), dict) else {}
+        model = body.get('model')
+        tried: List[Backend] = []
+        last_error = None
+        while True:
+            lease = self.router.acquire(model, tried)
+            if lease is None:
+                break
+            backend = lease.backend
+            tried.append(backend)
+            try:
+                response = getattr(self.transports[backend.host], method)(path, **kwargs)
+            except requests.exceptions.RequestException as e:
+                if not _connect_failed(e):
+                    # 读取超时等：服务可能只是慢，不计入熔断，也不换服务重复生成
+                    self.router.release(lease, None)
+                    raise
+                self.router.release(lease, False, str(e))
+                last_error = e
+                logger.warning(f"Ollama backend {backend.host} failed: {str(e)}")
+                continue
+            except BaseException:
+                self.router.release(lease, None)
+                raise
+            ok = _outcome(response.status_code)
+            error = f"HTTP {response.status_code}" if ok is False else None
+            if ok is False and self.router.has_candidate(model, tried):
+                self.router.release(lease, False, error)
+                response.close()
+                continue
+            if kwargs.get('stream'):
+                self._release_on_close(response, lease, ok, error)
+            else:
+                self.router.release(lease, ok, error)
+            return response
+        raise requests.exceptions.ConnectionError(
+            f"No available Ollama backend for model {model or '(any)'}: {last_error or 'all backends unavailable'}")
+
+    def _release_on_close(self, response: requests.Response, lease: Lease,
+                          ok: Optional[bool], error: Optional[str]) -> None:
+        """流式响应读取完毕（关闭）时才结束计数，生成期间该服务仍算作忙"""
+        close = response.close
+        released = []
+
+        def close_and_release():
+            close()
+            if not released:
+                released.append(True)
+                self.router.release(lease, ok, error)
+
+        response.close = close_and_release
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self._request('get', path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self._request('post', path, **kwargs)
+
+    def list_models(self, force: bool = False) -> List[Dict[str, Any]]:
+        """所有可用服务的模型列表（去重），都不可用时抛出ConnectionError"""
+        self.check(force)
+        healthy = self.router.healthy()
+        if not healthy:
+            errors = '; '.join(f"{b.host}: {b.last_error}" for b in self.backends if b.last_error)
+            raise requests.exceptions.ConnectionError(errors or "Ollama service unavailable")
+        return merge_models(healthy)
+
+    def is_available(self, force: bool = False) -> bool:
+        self.check(force)
+        return bool(self.router.healthy())
+
+    def preload(self, model: str, keep_alive: Optional[str] = None) -> bool:
+        """在选中的服务上预先加载模型，之后同一模型的请求优先发往该服务"""
+        lease = self.router.acquire(model)
+        if lease is None:
+            return False
+        ok = self.transports[lease.backend.host].preload(model, keep_alive)
+        self.router.release(lease, ok, None if ok else 'preload failed')
+        return ok
+
+    def invalidate(self) -> None:
+        with self._check_lock:
+            self._check_time = 0.0
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return self.router.snapshot()
+
+    def close(self) -> None:
+        self._stop.set()
+        for transport in self.transports.values():
+            transport.session.close()
+
+
+class AsyncOllamaPool:
+    """ASGI模式下的连接池，接口与 AsyncOllamaTransport 相同，路由规则与 OllamaPool 一致
+
+    健康检查在事件循环中后台进行：请求发现检查已过期时启动一次检查任务，不等待其完成。
+    """
+
+    def __init__(self, hosts: Sequence[HostSpec], router: Optional[BackendRouter] = None,
+                 health_ttl: float = None, **transport_kwargs):
+        self.router = router or BackendRouter(Backend(host, models) for host, models in hosts)
+        self.backends = self.router.backends
+        self.host = self.backends[0].host
+        self.health_ttl = health_ttl if health_ttl is not None else config.OLLAMA_HEALTH_TTL
+        transport_kwargs.setdefault('max_retries', 0)
+        self.transports = {b.host: AsyncOllamaTransport(b.host, health_ttl=0, **transport_kwargs)
+                           for b in self.backends}
+        self._check_time = 0.0
+        self._check_task: Optional[asyncio.Task] = None
+
+    async def _check_backend(self, backend: Backend) -> None:
+        transport = self.transports[backend.host]
+        try:
+            response = await transport.get('/api/tags', timeout=10)
+            response.raise_for_status()
+            models = response.json().get('models', [])
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"Ollama health probe failed for {backend.host}: {str(e)}")
+            self.router.update_health(backend, None, error=str(e))
+            return
+        try:
+            response = await transport.get('/api/ps', timeout=10)
+            loaded = _loaded_names(response.json()) if response.is_success else None
+        except (httpx.HTTPError, ValueError):
+            loaded = None
+        self.router.update_health(backend, models, loaded)
+
+    async def check(self, force: bool = False) -> None:
+        if not force and time.time() - self._check_time < self.health_ttl:
+            return
+        self._check_time = time.time()
+        await asyncio.gather(*(self._check_backend(b) for b in self.backends))
+
+    def _schedule_check(self) -> None:
+        if time.time() - self._check_time >= self.health_ttl and (
+                self._check_task is None or self._check_task.done()):
+            self._check_task = asyncio.ensure_future(self.check())
+
+    async def _request(self, method: str, path: str, **kwargs) -> 'httpx.Response':
+        self._schedule_check()
+        body = kwargs.get('json') if isinstance(kwargs.get('json'), dict) else {}
+        model = body.get('model')
+        tried: List[Backend] = []
+        last_error = None
+        while True:
+            lease = self.router.acquire(model, tried)
+            if lease is None:
+                break
+            backend = lease.backend
+            tried.append(backend)
+            try:
+                response = await getattr(self.transports[backend.host], method)(path, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                self.router.release(lease, False, str(e))
+                last_error = e
+                logger.warning(f"Ollama backend {backend.host} failed: {str(e)}")
+                continue
+            except BaseException:
+                self.router.release(lease, None)
+                raise
+            ok = _outcome(response.status_code)
+            self.router.release(lease, ok, f"HTTP {response.status_code}" if ok is False else None)
+            if ok is False and self.router.has_candidate(model, tried):
+                continue
+            return response
+        raise httpx.ConnectError(
+            f"No available Ollama backend for model {model or '(any)'}: {last_error or 'all backends unavailable'}")
+
+    async def get(self, path: str, **kwargs) -> 'httpx.Response':
+        return await self._request('get', path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> 'httpx.Response':
+        return await self._request('post', path, **kwargs)
+
+    async def stream_lines(self, path: str, json: Dict[str, Any]) -> AsyncIterator[str]:
+        """流式请求；在收到第一行之前失败时换一个服务重试"""
+        self._schedule_check()
+        model = json.get('model')
+        tried: List[Backend] = []
+        last_error = None
+        while True:
+            lease = self.router.acquire(model, tried)
+            if lease is None:
+                break
+            backend = lease.backend
+            tried.append(backend)
+            started = False
+            ok: Optional[bool] = None
+            error = None
+            try:
+                async for line in self.transports[backend.host].stream_lines(path, json):
+                    started = True
+                    yield line
+                ok = True
+                return
+            except httpx.HTTPStatusError as e:
+                ok = _outcome(e.response.status_code)
+                error = str(e)
+                if ok is not False or started or not self.router.has_candidate(model, tried):
+                    raise
+                last_error = e
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                ok, error = False, str(e)
+                if started:
+                    raise
+                last_error = e
+                logger.warning(f"Ollama backend {backend.host} failed: {error}")
+            finally:
+                # 客户端断开（任务取消）时 ok 仍为None，不影响熔断状态
+                self.router.release(lease, ok, error)
+        raise httpx.ConnectError(
+            f"No available Ollama backend for model {model or '(any)'}: {last_error or 'all backends unavailable'}")
+
+    async def list_models(self, force: bool = False) -> List[Dict[str, Any]]:
+        await self.check(force)
+        healthy = self.router.healthy()
+        if not healthy:
+            errors = '; '.join(f"{b.host}: {b.last_error}" for b in self.backends if b.last_error)
+            raise ConnectionError(errors or "Ollama service unavailable")
+        return merge_models(healthy)
+
+    async def is_available(self, force: bool = False) -> bool:
+        await self.check(force)
+        return bool(self.router.healthy())
+
+    async def preload(self, model: str, keep_alive: Optional[str] = None) -> bool:
+        lease = self.router.acquire(model)
+        if lease is None:
+            return False
+        ok = await self.transports[lease.backend.host].preload(model, keep_alive)
+        self.router.release(lease, ok, None if ok else 'preload failed')
+        return ok
+
+    def invalidate(self) -> None:
+        self._check_time = 0.0
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return self.router.snapshot()
+
+    async def aclose(self) -> None:
+        if self._check_task is not None:
+            self._check_task.cancel()
+        for transport in self.transports.values():
+            await transport.aclose()
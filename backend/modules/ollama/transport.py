@@ -0,0 +1,129 @@
+import time
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaTransport:
+    """共享的Ollama HTTP传输层
+
+    所有访问Ollama的代码共用一个带连接池的Session（keep-alive），统一超时和重试策略，
+    并对模型列表/健康检查结果做短时间缓存，避免每个请求都额外访问一次 /api/tags。
+    """
+
+    def __init__(self, host: str = None, pool_size: int = None, max_retries: int = None,
+                 connect_timeout: float = None, read_timeout: float = None, health_ttl: float = None):
+        self.host = (host or config.OLLAMA_HOST).rstrip('/')
+        self.timeout = (
+            connect_timeout if connect_timeout is not None else config.OLLAMA_CONNECT_TIMEOUT,
+            read_timeout if read_timeout is not None else config.OLLAMA_READ_TIMEOUT
+        )
+        self.health_ttl = health_ttl if health_ttl is not None else config.OLLAMA_HEALTH_TTL
+        pool_size = pool_size or config.OLLAMA_POOL_SIZE
+
+        # 连接错误时请求尚未发出，所有方法都可以重试；POST（生成）读取超时或返回5xx时
+        # Ollama可能仍在生成，重试会重复执行同一次生成，因此只对GET按状态码重试，读取错误不重试
+        retry_strategy = Retry(
+            total=max_retries if max_retries is not None else config.OLLAMA_MAX_RETRIES,
+            read=0,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry_strategy)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._probe_lock = threading.Lock()
+        self._probe_time = 0.0
+        self._models: Optional[List[Dict[str, Any]]] = None
+        self._probe_error: Optional[str] = None
+
+    def url(self, path: str) -> str:
+        return f"{self.host}{path}"
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(self.url(path), **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.post(self.url(path), **kwargs)
+
+    def _probe(self, force: bool = False) -> None:
+        """访问 /api/tags 并缓存结果，TTL内直接复用"""
+        with self._probe_lock:
+            if not force and time.time() - self._probe_time < self.health_ttl:
+                return
+            try:
+                response = self.get('/api/tags', timeout=(self.timeout[0], 10))
+                response.raise_for_status()
+                self._models = response.json().get('models', [])
+                self._probe_error = None
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.warning(f"Ollama health probe failed: {str(e)}")
+                self._models = None
+                self._probe_error = str(e)
+            self._probe_time = time.time()
+
+    def list_models(self, force: bool = False) -> List[Dict[str, Any]]:
+        """获取模型列表（带短时缓存），服务不可用时抛出ConnectionError"""
+        self._probe(force)
+        if self._models is None:
+            raise requests.exceptions.ConnectionError(self._probe_error or "Ollama service unavailable")
+        return list(self._models)
+
+    def is_available(self, force: bool = False) -> bool:
+        """检查Ollama服务是否可用（带短时缓存）"""
+        self._probe(force)
+        return self._models is not None
+
+    def preload(self, model: str, keep_alive: Optional[str] = None) -> bool:
+        """预先加载模型（不带提示词的generate请求），并按 keep_alive 保持常驻内存"""
+        try:
+            response = self.post('/api/generate', json={
+                'model': model,
+                'keep_alive': keep_alive or config.OLLAMA_KEEP_ALIVE
+            })
+            response.raise_for_status()
+            return True
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Failed to preload model {model}: {str(e)}")
+            return False
+
+    def invalidate(self) -> None:
+        """使健康检查缓存失效"""
+        with self._probe_lock:
+            self._probe_time = 0.0
+
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+
+def create_transport() -> OllamaTransport:
+    """按配置创建传输层：OLLAMA_HOSTS 配置了多个服务时返回 OllamaPool"""
+    hosts = config.OLLAMA_HOSTS
+    if len(hosts) > 1:
+        from modules.ollama.pool import OllamaPool
+        return OllamaPool(hosts)
+    return OllamaTransport(hosts[0][0] if hosts else None)
+
+
+def get_transport() -> OllamaTransport:
+    """获取进程内共享的Ollama传输实例"""
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is None:
+            _default_transport = create_transport()
+        return _default_transport
@@ -0,0 +1,71 @@
+import logging
+import threading
+from typing import Any, Dict
+
+from modules.metrics.registry import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Ollama返回的耗时单位为纳秒
+NS_PER_MS = 1_000_000
+
+
+def call_usage(result: Dict[str, Any]) -> Dict[str, Any]:
+    """从Ollama的响应（或流式响应的最后一块）中取出本次调用的token数和耗时"""
+    return {
+        'prompt_tokens': result.get('prompt_eval_count', 0),
+        'completion_tokens': result.get('eval_count', 0),
+        'prompt_eval_ms': round(result.get('prompt_eval_duration', 0) / NS_PER_MS, 1),
+        'eval_ms': round(result.get('eval_duration', 0) / NS_PER_MS, 1),
+        'load_ms': round(result.get('load_duration', 0) / NS_PER_MS, 1)
+    }
+
+
+def record_metrics(model: str, usage: Dict[str, Any]) -> None:
+    """把一次调用的token数和提示词评估/生成耗时计入全局指标"""
+    metrics = get_metrics()
+    metrics.inc(metrics.counter('llm_requests_total', 'Requests sent to Ollama'), model=model)
+    tokens = metrics.counter('llm_tokens_total', 'Tokens processed by Ollama')
+    metrics.inc(tokens, usage['prompt_tokens'], model=model, kind='prompt')
+    metrics.inc(tokens, usage['completion_tokens'], model=model, kind='completion')
+    if usage['prompt_eval_ms'] or usage['eval_ms']:
+        metrics.observe_stage('llm_prompt_eval', usage['prompt_eval_ms'] / 1000, model=model)
+        metrics.observe_stage('llm_eval', usage['eval_ms'] / 1000, model=model)
+
+
+class TokenUsage:
+    """累计实际提交给模型处理的token数和耗时，缓存命中不计入
+
+    prompt_tokens 为提示词评估的token数（prompt_eval_count），Ollama复用了相同前缀的
+    KV缓存时只统计新评估的部分；completion_tokens 为生成的token数（eval_count）。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {
+            'requests': 0,
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+            'prompt_eval_ms': 0.0,
+            'eval_ms': 0.0,
+            'load_ms': 0.0
+        }
+
+    def record(self, result: Dict[str, Any], model: str = '') -> Dict[str, Any]:
+        """记录一次调用并输出日志，返回本次调用的统计"""
+        usage = call_usage(result)
+        record_metrics(result.get('model') or model, usage)
+        with self.lock:
+            self.totals['requests'] += 1
+            for key, value in usage.items():
+                self.totals[key] += value
+        logger.info(f"Token usage: prompt_eval {usage['prompt_tokens']} tokens ({usage['prompt_eval_ms']} ms), "
+                    f"eval {usage['completion_tokens']} tokens ({usage['eval_ms']} ms)")
+        return usage
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            totals = dict(self.totals)
+        for key in ('prompt_eval_ms', 'eval_ms', 'load_ms'):
+            totals[key] = round(totals[key], 1)
+        return totals
@@ -0,0 +1,102 @@
+import re
+import hashlib
+from typing import Any, Collection, Dict, List, Optional, Sequence, Tuple
+
+import config
+from modules.llm_processor.chunker import TextChunker, estimate_tokens
+from modules.web_extractor.engines import TextBlock
+
+HEADING_TAGS = frozenset(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+# 每个行内标签平均包含的字符数达到该值时视为密集文本（菜单、标签云等远低于该值）
+DENSE_CHARS = 40
+# 达到该长度的块不再因为长度扣分，评论、按钮文字等短块排在正文段落之后
+LONG_BLOCK_CHARS = 80
+# 低于该得分的块即使预算充足也不保留（纯链接的导航、"评论"之类的标签文字）
+MIN_QUALITY = 0.15
+
+_DIGITS = re.compile(r'\d+')
+_SPACES = re.compile(r'\s+')
+
+
+def block_hash(text: str) -> str:
+    """文本块的指纹：忽略大小写、空白和数字，"© 2024" 与 "© 2025" 这类只有数字不同的块视为相同"""
+    normalized = _SPACES.sub('', _DIGITS.sub('0', text.lower()))
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def block_quality(block: TextBlock) -> float:
+    """文本块的价值（0~1）：链接文本占比越高、每个行内标签对应的文字越少、块越短，得分越低"""
+    chars = len(block.text)
+    link_density = min(1.0, block.link_chars / chars)
+    quality = (1.0 - link_density) ** 2
+    if block.tag in HEADING_TAGS:
+        return quality
+    text_density = chars / (block.tags + 1)
+    return quality * min(1.0, text_density / DENSE_CHARS) ** 0.5 * min(1.0, chars / LONG_BLOCK_CHARS) ** 0.5
+
+
+def token_budget(model: Optional[str] = None) -> int:
+    """模型的内容token预算，CONTENT_MODEL_BUDGETS 中没有单独设置时使用 CONTENT_TOKEN_BUDGET"""
+    budgets = config.CONTENT_MODEL_BUDGETS
+    if model:
+        for name in (model, model if ':' in model else f'{model}:latest', model.split(':')[0]):
+            if name in budgets:
+                return budgets[name]
+    return config.CONTENT_TOKEN_BUDGET
+
+
+def fit_budget(blocks: Sequence[TextBlock], budget: int, boilerplate: Collection[str] = (),
+               hashes: Optional[Sequence[str]] = None) -> Tuple[str, Dict[str, Any]]:
+    """按价值从高到低选取文本块，直到用完token预算，返回按原顺序拼接的文本和统计
+
+    boilerplate 为同一主机其他页面中反复出现的块指纹，这些块和页面内重复的块直接丢弃。
+    得分最高的块单独就超过预算时截取其开头部分；后面紧接的块没有保留的标题也不保留。
+    """
+    hashes = hashes if hashes is not None else [block_hash(block.text) for block in blocks]
+    tokens = [estimate_tokens(block.text) for block in blocks]
+    seen = set()
+    candidates: List[Tuple[float, int]] = []
+    repeated = 0
+    for index, (block, digest) in enumerate(zip(blocks, hashes)):
+        if digest in boilerplate or digest in seen:
+            repeated += 1
+            continue
+        seen.add(digest)
+        quality = block_quality(block)
+        if quality >= MIN_QUALITY:
+            candidates.append((quality, index))
+
+    # 得分相同时长的块优先
+    candidates.sort(key=lambda item: (-item[0], -tokens[item[1]], item[1]))
+    chosen: Dict[int, str] = {}
+    used = 0
+    for _, index in candidates:
+        if used + tokens[index] <= budget:
+            chosen[index] = blocks[index].text
+            used += tokens[index]
+        elif not chosen and budget > 0:
+            text = TextChunker(max_tokens=budget, overlap_tokens=0).chunk(blocks[index].text)[0]
+            chosen[index] = text
+            used += estimate_tokens(text)
+
+    # 标题到下一个标题之间没有保留任何内容时去掉该标题
+    heading = None
+    for index, block in enumerate(blocks):
+        if block.tag in HEADING_TAGS:
+            if heading is not None:
+                used -= estimate_tokens(chosen.pop(heading))
+            heading = index if index in chosen else None
+        elif index in chosen:
+            heading = None
+    if heading is not None:
+        used -= estimate_tokens(chosen.pop(heading))
+
+    text = '\n'.join(chosen[index] for index in sorted(chosen))
+    return text, {
+        'limit': budget,
+        'tokens': used,
+        'original_tokens': sum(tokens),
+        'blocks': len(blocks),
+        'kept_blocks': len(chosen),
+        'repeated_blocks': repeated
+    }
@@ -0,0 +1,117 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterable, Iterator, List, Optional
+from urllib.parse import urljoin, urldefrag, urlparse
+
+from modules.web_extractor.extractor import WebExtractor
+
+
+class HostRateLimiter:
+    """按主机限制请求间隔，保证对同一站点的访问足够礼貌"""
+
+    def __init__(self, min_interval: float = 0.5):
+        self.min_interval = min_interval
+        self.next_allowed: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def wait(self, host: str) -> None:
+        """为该主机预留下一个请求时间点，并等待到该时间点"""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_allowed.get(host, 0.0))
+            self.next_allowed[host] = slot + self.min_interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Crawler:
+    """多URL并发抓取
+
+    从种子URL出发按深度跟随站内链接，全局并发数由线程池大小限制，
+    同一主机的请求按最小间隔排队，URL去重后只抓取一次。
+    抓取完成的文档会立即产出，下游可以边抓取边处理。
+    """
+
+    def __init__(self, extractor: Optional[WebExtractor] = None, max_concurrency: int = 8,
+                 per_host_interval: float = 0.5, max_pages: int = 50, same_domain: bool = True):
+        self.extractor = extractor or WebExtractor()
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = HostRateLimiter(per_host_interval)
+        self.max_pages = max_pages
+        self.same_domain = same_domain
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def normalize_url(url: str) -> str:
+        """去掉锚点并统一协议和主机名的大小写，用于去重"""
+        url, _ = urldefrag(url.strip())
+        parsed = urlparse(url)
+        return parsed._replace(scheme=parsed.scheme.lower(), netloc=parsed.netloc.lower()).geturl()
+
+    def extract_links(self, html_content: str, base_url: str) -> List[str]:
+        """提取页面中的链接，只保留http(s)链接，可限制为同一域名"""
+        base_host = urlparse(base_url).netloc.lower()
+        links = []
+        for href in self.extractor.engine.links(html_content):
+            url = self.normalize_url(urljoin(base_url, href))
+            parsed = urlparse(url)
+            if parsed.scheme not in ('http', 'https'):
+                continue
+            if self.same_domain and parsed.netloc != base_host:
+                continue
+            links.append(url)
+        return links
+
+    def _fetch(self, url: str, depth: int, follow: bool) -> Dict:
+        """抓取单个页面并提取正文和链接"""
+        self.rate_limiter.wait(urlparse(url).netloc)
+        try:
+            page = self.extractor.fetch_page(url)
+            text = self.extractor.page_text(page)
+            return {
+                'url': url,
+                'depth': depth,
+                'content': text['content'],
+                'content_hash': text['content_hash'],
+                'changed': text['changed'],
+                'sections': text['sections'],
+                'links': self.extract_links(page['html'], url) if follow else [],
+                'status': 'success'
+            }
+        except Exception as e:
+            self.logger.warning(f"Crawl failed for {url}: {str(e)}")
+            return {'url': url, 'depth': depth, 'content': '', 'links': [], 'status': 'error', 'error': str(e)}
+
+    def crawl(self, seeds: Iterable[str], depth: int = 1) -> Iterator[Dict]:
+        """从种子URL开始抓取，depth为跟随链接的层数（0表示只抓取种子页面）"""
+        seen = set()
+        scheduled = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            pending = set()
+
+            def schedule(url: str, level: int) -> None:
+                nonlocal scheduled
+                url = self.normalize_url(url)
+                if url in seen or scheduled >= self.max_pages:
+                    return
+                if not self.extractor.validate_url(url):
+                    return
+                seen.add(url)
+                scheduled += 1
+                pending.add(executor.submit(self._fetch, url, level, level < depth))
+
+            for seed in seeds:
+                schedule(seed, 0)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.discard(future)
+                    document = future.result()
+                    for link in document.pop('links'):
+                        schedule(link, document['depth'] + 1)
+                    yield document
@@ -0,0 +1,334 @@
+import logging
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from bs4 import BeautifulSoup, NavigableString, Tag
+from bs4.element import PreformattedString
+
+try:
+    from lxml import etree
+except ImportError:  # lxml为可选依赖，未安装时使用BeautifulSoup
+    etree = None
+
+logger = logging.getLogger(__name__)
+
+# 正文模式下整棵子树都会被跳过的标签
+MAIN_SKIP_TAGS = frozenset(['script', 'style', 'iframe', 'nav', 'footer'])
+# 全文模式下跳过的标签
+FULL_SKIP_TAGS = frozenset(['script', 'style'])
+
+# 文本块按这些块级标签划分，块内的行内标签（链接、加粗等）计入所在的块
+BLOCK_TAGS = frozenset([
+    'html', 'body', 'main', 'article', 'section', 'header', 'footer', 'nav', 'aside', 'div', 'form',
+    'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol', 'li', 'dl', 'dt', 'dd',
+    'table', 'tr', 'td', 'th', 'caption', 'blockquote', 'pre', 'figure', 'figcaption', 'address'
+])
+
+
+class TextBlock(NamedTuple):
+    """块级元素直接包含的文本（不含内层块级元素），以及其中链接文本的字符数和行内标签数"""
+    tag: str
+    text: str
+    link_chars: int
+    tags: int
+
+
+# 正文容器选择器，按优先级排列
+CONTENT_SELECTORS = [
+    'article', '.article', '#article',
+    '.content', '#content', 'main',
+    '.post-content', '#post-content'
+]
+
+
+def normalize_text(text: str) -> str:
+    """清理文本：按行去除首尾空白，按连续两个空格切分短语后用单个空格拼接"""
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return ' '.join(chunk for chunk in chunks if chunk)
+
+
+class BeautifulSoupEngine:
+    """基于BeautifulSoup（html.parser）的提取引擎，构建完整的文档树"""
+
+    name = 'bs4'
+
+    def main_paragraphs(self, html_content: str) -> List[str]:
+        """提取正文区域的段落文本"""
+        soup = BeautifulSoup(html_content, 'html.parser')
+
+        # 移除脚本和样式
+        for element in soup.find_all(list(MAIN_SKIP_TAGS)):
+            element.decompose()
+
+        # 提取正文内容
+        main_content = None
+        for selector in CONTENT_SELECTORS:
+            if selector.startswith('.'):
+                element = soup.find(class_=selector[1:])
+            elif selector.startswith('#'):
+                element = soup.find(id=selector[1:])
+            else:
+                element = soup.find(selector)
+
+            if element:
+                main_content = element
+                break
+
+        if not main_content:
+            main_content = soup.find('body') or soup
+
+        return [p.text.strip() for p in main_content.find_all('p') if p.text.strip()]
+
+    def main_text(self, html_content: str) -> str:
+        """提取正文区域的段落文本并拼接"""
+        return ' '.join(self.main_paragraphs(html_content))
+
+    def full_text(self, html_content: str) -> str:
+        """提取全部可见文本（去除脚本和样式）"""
+        soup = BeautifulSoup(html_content, 'html.parser')
+        for element in soup(list(FULL_SKIP_TAGS)):
+            element.decompose()
+        return normalize_text(soup.get_text())
+
+    def text_blocks(self, html_content: str) -> List[TextBlock]:
+        """按块级元素切分全部可见文本（去除脚本和样式），按元素在文档中出现的顺序返回"""
+        soup = BeautifulSoup(html_content, 'html.parser')
+        for element in soup(list(FULL_SKIP_TAGS)):
+            element.decompose()
+
+        # 块级元素 -> [文本片段, 链接文本片段, 行内标签数, 第一段文本的位置, 标签名]
+        blocks: Dict[int, list] = {}
+        position = 0
+        for node in soup.descendants:
+            if isinstance(node, Tag) and node.name in BLOCK_TAGS:
+                blocks[id(node)] = [[], [], 0, None, node.name]
+                continue
+            if isinstance(node, PreformattedString) or not isinstance(node, (NavigableString, Tag)):
+                continue
+            in_link = isinstance(node, Tag) and node.name == 'a'
+            for parent in node.parents:
+                if parent.name in BLOCK_TAGS:
+                    block = blocks.get(id(parent))
+                    if block is None:
+                        break
+                    if isinstance(node, Tag):
+                        block[2] += 1
+                    else:
+                        if block[3] is None and node.strip():
+                            position += 1
+                            block[3] = position
+                        block[0].append(str(node))
+                        if in_link:
+                            block[1].append(str(node))
+                    break
+                in_link = in_link or parent.name == 'a'
+        return _finish_blocks(blocks.values())
+
+    def links(self, html_content: str) -> List[str]:
+        """提取所有链接的href"""
+        soup = BeautifulSoup(html_content, 'html.parser')
+        return [a['href'] for a in soup.find_all('a', href=True)]
+
+
+def _finish_blocks(blocks) -> List[TextBlock]:
+    """按块中第一段文本出现的位置排序，父元素在子块之后的文本也排在子块之后"""
+    result = []
+    for parts, link_parts, tags, _, tag in sorted((b for b in blocks if b[3] is not None), key=lambda b: b[3]):
+        text = normalize_text(''.join(parts))
+        if text:
+            result.append(TextBlock(tag, text, len(normalize_text(''.join(link_parts))), tags))
+    return result
+
+
+class _StreamingTarget:
+    """lxml解析器的事件接收器
+
+    解析过程中不构建文档树：被跳过的标签只维护一个深度计数，
+    段落文本、正文容器和链接在同一遍扫描中收集。
+    """
+
+    def __init__(self, skip_tags: frozenset, collect_paragraphs: bool, collect_blocks: bool = False):
+        self.skip_tags = skip_tags
+        self.collect_paragraphs = collect_paragraphs
+        self.collect_blocks = collect_blocks
+        self.skip_depth = 0
+        self.text_parts: List[str] = []
+        self.links: List[str] = []
+        # 当前打开的元素，是正文容器时记录其编号，否则为None
+        self.elements: List[Optional[int]] = []
+        self.containers: List[int] = []
+        self.container_serial = 0
+        # 每个选择器第一次匹配到的容器编号
+        self.first_match: Dict[int, int] = {}
+        # 当前打开的段落：(文本片段, 所在容器编号)
+        self.open_paragraphs: List[Tuple[List[str], Tuple[int, ...]]] = []
+        self.paragraphs: List[Tuple[str, Tuple[int, ...]]] = []
+        # 当前打开的块级元素：[文本片段, 链接文本片段, 行内标签数, 第一段文本的位置, 标签名]
+        self.open_blocks: List[list] = []
+        self.blocks: List[list] = []
+        self.block_position = 0
+        self.link_depth = 0
+
+    def _matching_selectors(self, tag: str, attrib) -> List[int]:
+        classes = (attrib.get('class') or '').split()
+        element_id = attrib.get('id')
+        matched = []
+        for index, selector in enumerate(CONTENT_SELECTORS):
+            if selector.startswith('.'):
+                hit = selector[1:] in classes
+            elif selector.startswith('#'):
+                hit = selector[1:] == element_id
+            else:
+                hit = selector == tag
+            if hit:
+                matched.append(index)
+        return matched
+
+    def start(self, tag, attrib):
+        if self.skip_depth:
+            if tag in self.skip_tags:
+                self.skip_depth += 1
+            return
+        if tag in self.skip_tags:
+            self.skip_depth = 1
+            return
+
+        if tag == 'a' and attrib.get('href'):
+            self.links.append(attrib['href'])
+
+        if self.collect_blocks:
+            if tag in BLOCK_TAGS:
+                self.open_blocks.append([[], [], 0, None, tag])
+            else:
+                if self.open_blocks:
+                    self.open_blocks[-1][2] += 1
+                if tag == 'a':
+                    self.link_depth += 1
+
+        if not self.collect_paragraphs:
+            return
+
+        serial = None
+        matched = self._matching_selectors(tag, attrib)
+        if matched:
+            self.container_serial += 1
+            serial = self.container_serial
+            for index in matched:
+                self.first_match.setdefault(index, serial)
+            self.containers.append(serial)
+        self.elements.append(serial)
+
+        if tag == 'p':
+            self.open_paragraphs.append(([], tuple(self.containers)))
+
+    def end(self, tag):
+        if self.skip_depth:
+            if tag in self.skip_tags:
+                self.skip_depth -= 1
+            return
+        if self.collect_blocks:
+            if tag in BLOCK_TAGS:
+                if self.open_blocks:
+                    self.blocks.append(self.open_blocks.pop())
+            elif tag == 'a' and self.link_depth:
+                self.link_depth -= 1
+        if not self.collect_paragraphs:
+            return
+
+        if self.elements and self.elements.pop() is not None:
+            self.containers.pop()
+
+        if tag == 'p' and self.open_paragraphs:
+            parts, ancestors = self.open_paragraphs.pop()
+            text = ''.join(parts).strip()
+            if text:
+                self.paragraphs.append((text, ancestors))
+            # 外层段落同样包含内层段落的文本
+            if self.open_paragraphs:
+                self.open_paragraphs[-1][0].extend(parts)
+
+    def data(self, data):
+        if self.skip_depth:
+            return
+        self.text_parts.append(data)
+        if self.open_blocks:
+            block = self.open_blocks[-1]
+            if block[3] is None and data.strip():
+                self.block_position += 1
+                block[3] = self.block_position
+            block[0].append(data)
+            if self.link_depth:
+                block[1].append(data)
+        if self.open_paragraphs:
+            self.open_paragraphs[-1][0].append(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return self
+
+
+class LxmlEngine:
+    """基于lxml事件解析的流式提取引擎，单遍扫描且跳过的子树不会被构建"""
+
+    name = 'lxml'
+
+    def _parse(self, html_content: str, skip_tags: frozenset, collect_paragraphs: bool,
+               collect_blocks: bool = False) -> _StreamingTarget:
+        target = _StreamingTarget(skip_tags, collect_paragraphs, collect_blocks)
+        parser = etree.HTMLParser(target=target, recover=True, remove_comments=True)
+        parser.feed(html_content)
+        return parser.close()
+
+    def main_paragraphs(self, html_content: str) -> List[str]:
+        """提取正文区域的段落文本"""
+        target = self._parse(html_content, MAIN_SKIP_TAGS, True)
+
+        # 按选择器优先级找到第一个匹配的正文容器，没有时使用全部段落
+        container = None
+        for index in range(len(CONTENT_SELECTORS)):
+            if index in target.first_match:
+                container = target.first_match[index]
+                break
+
+        return [text for text, ancestors in target.paragraphs
+                if container is None or container in ancestors]
+
+    def main_text(self, html_content: str) -> str:
+        """提取正文区域的段落文本并拼接"""
+        return ' '.join(self.main_paragraphs(html_content))
+
+    def full_text(self, html_content: str) -> str:
+        """提取全部可见文本（去除脚本和样式）"""
+        target = self._parse(html_content, FULL_SKIP_TAGS, False)
+        return normalize_text(''.join(target.text_parts))
+
+    def text_blocks(self, html_content: str) -> List[TextBlock]:
+        """按块级元素切分全部可见文本（去除脚本和样式），按元素在文档中出现的顺序返回"""
+        target = self._parse(html_content, FULL_SKIP_TAGS, False, True)
+        # 未闭合的块（文档被截断）同样保留
+        return _finish_blocks(target.blocks + target.open_blocks)
+
+    def links(self, html_content: str) -> List[str]:
+        """提取所有链接的href"""
+        return self._parse(html_content, frozenset(), False).links
+
+
+ENGINES = {
+    'bs4': BeautifulSoupEngine,
+    'lxml': LxmlEngine
+}
+
+
+def get_engine(name: Optional[str] = None):
+    """按名称创建提取引擎，auto（默认）在安装了lxml时使用lxml"""
+    name = (name or 'auto').lower()
+    if name == 'auto':
+        name = 'lxml' if etree is not None else 'bs4'
+    if name not in ENGINES:
+        raise ValueError(f"Unsupported extraction engine: {name}")
+    if name == 'lxml' and etree is None:
+        logger.warning("lxml is not installed, falling back to BeautifulSoup engine")
+        name = 'bs4'
+    return ENGINES[name]()
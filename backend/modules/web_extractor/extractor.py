@@ -1,12 +1,38 @@
 import requests
-from bs4 import BeautifulSoup
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Any, Tuple
 import logging
 from urllib.parse import urlparse
 
+from modules.web_extractor.page_cache import PageCache, get_page_cache, content_hash
+from modules.web_extractor.engines import get_engine
+from modules.web_extractor.sections import section_spans, split_sections
+from modules.web_extractor.budget import block_hash, fit_budget
+from modules.metrics.registry import get_metrics
+import config
+
+try:
+    import httpx
+except ImportError:  # 仅ASGI模式需要
+    httpx = None
+
+try:
+    from charset_normalizer import from_bytes
+except ImportError:
+    from_bytes = None
+
+
+def detect_encoding(content: bytes) -> str:
+    """响应未声明编码时按内容推断（与requests的apparent_encoding一致），供httpx客户端使用"""
+    match = from_bytes(content).best() if from_bytes else None
+    return match.encoding if match else 'utf-8'
+
+
 class WebExtractor:
-    def __init__(self):
+    def __init__(self, page_cache: Optional[PageCache] = None, use_cache: bool = True, engine: Optional[str] = None):
         self.logger = logging.getLogger(__name__)
+        # 正文提取引擎：lxml流式引擎或BeautifulSoup
+        self.engine = get_engine(engine or config.EXTRACTION_ENGINE)
+        self.page_cache = page_cache or (get_page_cache() if use_cache else None)
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
@@ -21,63 +47,160 @@ class WebExtractor:
             self.logger.error(f"URL validation failed: {str(e)}")
             return False
 
-    def fetch_content(self, url: str, max_retries: int = 3) -> Optional[str]:
-        """获取网页内容，带重试机制"""
+    def fetch_page(self, url: str, max_retries: int = 3) -> Dict[str, Any]:
+        """获取网页，带重试机制；有缓存时使用ETag/Last-Modified做条件请求"""
         if not self.validate_url(url):
             raise ValueError("Invalid URL format")
 
+        cached, headers = self._conditional_headers(url)
         for attempt in range(max_retries):
             try:
-                response = self.session.get(url, timeout=10)
+                with get_metrics().span('fetch'):
+                    response = self.session.get(url, headers=headers, timeout=10)
+                if response.status_code == 304 and cached:
+                    self.page_cache.touch(url)
+                    return {**cached, 'not_modified': True}
                 response.raise_for_status()
-                return response.text
+
+                # 未声明编码时按内容推断，避免中文页面乱码
+                content_type = response.headers.get('content-type', '')
+                if 'charset' not in content_type.lower():
+                    response.encoding = response.apparent_encoding
+                return self._store_page(url, response.text, response.headers)
             except requests.RequestException as e:
                 self.logger.warning(f"Attempt {attempt + 1} failed: {str(e)}")
                 if attempt == max_retries - 1:
                     raise
 
-    def clean_html(self, html_content: str) -> str:
-        """清洗HTML内容"""
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # 移除脚本和样式
-        for element in soup.find_all(['script', 'style', 'iframe', 'nav', 'footer']):
-            element.decompose()
-        
-        # 提取正文内容
-        content_selectors = [
-            'article', '.article', '#article',
-            '.content', '#content', 'main',
-            '.post-content', '#post-content'
-        ]
-        
-        main_content = None
-        for selector in content_selectors:
-            if selector.startswith('.'):
-                element = soup.find(class_=selector[1:])
-            elif selector.startswith('#'):
-                element = soup.find(id=selector[1:])
+    async def afetch_page(self, client: 'httpx.AsyncClient', url: str, max_retries: int = 3) -> Dict[str, Any]:
+        """fetch_page 的异步版本，使用调用方的 httpx.AsyncClient（ASGI模式）"""
+        if not self.validate_url(url):
+            raise ValueError("Invalid URL format")
+
+        cached, headers = self._conditional_headers(url)
+        for attempt in range(max_retries):
+            try:
+                with get_metrics().span('fetch'):
+                    response = await client.get(url, headers={**self.session.headers, **headers}, timeout=10)
+                if response.status_code == 304 and cached:
+                    self.page_cache.touch(url)
+                    return {**cached, 'not_modified': True}
+                response.raise_for_status()
+                return self._store_page(url, response.text, response.headers)
+            except httpx.HTTPError as e:
+                self.logger.warning(f"Attempt {attempt + 1} failed: {str(e)}")
+                if attempt == max_retries - 1:
+                    raise
+
+    def _conditional_headers(self, url: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, str]]:
+        """返回缓存的页面和条件请求头（ETag/Last-Modified）"""
+        cached = self.page_cache.get(url) if self.page_cache else None
+        headers = {}
+        if cached:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified']:
+                headers['If-Modified-Since'] = cached['last_modified']
+        return cached, headers
+
+    def _store_page(self, url: str, html: str, headers) -> Dict[str, Any]:
+        """构造页面信息并写入网页缓存"""
+        content_type = headers.get('content-type', '')
+        page = {
+            'url': url,
+            'html': html,
+            'content_type': content_type,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'not_modified': False
+        }
+        if self.page_cache:
+            self.page_cache.store(url, html, content_type, page['etag'], page['last_modified'])
+        return page
+
+    def fetch_content(self, url: str, max_retries: int = 3) -> Optional[str]:
+        """获取网页内容，带重试机制"""
+        return self.fetch_page(url, max_retries)['html']
+
+    def page_text(self, page: Dict[str, Any], mode: str = 'main') -> Dict[str, Any]:
+        """提取页面文本并与上次结果比较
+
+        mode为main时只提取正文段落，为full时提取全部可见文本。
+        页面返回304且已有提取结果时直接复用，不再解析HTML。
+        正文同时按段落分组，sections 为各组的文本和哈希，用于只重新处理变化的部分。
+        """
+        previous = self.page_cache.get_text(page['url'], mode) if self.page_cache else None
+        if page.get('not_modified') and previous and (mode != 'main' or previous['spans'] is not None):
+            return {'content': previous['text'], 'content_hash': previous['text_hash'], 'changed': False,
+                    'sections': split_sections(previous['text'], previous['spans']) if mode == 'main' else None}
+
+        spans = None
+        with get_metrics().span('parse', mode=mode):
+            if mode == 'main':
+                text, spans = self.clean_html_sections(page['html'])
             else:
-                element = soup.find(selector)
-            
-            if element:
-                main_content = element
-                break
-        
-        if not main_content:
-            main_content = soup.find('body')
-        
-        return ' '.join(p.text.strip() for p in main_content.find_all('p') if p.text.strip())
+                text = self.extract_text(page['html'])
+        if self.page_cache:
+            text_hash = self.page_cache.set_text(page['url'], mode, text, spans)
+        else:
+            text_hash = content_hash(text)
+        changed = previous is None or previous['text_hash'] != text_hash
+        return {'content': text, 'content_hash': text_hash, 'changed': changed,
+                'sections': split_sections(text, spans) if spans is not None else None}
+
+    def budget_content(self, page: Dict[str, Any], budget: int) -> Dict[str, Any]:
+        """把页面全部可见文本裁剪到token预算以内
+
+        文本按块级元素切分后按链接密度、文本密度和长度打分，同一主机其他页面中反复出现的块
+        （导航、页脚、版权声明等）直接丢弃，其余按得分从高到低放入预算。
+        返回 content、content_hash、changed 和统计信息 budget；changed 与同一预算下上次裁剪的
+        结果比较。没有可保留的文本块时 content 为空。
+        """
+        mode = f'budget:{budget}'
+        previous = self.page_cache.get_text(page['url'], mode) if self.page_cache else None
+        with get_metrics().span('parse', mode='blocks'):
+            blocks = self.engine.text_blocks(page['html'])
+        with get_metrics().span('budget'):
+            hashes = [block_hash(block.text) for block in blocks]
+            pages = self.page_cache.block_pages(page['url'], hashes) if self.page_cache else {}
+            boilerplate = {digest for digest, count in pages.items() if count >= config.BOILERPLATE_MIN_PAGES}
+            text, stats = fit_budget(blocks, budget, boilerplate, hashes)
+            if not text and boilerplate:
+                # 同一页面以不同URL访问过多次时，正文本身也会被当作模板内容
+                text, stats = fit_budget(blocks, budget, (), hashes)
+        if self.page_cache and text:
+            text_hash = self.page_cache.set_text(page['url'], mode, text)
+        else:
+            text_hash = content_hash(text)
+        changed = previous is None or previous['text_hash'] != text_hash
+        return {'content': text, 'content_hash': text_hash, 'changed': changed, 'budget': stats}
+
+    def extract_text(self, html_content: str) -> str:
+        """提取页面全部可见文本（去除脚本和样式）"""
+        return self.engine.full_text(html_content)
+
+    def clean_html(self, html_content: str) -> str:
+        """清洗HTML内容，只保留正文区域的段落文本"""
+        return self.clean_html_sections(html_content)[0]
+
+    def clean_html_sections(self, html_content: str) -> Tuple[str, List[Tuple[int, int]]]:
+        """返回正文文本，以及按内容确定边界的段落分组在文本中的位置"""
+        paragraphs = self.engine.main_paragraphs(html_content)
+        spans = section_spans(paragraphs, config.SECTION_MIN_CHARS, config.SECTION_MAX_CHARS)
+        return ' '.join(paragraphs), spans
 
     def extract(self, url: str) -> Dict[str, str]:
         """主要提取方法"""
         try:
-            html_content = self.fetch_content(url)
-            cleaned_text = self.clean_html(html_content)
+            page = self.fetch_page(url)
+            text = self.page_text(page)
             
             return {
                 'url': url,
-                'content': cleaned_text,
+                'content': text['content'],
+                'content_hash': text['content_hash'],
+                'changed': text['changed'],
+                'not_modified': page['not_modified'],
                 'status': 'success'
             }
         except Exception as e:
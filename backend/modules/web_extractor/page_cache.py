@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from modules.cache.llm_cache import DEFAULT_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text: str) -> str:
+    """计算提取文本的哈希"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class PageCache:
+    """网页缓存
+
+    保存原始HTML及其ETag/Last-Modified用于条件请求，保存各提取模式下的文本及其哈希，
+    以及按文本哈希保存的下游处理结果，文本未变化时可直接复用。同时记录每个页面包含的
+    文本块指纹，用于识别同一主机下各页面共有的模板内容。
+
+    页面按条目数、HTML总字节数和TTL淘汰（按最近一次下载或304验证的时间），页面被淘汰时
+    其文本、分组和文本块指纹一并删除；下游处理结果按条目数和TTL淘汰。
+    """
+
+    def __init__(self, path: Optional[str] = None, max_pages: int = 10000,
+                 max_bytes: int = 512 * 1024 * 1024, ttl: float = 30 * 24 * 3600,
+                 max_results: int = 50000):
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, 'page_cache.sqlite3')
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_results = max_results
+        self.lock = threading.Lock()
+        self.revalidated = 0
+        self.fetched = 0
+
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                html TEXT NOT NULL,
+                size INTEGER NOT NULL DEFAULT 0,
+                content_type TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                validated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS extracts (
+                url TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                text TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                PRIMARY KEY (url, mode)
+            );
+            CREATE TABLE IF NOT EXISTS sections (
+                url TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                spans TEXT NOT NULL,
+                PRIMARY KEY (url, mode)
+            );
+            CREATE TABLE IF NOT EXISTS blocks (
+                host TEXT NOT NULL,
+                block_hash TEXT NOT NULL,
+                url TEXT NOT NULL,
+                PRIMARY KEY (host, block_hash, url)
+            );
+            CREATE INDEX IF NOT EXISTS blocks_url ON blocks (url);
+            CREATE TABLE IF NOT EXISTS results (
+                text_hash TEXT NOT NULL,
+                key TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (text_hash, key)
+            );
+            CREATE INDEX IF NOT EXISTS results_created ON results (created_at);
+        ''')
+        # 旧版本创建的 pages 表没有 size 列
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(pages)')]
+        if 'size' not in columns:
+            self.conn.execute('ALTER TABLE pages ADD COLUMN size INTEGER NOT NULL DEFAULT 0')
+            self.conn.execute('UPDATE pages SET size = LENGTH(CAST(html AS BLOB))')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS pages_validated ON pages (validated_at)')
+        self.conn.commit()
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """读取缓存的页面"""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT html, content_type, etag, last_modified, fetched_at FROM pages WHERE url = ?', (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'url': url,
+            'html': row[0],
+            'content_type': row[1],
+            'etag': row[2],
+            'last_modified': row[3],
+            'fetched_at': row[4]
+        }
+
+    def store(self, url: str, html: str, content_type: str = None,
+              etag: str = None, last_modified: str = None) -> None:
+        """保存新下载的页面"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO pages (url, html, size, content_type, etag, last_modified, '
+                'fetched_at, validated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, html, len(html.encode('utf-8')), content_type, etag, last_modified, now, now)
+            )
+            self._evict_pages(now)
+            self.conn.commit()
+            self.fetched += 1
+
+    def _evict_pages(self, now: float) -> None:
+        """淘汰过期页面，再按最近验证时间淘汰超出容量的页面"""
+        if self.ttl:
+            self._delete_pages([row[0] for row in self.conn.execute(
+                'SELECT url FROM pages WHERE validated_at < ?', (now - self.ttl,))])
+
+        count, total = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages').fetchone()
+        if count <= self.max_pages and total <= self.max_bytes:
+            return
+
+        rows = self.conn.execute('SELECT url, size FROM pages ORDER BY validated_at').fetchall()
+        evicted = []
+        for url, size in rows:
+            if count <= self.max_pages and total <= self.max_bytes:
+                break
+            evicted.append(url)
+            count -= 1
+            total -= size
+        self._delete_pages(evicted)
+
+    def _delete_pages(self, urls: List[str]) -> None:
+        """删除页面及其文本、分组和文本块指纹"""
+        if not urls:
+            return
+        params = [(url,) for url in urls]
+        for table in ('pages', 'extracts', 'sections', 'blocks'):
+            self.conn.executemany(f'DELETE FROM {table} WHERE url = ?', params)
+        logger.info(f"Evicted {len(urls)} cached pages")
+
+    def touch(self, url: str) -> None:
+        """记录一次304验证"""
+        with self.lock:
+            self.conn.execute('UPDATE pages SET validated_at = ? WHERE url = ?', (time.time(), url))
+            self.conn.commit()
+            self.revalidated += 1
+
+    def get_text(self, url: str, mode: str) -> Optional[Dict[str, Any]]:
+        """读取上次提取的文本及哈希，保存过段落分组时一并返回各组位置（spans）"""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT e.text, e.text_hash, s.spans FROM extracts e LEFT JOIN sections s '
+                'ON s.url = e.url AND s.mode = e.mode AND s.text_hash = e.text_hash '
+                'WHERE e.url = ? AND e.mode = ?', (url, mode)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'text': row[0], 'text_hash': row[1], 'spans': json.loads(row[2]) if row[2] else None}
+
+    def set_text(self, url: str, mode: str, text: str, spans: Optional[List[Tuple[int, int]]] = None) -> str:
+        """保存提取的文本（及段落分组的位置），返回文本哈希"""
+        text_hash = content_hash(text)
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO extracts (url, mode, text, text_hash) VALUES (?, ?, ?, ?)',
+                (url, mode, text, text_hash)
+            )
+            if spans is not None:
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO sections (url, mode, text_hash, spans) VALUES (?, ?, ?, ?)',
+                    (url, mode, text_hash, json.dumps(spans))
+                )
+            self.conn.commit()
+        return text_hash
+
+    def block_pages(self, url: str, hashes: Sequence[str]) -> Dict[str, int]:
+        """记录页面的文本块指纹，返回每个指纹在同一主机其他页面中出现的页面数"""
+        host = urlparse(url).netloc.lower()
+        unique = list(dict.fromkeys(hashes))
+        counts: Dict[str, int] = {}
+        with self.lock:
+            self.conn.execute('DELETE FROM blocks WHERE url = ?', (url,))
+            self.conn.executemany('INSERT OR IGNORE INTO blocks (host, block_hash, url) VALUES (?, ?, ?)',
+                                  [(host, digest, url) for digest in unique])
+            self.conn.commit()
+            # SQLite限制单条语句的参数个数，分批查询
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                rows = self.conn.execute(
+                    f'SELECT block_hash, COUNT(*) FROM blocks WHERE host = ? AND url != ? '
+                    f'AND block_hash IN ({",".join("?" * len(batch))}) GROUP BY block_hash',
+                    (host, url, *batch)
+                )
+                counts.update(rows)
+        return counts
+
+    def get_result(self, text_hash: str, key: str) -> Optional[Any]:
+        """读取该文本已有的下游处理结果"""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT result FROM results WHERE text_hash = ? AND key = ?', (text_hash, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_result(self, text_hash: str, key: str, result: Any) -> None:
+        """保存下游处理结果"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO results (text_hash, key, result, created_at) VALUES (?, ?, ?, ?)',
+                (text_hash, key, json.dumps(result, ensure_ascii=False), now)
+            )
+            self._evict_results(now)
+            self.conn.commit()
+
+    def _evict_results(self, now: float) -> None:
+        """淘汰过期的处理结果，再按保存时间淘汰超出条目数的结果"""
+        if self.ttl:
+            self.conn.execute('DELETE FROM results WHERE created_at < ?', (now - self.ttl,))
+        count = self.conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        if count > self.max_results:
+            self.conn.execute(
+                'DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY created_at LIMIT ?)',
+                (count - self.max_results,)
+            )
+            logger.info(f"Evicted {count - self.max_results} cached results")
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存统计信息"""
+        with self.lock:
+            pages, size = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages').fetchone()
+            results = self.conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        total = self.revalidated + self.fetched
+        return {
+            'pages': pages,
+            'bytes': size,
+            'results': results,
+            'not_modified': self.revalidated,
+            'downloaded': self.fetched,
+            'not_modified_rate': self.revalidated / total if total else 0.0
+        }
+
+
+_default_page_cache = None
+_default_page_cache_lock = threading.Lock()
+
+
+def get_page_cache() -> PageCache:
+    """获取进程内共享的网页缓存，目录与LLM缓存相同"""
+    global _default_page_cache
+    with _default_page_cache_lock:
+        if _default_page_cache is None:
+            cache_dir = os.environ.get('GRAPHRAGER_CACHE_DIR', DEFAULT_CACHE_DIR)
+            _default_page_cache = PageCache(os.path.join(cache_dir, 'page_cache.sqlite3'))
+        return _default_page_cache
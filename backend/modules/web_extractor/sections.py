@@ -0,0 +1,120 @@
+import hashlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from modules.llm_processor.chunker import estimate_tokens
+from modules.web_extractor.page_cache import content_hash
+
+# 段落哈希对该值取模为0时在段落之后分组（平均每4段一个边界）
+BOUNDARY_MODULUS = 4
+
+
+def _is_boundary(paragraph: str) -> bool:
+    digest = hashlib.sha1(paragraph.encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big') % BOUNDARY_MODULUS == 0
+
+
+def section_spans(paragraphs: Sequence[str], min_chars: int = 300, max_chars: int = 1500) -> List[Tuple[int, int]]:
+    """把段落分组，返回各组在拼接文本（段落以空格连接）中的 (起, 止) 位置
+
+    分组边界由段落内容决定（长度达到 min_chars 后，在哈希满足条件的段落之后分组；
+    再加一段会超过 max_chars 时提前分组），而不是按固定长度切分。页面中插入、删除或
+    修改一段只影响所在的组和紧随其后的一组，其余各组的文本和哈希保持不变。
+    """
+    spans: List[Tuple[int, int]] = []
+    start = None
+    position = 0
+    for index, paragraph in enumerate(paragraphs):
+        if index:
+            position += 1
+        paragraph_start = position
+        position += len(paragraph)
+        if start is not None and position - start > max_chars:
+            spans.append((start, paragraph_start - 1))
+            start = None
+        if start is None:
+            start = paragraph_start
+        if position - start >= min_chars and _is_boundary(paragraph):
+            spans.append((start, position))
+            start = None
+    if start is not None:
+        spans.append((start, position))
+    return spans
+
+
+def split_sections(text: str, spans: Sequence[Sequence[int]]) -> List[Dict[str, str]]:
+    """按位置切出各组文本及其哈希"""
+    sections = []
+    for start, end in spans:
+        section = text[start:end]
+        sections.append({'hash': content_hash(section), 'text': section})
+    return sections
+
+
+def pack_sections(texts: Sequence[Optional[str]], max_tokens: int) -> List[List[int]]:
+    """把需要抽取的分组打包成LLM调用，返回每次调用包含的分组序号
+
+    texts 按页面顺序排列，不需要抽取的分组为None。相邻分组合计不超过 max_tokens（分片大小）时
+    放进同一次调用，首次分析页面的调用次数与按分片抽取相当；不相邻的分组不拼在一起。
+    """
+    batches: List[List[int]] = []
+    batch_tokens = 0
+    for index, text in enumerate(texts):
+        if text is None:
+            continue
+        tokens = estimate_tokens(text)
+        if batches and batches[-1][-1] == index - 1 and batch_tokens + tokens <= max_tokens:
+            batches[-1].append(index)
+            batch_tokens += tokens
+        else:
+            batches.append([index])
+            batch_tokens = tokens
+    return batches
+
+
+def _mention_names(entity: Dict[str, Any]) -> List[str]:
+    aliases = entity.get('aliases') or []
+    if isinstance(aliases, str):
+        aliases = [aliases]
+    names = [entity.get('name') or entity.get('label')] + list(aliases)
+    return [str(name).strip().lower() for name in names if name and str(name).strip()]
+
+
+def split_section_result(result: Dict[str, Any], texts: Sequence[str]) -> List[Dict[str, Any]]:
+    """把一次打包抽取的结果拆回各分组，使每个分组的结果可以单独缓存和撤回
+
+    实体归入文本中提到其名称或别名的各个分组（都没有提到时归入第一组）；关系归入两个端点
+    都被提到的第一个分组，没有这样的分组时归入端点首次出现较晚的那一组，并在该组中带上
+    两个端点实体，跨分组的关系因此得以保留。
+    """
+    if len(texts) == 1:
+        return [result]
+    if 'error' in result:
+        return [dict(result) for _ in texts]
+
+    lowered = [text.lower() for text in texts]
+    parts = [{'entities': [], 'relationships': []} for _ in texts]
+    if 'page_type' in result:
+        for part in parts:
+            part['page_type'] = result['page_type']
+
+    entities = {}
+    groups: Dict[Any, List[int]] = {}
+    for entity in result.get('entities', []):
+        names = _mention_names(entity)
+        found = [i for i, text in enumerate(lowered) if any(name in text for name in names)] or [0]
+        entities[entity.get('id')] = entity
+        groups[entity.get('id')] = found
+        for i in found:
+            parts[i]['entities'].append(entity)
+
+    for rel in result.get('relationships', []):
+        ends = [rel.get('source', rel.get('from')), rel.get('target', rel.get('to'))]
+        source_groups, target_groups = (groups.get(end, [0]) for end in ends)
+        shared = [i for i in source_groups if i in target_groups]
+        group = shared[0] if shared else max(source_groups[0], target_groups[0])
+        part = parts[group]
+        for end in ends:
+            if end in entities and group not in groups[end] and entities[end] not in part['entities']:
+                part['entities'].append(entities[end])
+        part['relationships'].append(rel)
+    return parts
@@ -0,0 +1,68 @@
+"""图谱对话检索的基准测试：倒排索引查询 + 邻居扩展 + 资料组装，以及提示词长度上限"""
+import random
+
+import pytest
+
+import config
+from modules.chat.index import GraphIndex
+from modules.chat.service import ChatService, IndexedGraph
+from modules.graph_generator.compact import CompactGraph
+
+SIZES = [1000, 100000]
+SURNAMES = '张王李赵刘陈杨黄周吴徐孙马朱胡郭何高林罗'
+GIVEN = '伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂'
+ORGS = ['科技', '银行', '大学', '医院', '集团', '研究所', '基金会', '出版社']
+CITIES = ['北京', '上海', '广州', '深圳', '杭州', '成都', '武汉', '西安']
+QUESTIONS = ['张伟在哪家公司工作？', '北京科技集团和哪些人有关？', '李娜的合作者有哪些？', 'who founded the bank?']
+
+
+def make_graph(node_count: int, seed: int = 7):
+    """生成带描述的人物/机构图谱，约每个节点3条边"""
+    rng = random.Random(seed)
+    graph = CompactGraph()
+    descriptions = {}
+    for i in range(node_count):
+        if i % 4 == 0:
+            name = f'{rng.choice(CITIES)}{rng.choice(ORGS)}{i}'
+            node_type = 'organization'
+            descriptions[f'n{i}'] = f'位于{rng.choice(CITIES)}的{rng.choice(ORGS)}机构'
+        else:
+            name = f'{rng.choice(SURNAMES)}{rng.choice(GIVEN)}{i}'
+            node_type = 'person'
+            descriptions[f'n{i}'] = f'{rng.choice(CITIES)}的研究人员，曾在{rng.choice(ORGS)}工作'
+        graph.add_node(f'n{i}', name, node_type, node_type)
+    for i in range(node_count * 3):
+        graph.add_edge(f'n{rng.randrange(node_count)}', f'n{rng.randrange(node_count)}',
+                       rng.choice(['works_at', 'collaborates_with', 'located_in']))
+    return graph, descriptions
+
+
+@pytest.fixture(scope='module', params=SIZES, ids=lambda size: f'{size}n')
+def indexed(request):
+    graph, descriptions = make_graph(request.param)
+    return IndexedGraph(graph, descriptions, {}, {})
+
+
+@pytest.fixture(scope='module')
+def service():
+    return ChatService(repository=None, store=None, transport=None)
+
+
+def test_build_index(benchmark):
+    graph, descriptions = make_graph(10000)
+    index = benchmark.pedantic(GraphIndex, args=(graph, descriptions), rounds=3)
+    assert index.names
+
+
+@pytest.mark.parametrize('question', QUESTIONS)
+def test_retrieve(benchmark, service, indexed, question):
+    context = benchmark(service.retrieve, question, indexed)
+    assert len(context.entities) <= config.CHAT_MAX_NODES
+    assert len(context.relationships) <= config.CHAT_MAX_EDGES
+
+
+def test_prompt_is_bounded(service, indexed):
+    """资料部分不超过 CHAT_CONTEXT_CHARS，与图谱规模无关"""
+    for question in QUESTIONS:
+        payload = service.build_request('llama3:latest', question * 50, service.retrieve(question, indexed))
+        assert len(payload['prompt']) <= config.CHAT_CONTEXT_CHARS + config.CHAT_QUESTION_CHARS + 100
@@ -0,0 +1,72 @@
+"""对比网页正文提取引擎的性能
+
+用法：
+    python benchmarks/bench_extraction.py [--corpus 目录] [--repeat 次数]
+
+corpus目录下的每个 .html 文件都会分别用 bs4 和 lxml 引擎提取正文（clean_html）
+和全文（extract_content），输出每次提取的中位耗时、加速比以及两种引擎的结果是否一致。
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from modules.web_extractor.engines import BeautifulSoupEngine, LxmlEngine, etree
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+
+def measure(func, html, repeat):
+    """返回多次执行的中位耗时（毫秒）和最后一次的结果"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(html)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark HTML extraction engines')
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help='保存的HTML页面目录')
+    parser.add_argument('--repeat', type=int, default=20, help='每个页面的重复次数')
+    args = parser.parse_args()
+
+    if etree is None:
+        print('lxml is not installed, nothing to compare against')
+        return
+
+    engines = [BeautifulSoupEngine(), LxmlEngine()]
+    files = sorted(f for f in os.listdir(args.corpus) if f.endswith('.html'))
+    if not files:
+        print(f'No .html files found in {args.corpus}')
+        return
+
+    print(f"{'page':<24}{'mode':<7}{'size':>9}{'bs4 ms':>10}{'lxml ms':>10}{'speedup':>9}  same")
+    totals = {engine.name: 0.0 for engine in engines}
+    for name in files:
+        with open(os.path.join(args.corpus, name), encoding='utf-8', errors='replace') as f:
+            html = f.read()
+
+        for mode in ('main', 'full'):
+            timings = {}
+            outputs = {}
+            for engine in engines:
+                func = engine.main_text if mode == 'main' else engine.full_text
+                timings[engine.name], outputs[engine.name] = measure(func, html, args.repeat)
+                totals[engine.name] += timings[engine.name]
+
+            speedup = timings['bs4'] / timings['lxml'] if timings['lxml'] else float('inf')
+            same = 'yes' if outputs['bs4'] == outputs['lxml'] else f"no ({len(outputs['bs4'])} vs {len(outputs['lxml'])} chars)"
+            print(f"{name[:23]:<24}{mode:<7}{len(html):>9}{timings['bs4']:>10.2f}{timings['lxml']:>10.2f}{speedup:>8.1f}x  {same}")
+
+    print(f"\ntotal: bs4 {totals['bs4']:.2f} ms, lxml {totals['lxml']:.2f} ms, "
+          f"speedup {totals['bs4'] / totals['lxml']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
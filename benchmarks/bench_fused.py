@@ -0,0 +1,109 @@
+"""对比实体抽取的调用方式：两次调用、融合模式、批量模式
+
+用法：
+    python benchmarks/bench_fused.py [--host URL] [--model 模型] [--corpus 目录] [--repeat 次数]
+
+需要一个可访问的Ollama服务。corpus目录下的每个 .html 文件提取正文后分别用
+两次调用（analyze_page_type + extract_entities_relations）和融合模式（analyze_and_extract）
+处理；news_list 页面的每个条目再分别用逐条融合调用和批量模式（extract_batch）处理。
+每种方式使用独立的内存缓存，输出请求数、模型处理的提示词/生成token数和中位耗时。
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import logging
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from llm_client import OllamaClient
+from modules.cache.llm_cache import LLMCache
+from modules.ollama.transport import OllamaTransport
+from modules.web_extractor.engines import BeautifulSoupEngine
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+
+def two_call(client, texts):
+    for text in texts:
+        page_type = client.analyze_page_type(text).get('type', 'unknown')
+        client.extract_entities_relations(text, page_type)
+
+
+def fused(client, texts):
+    for text in texts:
+        client.analyze_and_extract(text)
+
+
+def batch(client, texts):
+    client.extract_batch(texts)
+
+
+def measure(func, transport, model, texts, repeat):
+    """返回 (中位耗时毫秒, 单次运行的usage)，每次运行使用新的空缓存，避免命中上一次的结果"""
+    timings = []
+    usage = None
+    for _ in range(repeat):
+        client = OllamaClient(model=model, cache=LLMCache(':memory:'), transport=transport)
+        start = time.perf_counter()
+        func(client, texts)
+        timings.append((time.perf_counter() - start) * 1000)
+        usage = client.usage.snapshot()
+    return statistics.median(timings), usage
+
+
+def report(name, mode, timing, usage, baseline):
+    tokens = usage['prompt_tokens'] + usage['completion_tokens']
+    speedup = baseline / timing if timing else float('inf')
+    print(f"{name[:23]:<24}{mode:<9}{usage['requests']:>6}{usage['prompt_tokens']:>10}"
+          f"{usage['completion_tokens']:>8}{tokens:>9}{timing:>11.1f}{speedup:>8.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark fused and batched entity extraction')
+    parser.add_argument('--host', default=os.getenv('OLLAMA_HOST', 'http://localhost:11434'), help='Ollama服务地址')
+    parser.add_argument('--model', default='llama3:latest', help='模型名称')
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help='保存的HTML页面目录')
+    parser.add_argument('--repeat', type=int, default=3, help='每种方式的重复次数')
+    parser.add_argument('--items', type=int, default=12, help='news_list页面最多取的条目数')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    transport = OllamaTransport(args.host)
+    if not transport.is_available():
+        print(f'Ollama is not reachable at {args.host}')
+        return
+
+    files = sorted(f for f in os.listdir(args.corpus) if f.endswith('.html'))
+    if not files:
+        print(f'No .html files found in {args.corpus}')
+        return
+
+    engine = BeautifulSoupEngine()
+    print(f"{'page':<24}{'mode':<9}{'reqs':>6}{'prompt':>10}{'eval':>8}{'tokens':>9}{'ms':>11}{'speedup':>9}")
+    for name in files:
+        with open(os.path.join(args.corpus, name), encoding='utf-8', errors='replace') as f:
+            text = engine.main_text(f.read())
+
+        baseline, usage = measure(two_call, transport, args.model, [text], args.repeat)
+        report(name, 'two-call', baseline, usage, baseline)
+        timing, usage = measure(fused, transport, args.model, [text], args.repeat)
+        report(name, 'fused', timing, usage, baseline)
+
+        if 'list' not in name:
+            continue
+        # 列表页按句子拆成短条目，模拟新闻列表中的标题和摘要
+        items = [item.strip() for item in re.split(r'(?<=[。！？])', text) if len(item.strip()) > 10][:args.items]
+        label = f'{name[:14]}[{len(items)}]'
+        baseline, usage = measure(two_call, transport, args.model, items, args.repeat)
+        report(label, 'two-call', baseline, usage, baseline)
+        timing, usage = measure(fused, transport, args.model, items, args.repeat)
+        report(label, 'fused', timing, usage, baseline)
+        timing, usage = measure(batch, transport, args.model, items, args.repeat)
+        report(label, 'batch', timing, usage, baseline)
+
+
+if __name__ == '__main__':
+    main()
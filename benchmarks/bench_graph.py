@@ -0,0 +1,46 @@
+"""图谱格式化与导出的基准测试：format_graph_data 和 export_graph"""
+import random
+
+import pytest
+
+from modules.graph_generator.generator import GraphGenerator
+
+SIZES = [100, 1000, 10000]
+FORMATS = ['json', 'json.gz', 'graphml', 'csv', 'msgpack']
+GROUPS = ['person', 'organization', 'location', 'event', 'concept']
+
+
+def make_graph(node_count: int, edges_per_node: int = 3, seed: int = 42):
+    """生成固定随机种子的 nodes/edges 图谱，约 edges_per_node 倍节点数的边"""
+    rng = random.Random(seed)
+    nodes = [{'id': f'n{i}', 'label': f'实体{i}', 'group': GROUPS[i % len(GROUPS)]} for i in range(node_count)]
+    edges = [
+        {'from': f'n{i}', 'to': f'n{rng.randrange(node_count)}', 'label': 'related_to'}
+        for i in range(node_count) for _ in range(edges_per_node)
+    ]
+    return nodes, edges
+
+
+@pytest.fixture(scope='module')
+def generator():
+    return GraphGenerator()
+
+
+@pytest.fixture(scope='module', params=SIZES, ids=lambda size: f'{size}n')
+def graph(request):
+    return make_graph(request.param)
+
+
+def test_format_graph_data(benchmark, generator, graph):
+    nodes, edges = graph
+    result = benchmark(generator.format_graph_data, nodes, edges)
+    assert len(result['nodes']) == len(nodes)
+
+
+@pytest.mark.parametrize('format', FORMATS)
+def test_export_graph(benchmark, generator, graph, format):
+    graph_data = generator.format_graph_data(*graph)
+    result = benchmark(generator.export_graph, graph_data, format)
+    if result['status'] == 'error':
+        pytest.skip(result['error'])
+    benchmark.extra_info['bytes'] = len(result['data'])
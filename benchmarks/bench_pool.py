@@ -0,0 +1,111 @@
+"""多个Ollama服务的路由基准测试：模型亲和与最少进行中请求的对比、故障服务的熔断和路由本身的开销
+
+每个模拟服务同时只能加载一个模型，切换模型耗时 LOAD_MS，与真实的显存受限场景一致。
+"""
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from fake_ollama import FakeOllama
+from modules.ollama.pool import Backend, BackendRouter, OllamaPool
+
+MODELS = ['llama3:latest', 'qwen2:7b', 'mistral:latest']
+LOAD_MS = 50
+REQUESTS = 120
+CONCURRENCY = 6
+
+
+@pytest.fixture(scope='module')
+def fleet():
+    servers = [FakeOllama(base_ms=5, load_ms=LOAD_MS, models=MODELS).start() for _ in range(3)]
+    yield servers
+    for server in servers:
+        server.stop()
+
+
+def dead_host() -> str:
+    """一个没有服务监听的本地端口"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f'http://127.0.0.1:{port}'
+
+
+def run_workload(pool: OllamaPool) -> None:
+    def call(i):
+        response = pool.post('/api/generate', json={
+            'model': MODELS[i % len(MODELS)], 'prompt': f'问题{i}', 'stream': False})
+        response.raise_for_status()
+
+    with ThreadPoolExecutor(CONCURRENCY) as executor:
+        list(executor.map(call, range(REQUESTS)))
+
+
+def model_loads(fleet, pool_factory) -> int:
+    for server in fleet:
+        server.loaded.clear()
+    before = sum(server.loads for server in fleet)
+    pool = pool_factory()
+    try:
+        run_workload(pool)
+    finally:
+        pool.close()
+    return sum(server.loads for server in fleet) - before
+
+
+def pool_factory(fleet, slack: int):
+    def factory():
+        router = BackendRouter([Backend(server.url) for server in fleet], affinity_slack=slack)
+        return OllamaPool([], router=router, monitor=False)
+    return factory
+
+
+@pytest.mark.parametrize('routing', ['affinity', 'least_outstanding'])
+def test_mixed_models(benchmark, fleet, routing):
+    # 亲和容差为-1时只有模型已加载且更空闲的服务才会被优先选择，相当于纯粹的最少请求路由
+    slack = 2 if routing == 'affinity' else -1
+    loads = benchmark.pedantic(model_loads, args=(fleet, pool_factory(fleet, slack)), rounds=1)
+    if routing == 'affinity':
+        # 并发下的加载次数随线程调度波动，与同一组服务上的最少请求路由对比，而不是固定上限
+        baseline = model_loads(fleet, pool_factory(fleet, -1))
+        assert loads * 2 <= baseline
+
+
+def test_failover(fleet):
+    hosts = [(dead_host(), None)] + [(server.url, None) for server in fleet]
+    pool = OllamaPool(hosts, monitor=False)
+    try:
+        run_workload(pool)
+        dead = pool.stats()[0]
+        assert dead['state'] == 'open' and dead['errors'] >= 1
+        pool.check(force=True)
+        assert [b['state'] for b in pool.stats()] == ['open', 'closed', 'closed', 'closed']
+        assert len(pool.list_models()) == len(MODELS)
+    finally:
+        pool.close()
+
+
+def test_declared_models(fleet):
+    hosts = [(fleet[0].url, ['qwen2:7b']), (fleet[1].url, ['llama3'])]
+    pool = OllamaPool(hosts, monitor=False)
+    try:
+        for _ in range(4):
+            pool.post('/api/generate', json={'model': 'llama3:latest', 'prompt': '你好', 'stream': False})
+        stats = pool.stats()
+        assert stats[0]['requests'] == 0 and stats[1]['requests'] == 4
+        with pytest.raises(requests.exceptions.ConnectionError):
+            pool.post('/api/generate', json={'model': 'mistral:latest', 'prompt': '你好', 'stream': False})
+    finally:
+        pool.close()
+
+
+def test_route_overhead(benchmark):
+    router = BackendRouter([Backend(f'http://10.0.0.{i}:11434') for i in range(8)])
+
+    def route():
+        for i in range(1000):
+            router.release(router.acquire(MODELS[i % len(MODELS)]))
+
+    benchmark(route)
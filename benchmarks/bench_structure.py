@@ -0,0 +1,72 @@
+"""/api/structure 端到端吞吐量：N 个并发客户端通过HTTP请求本地服务，Ollama由模拟服务代替
+
+每个请求的内容都不同，不会命中LLM缓存和已保存的图谱。
+"""
+import time
+import itertools
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+from werkzeug.serving import make_server
+
+from modules.web_extractor.extractor import WebExtractor
+
+CLIENTS = [1, 4, 16]
+REQUESTS_PER_CLIENT = 4
+PROMPT = '请从以下文本中提取实体和关系：\n{text}'
+
+_sequence = itertools.count()
+
+
+@pytest.fixture(scope='module')
+def server_url(backend_app):
+    server = make_server('127.0.0.1', 0, backend_app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+@pytest.fixture(scope='module')
+def article(corpus):
+    return WebExtractor(use_cache=False).clean_html(corpus['news_article.html'])
+
+
+def post_structure(session, url, content):
+    response = session.post(f'{url}/api/structure', json={
+        'model': 'llama3:latest',
+        'prompt': PROMPT,
+        'content': f'{content}\n#{next(_sequence)}'
+    }, timeout=60)
+    response.raise_for_status()
+    return response.json()
+
+
+def run_clients(url, content, clients):
+    """每个客户端使用独立的连接顺序发送请求，返回成功解析出图谱的请求数"""
+    def client():
+        with requests.Session() as session:
+            return sum(bool(post_structure(session, url, content)['graph']['entities'])
+                       for _ in range(REQUESTS_PER_CLIENT))
+
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        return sum(executor.map(lambda _: client(), range(clients)))
+
+
+@pytest.mark.parametrize('clients', CLIENTS)
+def test_structure_throughput(benchmark, server_url, article, clients):
+    total = clients * REQUESTS_PER_CLIENT
+    timings = []
+
+    def timed():
+        start = time.perf_counter()
+        succeeded = run_clients(server_url, article, clients)
+        timings.append(time.perf_counter() - start)
+        return succeeded
+
+    assert benchmark.pedantic(timed, rounds=3, warmup_rounds=1) == total
+    benchmark.extra_info['requests'] = total
+    benchmark.extra_info['requests_per_second'] = round(total / statistics.median(timings[1:]), 1)
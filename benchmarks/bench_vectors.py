@@ -0,0 +1,57 @@
+"""向量索引的基准测试：精确、IVF 和 int8 量化查询的耗时与召回率，以及向量缓存的读取"""
+import numpy as np
+import pytest
+
+from modules.embeddings.client import VectorCache, text_key
+from modules.embeddings.index import VectorIndex, near_duplicates
+
+DIM = 128
+QUERIES = 64
+
+
+def make_vectors(count: int, seed: int = 0) -> np.ndarray:
+    """围绕500个中心分布的向量，比均匀随机向量更接近真实的实体向量"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((500, DIM)).astype(np.float32)
+    return centers[rng.integers(0, 500, count)] + 0.5 * rng.standard_normal((count, DIM)).astype(np.float32)
+
+
+@pytest.fixture(scope='module', params=[10000, 100000], ids=lambda n: f'{n}v')
+def vectors(request):
+    return make_vectors(request.param)
+
+
+@pytest.fixture(scope='module')
+def queries(vectors):
+    rng = np.random.default_rng(1)
+    return vectors[:QUERIES] + 0.1 * rng.standard_normal((QUERIES, DIM)).astype(np.float32)
+
+
+def recall(expected, actual) -> float:
+    return float(np.mean([len({i for i, _ in a} & {i for i, _ in e}) / max(1, len(e))
+                          for e, a in zip(expected, actual)]))
+
+
+@pytest.mark.parametrize('mode,quantized', [('flat', False), ('flat', True), ('ivf', False), ('ivf', True)])
+def test_search(benchmark, vectors, queries, mode, quantized):
+    ids = [str(i) for i in range(len(vectors))]
+    exact = VectorIndex(vectors, ids, mode='flat').search(queries, 10)
+    index = VectorIndex(vectors, ids, mode=mode, quantized=quantized)
+    results = benchmark(index.search, queries, 10)
+    assert recall(exact, results) >= 0.9
+
+
+def test_near_duplicates(benchmark):
+    vectors = make_vectors(20000)
+    vectors[1] = vectors[0] * 1.001
+    pairs = benchmark.pedantic(near_duplicates, args=(vectors, 0.999), kwargs={'mode': 'ivf'}, rounds=1)
+    assert (0, 1) in {(i, j) for i, j, _ in pairs}
+
+
+def test_vector_cache_reopen(benchmark, tmp_path):
+    """重新打开缓存文件只需映射文件并读取键，不读取向量"""
+    path = str(tmp_path / 'model.vec')
+    keys = [text_key(f'entity {i}') for i in range(50000)]
+    VectorCache(path).add(keys, make_vectors(len(keys)))
+    cache = benchmark(VectorCache, path)
+    assert len(cache.lookup(keys[:100])) == 100
@@ -0,0 +1,45 @@
+"""网页正文提取的基准测试：clean_html（正文段落）、extract_text（全部可见文本）和按token预算裁剪"""
+import pytest
+
+from modules.llm_processor.chunker import estimate_tokens
+from modules.web_extractor.engines import etree
+from modules.web_extractor.extractor import WebExtractor
+from modules.web_extractor.page_cache import PageCache
+
+ENGINES = ['bs4'] + (['lxml'] if etree is not None else [])
+PAGES = ['blog_post.html', 'news_article.html', 'news_list.html']
+
+
+@pytest.fixture(scope='module', params=ENGINES)
+def extractor(request):
+    return WebExtractor(use_cache=False, engine=request.param)
+
+
+@pytest.mark.parametrize('page', PAGES)
+def test_clean_html(benchmark, extractor, corpus, page):
+    html = corpus[page]
+    benchmark.extra_info['bytes'] = len(html)
+    text = benchmark(extractor.clean_html, html)
+    assert text
+
+
+@pytest.mark.parametrize('page', PAGES)
+def test_extract_content(benchmark, extractor, corpus, page):
+    html = corpus[page]
+    benchmark.extra_info['bytes'] = len(html)
+    text = benchmark(extractor.extract_text, html)
+    assert len(text) >= len(extractor.clean_html(html)) // 2
+
+
+@pytest.mark.parametrize('page', PAGES)
+def test_budget_content(benchmark, extractor, corpus, page):
+    """裁剪到1000个token：同一主机的其他页面先各访问一次，模板内容按跨页面重复识别"""
+    cached = WebExtractor(page_cache=PageCache(':memory:'), engine=extractor.engine.name)
+    for i, other in enumerate(PAGES * 2):
+        cached.budget_content({'url': f'http://example.com/{i}/{other}', 'html': corpus[other]}, 1000)
+
+    result = benchmark(cached.budget_content, {'url': f'http://example.com/{page}', 'html': corpus[page]}, 1000)
+    stats = result['budget']
+    benchmark.extra_info.update(stats)
+    assert stats['tokens'] <= stats['limit'] < stats['original_tokens']
+    assert estimate_tokens(result['content']) <= stats['limit']
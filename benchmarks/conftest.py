@@ -0,0 +1,171 @@
+"""基准测试的公共fixture
+
+用法（在仓库根目录执行，不依赖外网和真实的Ollama）：
+    python -m pytest benchmarks
+
+根目录的 pytest 只收集 test_*.py，不会运行这里的 bench_*.py。
+安装了 pytest-benchmark 时使用它的 benchmark fixture（可用 --benchmark-autosave、
+--benchmark-compare-fail=median:20% 等参数比较历史结果）；未安装时使用下面的简化实现，
+通过环境变量保存和比较结果：
+
+    BENCH_SAVE=baseline.json python -m pytest benchmarks      # 保存各项的耗时统计
+    BENCH_BASELINE=baseline.json python -m pytest benchmarks  # 最短耗时比基线慢超过 BENCH_TOLERANCE 时失败
+
+比较最短耗时而不是中位耗时，受机器上其他负载的影响较小。
+
+模拟Ollama的耗时可通过 BENCH_OLLAMA_BASE_MS、BENCH_OLLAMA_PROMPT_MS、BENCH_OLLAMA_TOKEN_MS 调整。
+"""
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import statistics
+from typing import Any, Callable, Dict
+
+import pytest
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'backend'))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_ollama import FakeOllama
+
+CORPUS_DIR = os.path.join(BENCH_DIR, 'corpus')
+
+try:
+    import pytest_benchmark  # noqa: F401
+    HAS_BENCHMARK_PLUGIN = True
+except ImportError:
+    HAS_BENCHMARK_PLUGIN = False
+
+# 简化实现收集的结果：测试名 -> 统计
+_results: Dict[str, Dict[str, Any]] = {}
+
+
+class SimpleBenchmark:
+    """与 pytest-benchmark 的 benchmark fixture 接口兼容的最小实现"""
+
+    def __init__(self, name: str, min_rounds: int = 5, min_time: float = 0.2, max_time: float = 2.0):
+        self.name = name
+        self.min_rounds = min_rounds
+        self.min_time = min_time
+        self.max_time = max_time
+        self.extra_info: Dict[str, Any] = {}
+        self.stats: Dict[str, Any] = {}
+
+    def __call__(self, func: Callable, *args, **kwargs):
+        func(*args, **kwargs)  # 预热
+        timings = []
+        started = time.perf_counter()
+        while True:
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            timings.append(time.perf_counter() - start)
+            elapsed = time.perf_counter() - started
+            if (len(timings) >= self.min_rounds and elapsed >= self.min_time) or elapsed >= self.max_time:
+                break
+        self._record(timings)
+        return result
+
+    def pedantic(self, target: Callable, args=(), kwargs=None, setup=None, rounds: int = 1,
+                 warmup_rounds: int = 0, iterations: int = 1):
+        kwargs = kwargs or {}
+        for _ in range(warmup_rounds):
+            target(*args, **kwargs)
+        timings = []
+        result = None
+        for _ in range(rounds):
+            if setup:
+                args, kwargs = setup() or (args, kwargs)
+            start = time.perf_counter()
+            for _ in range(iterations):
+                result = target(*args, **kwargs)
+            timings.append((time.perf_counter() - start) / iterations)
+        self._record(timings)
+        return result
+
+    def _record(self, timings):
+        self.stats = {
+            'min': min(timings),
+            'median': statistics.median(timings),
+            'mean': statistics.mean(timings),
+            'stddev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+            'rounds': len(timings)
+        }
+        _results[self.name] = {**self.stats, 'extra_info': self.extra_info}
+        self._check_baseline()
+
+    def _check_baseline(self):
+        """与基线比较最短耗时，超过容差时使当前测试失败"""
+        path = os.environ.get('BENCH_BASELINE')
+        if not path or not os.path.exists(path):
+            return
+        with open(path, encoding='utf-8') as f:
+            baseline = json.load(f).get(self.name)
+        if not baseline:
+            return
+        tolerance = float(os.environ.get('BENCH_TOLERANCE', 0.3))
+        if self.stats['min'] > baseline['min'] * (1 + tolerance):
+            pytest.fail(f"{self.name}: min {self.stats['min'] * 1000:.2f} ms exceeds baseline "
+                        f"{baseline['min'] * 1000:.2f} ms by more than {tolerance:.0%}")
+
+
+if not HAS_BENCHMARK_PLUGIN:
+    @pytest.fixture
+    def benchmark(request):
+        return SimpleBenchmark(request.node.nodeid.split('::', 1)[-1])
+
+    def pytest_terminal_summary(terminalreporter):
+        if not _results:
+            return
+        terminalreporter.section('benchmark')
+        terminalreporter.write_line(f"{'name':<56}{'min ms':>10}{'median ms':>11}{'mean ms':>10}{'rounds':>8}")
+        for name, stats in _results.items():
+            terminalreporter.write_line(f"{name[:55]:<56}{stats['min'] * 1000:>10.3f}{stats['median'] * 1000:>11.3f}"
+                                        f"{stats['mean'] * 1000:>10.3f}{stats['rounds']:>8}")
+            for key, value in stats['extra_info'].items():
+                terminalreporter.write_line(f"    {key}: {value}")
+        path = os.environ.get('BENCH_SAVE')
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(_results, f, indent=2, ensure_ascii=False)
+            terminalreporter.write_line(f'saved to {path}')
+
+
+@pytest.fixture(scope='session')
+def corpus() -> Dict[str, str]:
+    """保存的HTML页面：文件名 -> HTML"""
+    pages = {}
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        if name.endswith('.html'):
+            with open(os.path.join(CORPUS_DIR, name), encoding='utf-8', errors='replace') as f:
+                pages[name] = f.read()
+    return pages
+
+
+@pytest.fixture(scope='session')
+def fake_ollama():
+    """后台运行的模拟Ollama服务"""
+    with FakeOllama(
+        base_ms=float(os.environ.get('BENCH_OLLAMA_BASE_MS', 20)),
+        prompt_ms=float(os.environ.get('BENCH_OLLAMA_PROMPT_MS', 0.02)),
+        token_ms=float(os.environ.get('BENCH_OLLAMA_TOKEN_MS', 0.2))
+    ) as server:
+        yield server
+
+
+@pytest.fixture(scope='session')
+def backend_app(fake_ollama):
+    """指向模拟Ollama、使用临时缓存目录的Flask应用"""
+    import config
+
+    cache_dir = tempfile.mkdtemp(prefix='graphrager-bench-')
+    os.environ['GRAPHRAGER_CACHE_DIR'] = cache_dir
+    config.OLLAMA_HOST = fake_ollama.url
+    logging.disable(logging.INFO)
+    import app
+    assert app.ollama_transport.host == fake_ollama.url, 'Ollama transport was created before the benchmark fixture'
+    yield app.app
+    logging.disable(logging.NOTSET)
@@ -0,0 +1,256 @@
+"""本地模拟的Ollama服务，用于离线基准测试
+
+用法：
+    python benchmarks/fake_ollama.py [--port 端口] [--prompt-ms 毫秒] [--token-ms 毫秒] [--base-ms 毫秒] [--load-ms 毫秒]
+
+支持 /api/tags、/api/ps、/api/version、/api/generate（流式和非流式）和 /api/embed。
+/api/generate 按提示词中的关键字返回预设的输出（见 CANNED_OUTPUTS），模拟耗时为
+base_ms + 提示词token数 * prompt_ms + 输出token数 * token_ms，
+并在响应中带上与真实服务相同的 prompt_eval_count / eval_count 等统计字段。
+请求的模型未加载时额外耗时 load_ms，并替换最早加载的模型（最多同时加载 max_loaded 个），
+/api/ps 返回当前已加载的模型。
+/api/embed 返回由字符和相邻字符哈希得到的确定性向量，字面相近的文本向量也相近。
+"""
+import json
+import time
+import zlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+GRAPH = {
+    'entities': [
+        {'id': 'e1', 'type': 'person', 'name': '张三', 'description': '示例公司创始人'},
+        {'id': 'e2', 'type': 'organization', 'name': '示例公司', 'description': '一家科技公司'},
+        {'id': 'e3', 'type': 'location', 'name': '北京', 'description': '公司总部所在地'}
+    ],
+    'relationships': [
+        {'source': 'e1', 'target': 'e2', 'type': 'founded', 'description': '张三创立了示例公司'},
+        {'source': 'e2', 'target': 'e3', 'type': 'located_in', 'description': '总部位于北京'}
+    ]
+}
+
+# (提示词中的关键字, 输出)，按顺序匹配第一个；都不匹配时返回图谱JSON
+CANNED_OUTPUTS: List[Tuple[str, str]] = [
+    ('"page_type"', json.dumps({'page_type': 'news', **GRAPH}, ensure_ascii=False)),
+    ('请仅返回以上类型之一', 'news')
+]
+DEFAULT_OUTPUT = json.dumps(GRAPH, ensure_ascii=False)
+
+
+EMBEDDING_DIM = 64
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    """字符和相邻字符对哈希到固定维度的计数向量"""
+    text = text.lower()
+    vector = [0.0] * dim
+    for gram in list(text) + [text[i:i + 2] for i in range(len(text) - 1)]:
+        vector[zlib.crc32(gram.encode('utf-8')) % dim] += 1.0
+    return vector
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文约每字一个token，其他约每4个字符一个"""
+    cjk = sum(1 for ch in text if '一' <= ch <= '鿿')
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+class _Server(ThreadingHTTPServer):
+    # 默认的监听队列只有5，大量并发连接时会被拒绝
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class FakeOllama:
+    """在后台线程中运行的模拟Ollama服务
+
+    可作为上下文管理器使用，退出时关闭服务。请求计数保存在 requests 中。
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, base_ms: float = 0.0,
+                 prompt_ms: float = 0.0, token_ms: float = 0.0, stream_chunk: int = 8,
+                 outputs: Optional[List[Tuple[str, str]]] = None, default_output: str = DEFAULT_OUTPUT,
+                 models: Optional[List[str]] = None, load_ms: float = 0.0, max_loaded: int = 1):
+        self.base_ms = base_ms
+        self.prompt_ms = prompt_ms
+        self.token_ms = token_ms
+        self.stream_chunk = stream_chunk
+        self.outputs = list(CANNED_OUTPUTS if outputs is None else outputs)
+        self.default_output = default_output
+        self.models = models or ['llama3:latest']
+        self.load_ms = load_ms
+        self.max_loaded = max_loaded
+        self.loaded: List[str] = []
+        self.loads = 0
+        self.lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.server = _Server((host, port), self._handler())
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'FakeOllama':
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> 'FakeOllama':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def answer(self, prompt: str) -> str:
+        for keyword, output in self.outputs:
+            if keyword in prompt:
+                return output
+        return self.default_output
+
+    def count(self, path: str) -> None:
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def load(self, model: Optional[str]) -> float:
+        """加载模型，返回加载耗时（秒）；已加载时为0"""
+        if not model:
+            return 0.0
+        with self.lock:
+            if model in self.loaded:
+                return 0.0
+            self.loaded.append(model)
+            del self.loaded[:-self.max_loaded]
+            self.loads += 1
+        time.sleep(self.load_ms / 1000)
+        return self.load_ms / 1000
+
+    def generate(self, body: Dict) -> Tuple[str, Dict]:
+        """返回 (输出, 统计字段)，按配置的耗时休眠"""
+        load_seconds = self.load(body.get('model'))
+        prompt = (body.get('system') or '') + (body.get('prompt') or '')
+        output = self.answer(prompt)
+        prompt_tokens = estimate_tokens(prompt)
+        eval_tokens = estimate_tokens(output)
+        prompt_seconds = prompt_tokens * self.prompt_ms / 1000
+        eval_seconds = eval_tokens * self.token_ms / 1000
+        time.sleep(self.base_ms / 1000 + prompt_seconds + eval_seconds)
+        stats = {
+            'model': body.get('model'),
+            'done': True,
+            'done_reason': 'stop',
+            'prompt_eval_count': prompt_tokens,
+            'eval_count': eval_tokens,
+            'prompt_eval_duration': int(prompt_seconds * 1e9),
+            'eval_duration': int(eval_seconds * 1e9),
+            'load_duration': int(load_seconds * 1e9),
+            'total_duration': int((load_seconds + self.base_ms / 1000 + prompt_seconds + eval_seconds) * 1e9)
+        }
+        return output, stats
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, obj, status=200):
+                body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def write_chunk(self, obj):
+                data = (json.dumps(obj, ensure_ascii=False) + '\n').encode('utf-8')
+                self.wfile.write(b'%x\r\n' % len(data) + data + b'\r\n')
+
+            def do_GET(self):
+                fake.count(self.path)
+                if self.path == '/api/tags':
+                    self.send_json({'models': [{'name': name, 'model': name} for name in fake.models]})
+                elif self.path == '/api/ps':
+                    with fake.lock:
+                        loaded = list(fake.loaded)
+                    self.send_json({'models': [{'name': name, 'model': name} for name in loaded]})
+                elif self.path == '/api/version':
+                    self.send_json({'version': '0.5.0'})
+                else:
+                    self.send_json({'error': 'not found'}, 404)
+
+            def do_POST(self):
+                fake.count(self.path)
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    self.send_json({'error': 'invalid JSON'}, 400)
+                    return
+                if self.path == '/api/embed':
+                    texts = body.get('input') or []
+                    texts = [texts] if isinstance(texts, str) else texts
+                    fake.load(body.get('model'))
+                    time.sleep(fake.base_ms / 1000)
+                    self.send_json({'model': body.get('model'), 'embeddings': [fake_embedding(t) for t in texts]})
+                    return
+                if self.path != '/api/generate':
+                    self.send_json({'error': 'not found'}, 404)
+                    return
+                if not body.get('prompt') and not body.get('system'):
+                    # 空提示词只加载模型
+                    fake.load(body.get('model'))
+                    self.send_json({'model': body.get('model'), 'response': '', 'done': True})
+                    return
+
+                output, stats = fake.generate(body)
+                if not body.get('stream', True):
+                    self.send_json({'response': output, **stats})
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for i in range(0, len(output), fake.stream_chunk):
+                    self.write_chunk({'model': body.get('model'), 'response': output[i:i + fake.stream_chunk], 'done': False})
+                self.write_chunk({'response': '', **stats})
+                self.wfile.write(b'0\r\n\r\n')
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local stand-in for the Ollama API')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=11434, help='监听端口')
+    parser.add_argument('--base-ms', type=float, default=0.0, help='每个请求的固定耗时')
+    parser.add_argument('--prompt-ms', type=float, default=0.0, help='每个提示词token的评估耗时')
+    parser.add_argument('--token-ms', type=float, default=0.0, help='每个输出token的生成耗时')
+    parser.add_argument('--load-ms', type=float, default=0.0, help='切换模型的加载耗时')
+    parser.add_argument('--models', default='llama3:latest', help='提供的模型，逗号分隔')
+    args = parser.parse_args()
+
+    fake = FakeOllama(args.host, args.port, base_ms=args.base_ms, prompt_ms=args.prompt_ms, token_ms=args.token_ms,
+                      load_ms=args.load_ms, models=args.models.split(','))
+    print(f'Fake Ollama listening on {fake.url}')
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -64,6 +64,12 @@ function setButtonState(buttonId, enabled) {
     }
 }
 
+// 服务端已计算布局（所有节点都带坐标）时无需前端物理模拟
+function hasServerLayout(data) {
+    return Boolean(data.layout) && data.nodes.length > 0 &&
+        data.nodes.every(node => typeof node.x === 'number' && typeof node.y === 'number');
+}
+
 // 初始化图谱
 function initializeGraph(container, data) {
     try {
@@ -114,6 +120,11 @@ function initializeGraph(container, data) {
             }
         };
 
+        if (hasServerLayout(data)) {
+            options.physics = false;
+            options.edges.smooth = false;
+        }
+
         currentNetwork = new vis.Network(container, graphData, options);
     } catch (error) {
         console.error('Failed to initialize graph:', error);
@@ -139,7 +150,8 @@ document.getElementById('extract-btn').addEventListener('click', async () => {
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({ url: url }),
+            // 按所选模型的token预算裁剪内容
+            body: JSON.stringify({ url: url, model: document.getElementById('model-selector').value }),
         });
         
         const data = await response.json();
@@ -170,6 +182,93 @@ document.getElementById('extract-btn').addEventListener('click', async () => {
     }
 });
 
+// 增量加入节点和边，边的端点未出现前先暂存
+function createIncrementalGraph(container) {
+    initializeGraph(container, { nodes: [], edges: [] });
+    const nodes = currentNetwork.body.data.nodes;
+    const edges = currentNetwork.body.data.edges;
+    let pending = [];
+
+    const addEdge = (rel) => {
+        const from = rel.source !== undefined ? rel.source : rel.from;
+        const to = rel.target !== undefined ? rel.target : rel.to;
+        if (!nodes.get(from) || !nodes.get(to)) {
+            pending.push(rel);
+            return;
+        }
+        edges.add({ id: `e${edges.length}`, from: from, to: to, label: rel.type || rel.label || '' });
+    };
+
+    const addNode = (entity) => {
+        if (!entity || entity.id === undefined || nodes.get(entity.id)) return;
+        nodes.add({
+            id: entity.id,
+            label: entity.label || entity.name || String(entity.id),
+            group: entity.group || entity.type || 'default',
+            title: entity.description || ''
+        });
+        const waiting = pending;
+        pending = [];
+        waiting.forEach(addEdge);
+    };
+
+    return { addNode, addEdge };
+}
+
+// 调用流式接口：token实时显示，实体和关系闭合后立即渲染
+async function streamStructure(payload) {
+    const response = await fetch('/api/structure/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(payload),
+    });
+
+    if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
+    }
+
+    const output = document.getElementById('structured-content');
+    output.value = '';
+    const graph = createIncrementalGraph(document.getElementById('graph-container'));
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let result = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        for (const line of lines) {
+            if (!line.trim()) continue;
+            const event = JSON.parse(line);
+            if (event.type === 'token') {
+                output.value += event.content;
+            } else if (event.type === 'entity') {
+                graph.addNode(event.data);
+            } else if (event.type === 'relationship') {
+                graph.addEdge(event.data);
+            } else if (event.type === 'error') {
+                throw new Error(event.error);
+            } else if (event.type === 'done') {
+                result = event;
+            }
+        }
+    }
+
+    if (!result) {
+        throw new Error('流式响应意外中断');
+    }
+    return result;
+}
+
 // 生成结构化内容
 document.getElementById('structure-btn').addEventListener('click', async () => {
     const content = document.getElementById('content-input').value.trim();
@@ -190,26 +289,14 @@ document.getElementById('structure-btn').addEventListener('click', async () => {
     setButtonState('structure-btn', false);
     
     try {
-        const response = await fetch('/api/structure', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                content: content,
-                prompt: prompt,
-                model: model
-            }),
+        const data = await streamStructure({
+            content: content,
+            prompt: prompt,
+            model: model,
+            url: document.getElementById('url-input').value.trim()
         });
-        
-        const data = await response.json();
         showStatus('结构化内容生成成功', 'success');
         
-        if (data.error) {
-            showStatus('结构化内容生成失败: ' + data.error, 'error');
-            return;
-        }
-        
         // 显示生成的结构化内容和原始输出
         document.getElementById('structured-content').value = data.raw_output;
         
@@ -218,8 +305,11 @@ document.getElementById('structure-btn').addEventListener('click', async () => {
             const jsonData = JSON.parse(data.raw_output);
             document.getElementById('graph-input').value = JSON.stringify(jsonData, null, 2);
         } catch (error) {
+            // 输出不是合法JSON时（代码块标记、说明文字、被截断），使用服务端容错解析出的图谱
             console.warn('Raw output is not valid JSON:', error);
-            document.getElementById('graph-input').value = data.raw_output;
+            const graph = data.graph || {};
+            const recovered = Object.values(graph).some(value => Array.isArray(value) && value.length);
+            document.getElementById('graph-input').value = recovered ? JSON.stringify(graph, null, 2) : data.raw_output;
         }
         
     } catch (error) {
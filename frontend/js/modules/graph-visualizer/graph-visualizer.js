@@ -75,11 +75,16 @@ export class GraphVisualizer {
         const nodes = new vis.DataSet(graphData.nodes);
         const edges = new vis.DataSet(graphData.edges);
 
+        // 服务端已计算布局时关闭物理引擎，直接使用节点坐标
+        const positioned = Boolean(graphData.layout) && graphData.nodes.length > 0 &&
+            graphData.nodes.every(node => typeof node.x === 'number' && typeof node.y === 'number');
+        const options = positioned ? { ...this.options, physics: false } : this.options;
+
         // 创建网络图
         this.network = new vis.Network(this.container, {
             nodes: nodes,
             edges: edges
-        }, this.options);
+        }, options);
 
         // 添加事件监听
         this.addEventListeners();
@@ -148,8 +153,8 @@ export class GraphVisualizer {
         }
     }
 
-    // 导出图谱
-    async exportGraph() {
+    // 导出图谱，format 可选 json、json.gz、json.zst、msgpack、npz、graphml、csv
+    async exportGraph(format = 'json') {
         try {
             const response = await fetch('http://localhost:5000/api/export', {
                 method: 'POST',
@@ -158,7 +163,7 @@ export class GraphVisualizer {
                 },
                 body: JSON.stringify({
                     data: this.data,
-                    format: 'json'
+                    format: format
                 })
             });
 
@@ -166,14 +171,16 @@ export class GraphVisualizer {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
-            const result = await response.json();
-            
+            // 服务端以附件形式流式返回文件
+            const disposition = response.headers.get('Content-Disposition') || '';
+            const match = disposition.match(/filename="([^"]+)"/);
+            const blob = await response.blob();
+
             // 创建下载链接
-            const blob = new Blob([result.data], { type: 'application/json' });
             const url = window.URL.createObjectURL(blob);
             const a = document.createElement('a');
             a.href = url;
-            a.download = 'knowledge-graph.json';
+            a.download = match ? match[1] : 'knowledge-graph.json';
             document.body.appendChild(a);
             a.click();
             document.body.removeChild(a);